@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Verificação e benchmark do AsyncManaiClient contra o servidor local de bench/mock_azure.py.
+
+Percorre a interface do cliente (login, perfil, tier, estatísticas, funcionalidades) e envia
+N perguntas em simultâneo a partir de um único event loop, reportando o tempo total e o número
+de ligações TCP abertas. Requer aiohttp.
+
+Utilização:
+    python3 bench/bench_async.py --questions 300 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "install"))
+from mock_azure import MockAzureServer  # noqa: E402
+
+
+async def run(base_url: str, questions: int, connections: int) -> float:
+    from manai import AsyncManaiClient
+
+    async with AsyncManaiClient(base_url, max_connections=connections) as client:
+        login = await client.login("bench@manai.local", "password")
+        assert login.get("success"), login
+        checks = await client.run_concurrently({
+            "authenticated": client.is_authenticated,
+            "profile": client.get_profile,
+            "tier_config": client.get_tier_config,
+            "usage_stats": client.get_usage_stats,
+            "feature": lambda: client.check_feature_access("analytics"),
+            "limits": client.check_usage_limits,
+            "connection": client.test_connection,
+        })
+        for name, result in checks.items():
+            ok = result if isinstance(result, bool) else result.get("success", True)
+            print(f"  {name:<14} {'ok' if ok else result}")
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            client.ask_question(f"pergunta {i}", use_session=False, use_cache=False) for i in range(questions)
+        ))
+        elapsed = time.perf_counter() - start
+        failed = [r for r in results if not r.get("success")]
+        print(f"  {questions} perguntas, {len(failed)} com erro")
+        return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do AsyncManaiClient")
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.5, help="Atraso simulado por pedido (s)")
+    parser.add_argument("--connections", type=int, default=100, help="Tamanho do pool assíncrono")
+    args = parser.parse_args()
+
+    os.environ["HOME"] = tempfile.mkdtemp(prefix="manai-async-")
+    with MockAzureServer(latency=args.latency, daily_limit=0) as server:
+        elapsed = asyncio.run(run(server.base_url, args.questions, args.connections))
+        stats = server.state.snapshot()
+    print(f"tempo: {elapsed:.2f} s (latência por pedido {args.latency:.2f} s), "
+          f"pedidos: {stats['requests']}, ligações: {stats['connections']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark do histórico local (HistoryStore): custo de cada gravação e tempo de pesquisa
+com um histórico de muitos anos de perguntas.
+
+Utilização:
+    python3 bench/bench_history.py --entries 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "install"))
+from manai import HistoryStore  # noqa: E402
+
+COMMANDS = ["rsync", "tar", "find", "grep", "awk", "sed", "ssh", "scp", "curl", "systemctl",
+            "journalctl", "chmod", "chown", "docker", "git", "iptables", "lsof", "ps", "kill", "du"]
+WORDS = ["como", "listar", "ficheiros", "copiar", "remoto", "pastas", "permissões", "processos",
+         "porta", "comprimir", "procurar", "texto", "apagar", "antigos", "serviço", "logs", "disco"]
+
+
+def make_entry(rng: random.Random):
+    command = rng.choice(COMMANDS)
+    question = " ".join(rng.sample(WORDS, 5)) + f" com {command}?"
+    answer = f"Use `{command}` " + " ".join(rng.choice(WORDS) for _ in range(120))
+    return question, answer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do histórico local do ManAI")
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    store = HistoryStore(os.path.join(tempfile.mkdtemp(prefix="manai-history-"), "history.db"))
+
+    start = time.perf_counter()
+    for _ in range(args.entries):
+        question, answer = make_entry(rng)
+        store.add(question, "pt", answer, asked_at=time.time() - rng.random() * 3 * 365 * 86400)
+    elapsed = time.perf_counter() - start
+    print(f"gravação: {args.entries} entradas, {elapsed / args.entries * 1e6:.0f} µs por entrada "
+          f"({os.path.getsize(store.db_path) / 1e6:.1f} MB)")
+
+    for query in ["rsync", "copiar remoto", "journalctl logs serviço", "perm"]:
+        timings = []
+        for _ in range(args.queries):
+            start = time.perf_counter()
+            results = store.search(query, 10)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"{query!r:<28} {len(results):>3} resultados  p50 {timings[len(timings) // 2] * 1000:6.2f} ms  "
+              f"p99 {timings[int(len(timings) * 0.99)] * 1000:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark do transporte HTTP/2 (--http2) face ao HTTP/1.1, ambos sobre TLS.
+
+O mesmo cenário corre com um cliente novo (sem ligações abertas nem caches) contra o servidor
+HTTPS de bench/mock_azure.py (só HTTP/1.1) e contra o de bench/mock_azure_h2.py (HTTP/2), com
+a mesma latência simulada, e reporta os handshakes TLS contados no servidor e o tempo total
+(mediana). Em HTTP/1.1 cada pedido em paralelo abre a sua ligação; em HTTP/2 partilham uma.
+
+Cenários:
+    status      --status: perfil, tier e estatísticas em paralelo
+    fanout      N pedidos de perfil em paralelo (--parallel)
+    batch       --batch com N perguntas e N workers
+    sequential  N perguntas seguidas (ligação reutilizada nos dois protocolos)
+    fallback    cliente --http2 contra o servidor só HTTP/1.1 (deve recuar para HTTP/1.1)
+
+Requer httpx[http2] e o comando openssl (certificado auto-assinado).
+
+Utilização:
+    python3 bench/bench_http2.py
+    python3 bench/bench_http2.py --latency 0.1 --parallel 16 --repeat 7
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "install"))
+from mock_azure import MockAzureServer, TEST_USER, make_certificate, make_token  # noqa: E402
+from mock_azure_h2 import MockAzureH2Server  # noqa: E402
+
+
+def scenarios(parallel: int) -> Dict[str, Callable]:
+    from manai import run_batch
+
+    def status(client):
+        return client.run_concurrently({"profile": client.get_profile, "tier": client.get_tier_config,
+                                        "usage": client.usage_statistics}).values()
+
+    def fanout(client):
+        return client.run_concurrently({f"profile{i}": client.get_profile for i in range(parallel)}).values()
+
+    def batch(client):
+        out = io.StringIO()
+        client.http_config["pool_maxsize"] = parallel
+        run_batch(client, (f"pergunta {i}" for i in range(parallel)), workers=parallel, use_cache=False, out=out)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def sequential(client):
+        return [client.ask_question(f"pergunta {i}", use_session=False, use_cache=False) for i in range(parallel)]
+
+    return {"status": status, "fanout": fanout, "batch": batch, "sequential": sequential}
+
+
+def run(server, http2: bool, scenario: Callable) -> Dict[str, float]:
+    """Corre um cenário com um cliente e um HOME novos; devolve tempo, handshakes e falhas."""
+    from manai import ManaiFreemiumAzureClient
+
+    home = tempfile.mkdtemp(prefix="manai-h2-")
+    os.environ["HOME"] = home
+    config_dir = os.path.join(home, ".config", "manai")
+    os.makedirs(config_dir)
+    with open(os.path.join(config_dir, "config.json"), "w") as f:
+        json.dump({"token": make_token(), "user": TEST_USER}, f)
+    server.state.reset()
+    try:
+        with ManaiFreemiumAzureClient(server.base_url, "bench", http_config={"http2": http2}) as client:
+            start = time.perf_counter()
+            results = list(scenario(client))
+            elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    stats = server.state.snapshot()
+    return {"wall": elapsed, "handshakes": stats["connections"], "requests": stats["requests"],
+            "failed": sum(1 for r in results if not r.get("success"))}
+
+
+def measure(server, http2: bool, scenario: Callable, repeat: int) -> Dict[str, float]:
+    runs: List[Dict[str, float]] = [run(server, http2, scenario) for _ in range(repeat)]
+    result = {metric: max(r[metric] for r in runs) for metric in ("handshakes", "requests", "failed")}
+    result["wall"] = sorted(r["wall"] for r in runs)[len(runs) // 2]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTTP/2 vs HTTP/1.1 do cliente ManAI")
+    parser.add_argument("--latency", type=float, default=0.05, help="Atraso simulado por pedido (s)")
+    parser.add_argument("--parallel", type=int, default=8, help="Pedidos por cenário (fanout, batch, sequential)")
+    parser.add_argument("--repeat", type=int, default=5, help="Execuções por cenário e protocolo")
+    args = parser.parse_args()
+
+    try:
+        import httpx  # noqa: F401
+        import h2  # noqa: F401
+    except ImportError:
+        sys.exit("❌ Requer httpx[http2]: pip install 'httpx[http2]'")
+
+    certdir = tempfile.mkdtemp(prefix="manai-cert-")
+    certfile, keyfile = make_certificate(certdir)
+    os.environ["REQUESTS_CA_BUNDLE"] = certfile
+    options = {"latency": args.latency, "daily_limit": 0}
+    try:
+        with MockAzureServer(certfile=certfile, keyfile=keyfile, **options) as http1, \
+                MockAzureH2Server(certfile=certfile, keyfile=keyfile, **options) as http2:
+            print(f"{'cenário':<11} {'protocolo':<9} {'pedidos':>8} {'handshakes':>11} {'tempo (ms)':>11} {'erros':>6}")
+            for name, scenario in scenarios(args.parallel).items():
+                h1 = measure(http1, False, scenario, args.repeat)
+                h2 = measure(http2, True, scenario, args.repeat)
+                for label, result in (("HTTP/1.1", h1), ("HTTP/2", h2)):
+                    print(f"{name:<11} {label:<9} {result['requests']:>8} {result['handshakes']:>11} "
+                          f"{result['wall'] * 1000:>11.1f} {result['failed']:>6}")
+                print(f"{'':<11} {'':<9} {'':>8} {h2['handshakes'] - h1['handshakes']:>+11} "
+                      f"{(h2['wall'] - h1['wall']) / h1['wall'] * 100:>+10.0f}%")
+            fallback = measure(http1, True, scenarios(args.parallel)["status"], args.repeat)
+            print(f"{'fallback':<11} {'HTTP/1.1':<9} {fallback['requests']:>8} {fallback['handshakes']:>11} "
+                  f"{fallback['wall'] * 1000:>11.1f} {fallback['failed']:>6}")
+    finally:
+        shutil.rmtree(certdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Benchmark do cliente ManAI contra o servidor local de bench/mock_azure.py.
+
+Executa cada caminho do main() do CLI num processo novo (como um utilizador faria), com um HOME
+temporário já autenticado, e reporta tempo total, pedidos HTTP, ligações TCP (handshakes) e bytes
+enviados e recebidos, em dois modos:
+
+    cold  HOME novo em cada execução (sem caches, estado, histórico de latência nem tier em cache)
+    warm  o mesmo HOME depois de uma execução de preparação (caches e estado já preenchidos);
+          com --daemon, também com o daemon residente a correr nesse HOME
+
+Os resultados podem ser guardados como baseline e comparados em execuções seguintes: pedidos,
+ligações e bytes a mais em todas as execuções são regressões (as respostas do servidor não
+dependem da data nem das execuções anteriores, pelo que os bytes só variam com a ordem dos
+pedidos em paralelo). Com regressões, o código de saída é 1. O tempo varia demasiado entre execuções e máquinas para servir de critério: um
+aumento acima da tolerância relativa e de um mínimo absoluto é apenas assinalado como aviso.
+
+Utilização:
+    python3 bench/bench_manai.py
+    python3 bench/bench_manai.py --latency 0.05 --repeat 5 --answer-size 4000
+    python3 bench/bench_manai.py --save-baseline bench/baseline.json
+    python3 bench/bench_manai.py --baseline bench/baseline.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_azure import MockAzureServer, TEST_USER, make_token  # noqa: E402
+
+MANAI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "install", "manai.py")
+
+QUESTIONS = "como listar ficheiros ocultos?\ncomo ver o espaço livre em disco?\ncomo procurar texto em ficheiros?\n"
+
+COMMANDS: Dict[str, List[str]] = {
+    "version": ["--version"],
+    "help": ["--help"],
+    "query": ["como listar ficheiros ocultos?"],
+    "query-no-cache": ["--no-cache", "como listar ficheiros ocultos?"],
+    "query-new-session": ["--new-session", "como listar ficheiros ocultos?"],
+    "query-stream": ["--stream", "--no-cache", "como listar ficheiros ocultos?"],
+    "batch": ["--batch", "{questions}", "--workers", "3"],
+    "status": ["--status"],
+    "stats": ["--stats"],
+    "check-feature": ["--check-feature", "longTermMemory,customCommands,ideIntegration,analytics"],
+    "test-connection": ["--test-connection"],
+    "history": ["--history", "ficheiros"],
+    "logout": ["--logout"],
+}
+
+METRICS = ("wall", "requests", "connections", "sent", "received")
+
+# Data fixa das estatísticas do servidor: o tamanho das respostas comprimidas não muda com o dia
+STATS_DATE = "2026-01-15"
+
+
+def seed_home(home: str):
+    """Autentica o utilizador de teste no HOME (--logout apaga as credenciais); o resto mantém-se."""
+    config_dir = os.path.join(home, ".config", "manai")
+    os.makedirs(config_dir, exist_ok=True)
+    with open(os.path.join(config_dir, "config.json"), "w") as f:
+        json.dump({"token": make_token(), "user": TEST_USER}, f)
+    with open(os.path.join(home, "questions.txt"), "w") as f:
+        f.write(QUESTIONS)
+
+
+def run_command(server: MockAzureServer, home: str, args: List[str], daemon: bool = False) -> Dict[str, float]:
+    """Executa um comando do CLI e devolve o tempo total e as métricas observadas no servidor."""
+    seed_home(home)
+    args = [arg.replace("{questions}", os.path.join(home, "questions.txt")) for arg in args]
+    env = dict(os.environ, HOME=home)
+    env.pop("MANAI_TRACE", None)
+    server.state.reset(usage=True)
+    start = time.perf_counter()
+    options = [] if daemon else ["--no-daemon"]
+    proc = subprocess.run([sys.executable, MANAI, "--url", server.base_url] + options + args,
+                          env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        print(f"⚠️  {' '.join(args)} terminou com código {proc.returncode}: {proc.stderr.decode()[-300:]}")
+    stats = server.state.snapshot()
+    return {"wall": elapsed, "requests": stats["requests"], "connections": stats["connections"],
+            "sent": stats["bytesIn"], "received": stats["bytesOut"]}
+
+
+def start_daemon(server: MockAzureServer, home: str) -> subprocess.Popen:
+    daemon = subprocess.Popen([sys.executable, MANAI, "--url", server.base_url, "--daemon"],
+                              env=dict(os.environ, HOME=home), stdout=subprocess.DEVNULL)
+    socket_path = os.path.join(home, ".config", "manai", "daemon.sock")
+    while not os.path.exists(socket_path):
+        time.sleep(0.05)
+    return daemon
+
+
+def measure(server: MockAzureServer, args: List[str], mode: str, repeat: int,
+            daemon: bool = False) -> Dict[str, float]:
+    """
+    Mediana do tempo de `repeat` execuções no modo indicado e o máximo de cada contador, com o
+    mínimo em "<contador>_min" (pedidos em paralelo podem abrir mais ou menos ligações, e as
+    respostas comprimir num byte a mais ou a menos, conforme a ordem em que chegam ao servidor).
+    """
+    runs = []
+    warm_home = None
+    process = None
+    if mode == "warm":
+        warm_home = tempfile.mkdtemp(prefix="manai-bench-")
+        run_command(server, warm_home, args)
+        if daemon:
+            seed_home(warm_home)
+            process = start_daemon(server, warm_home)
+    try:
+        for _ in range(repeat):
+            home = warm_home or tempfile.mkdtemp(prefix="manai-bench-")
+            runs.append(run_command(server, home, args, daemon=process is not None))
+            if not warm_home:
+                shutil.rmtree(home, ignore_errors=True)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        if warm_home:
+            shutil.rmtree(warm_home, ignore_errors=True)
+    result = {metric: max(r[metric] for r in runs) for metric in METRICS}
+    result.update({f"{metric}_min": min(r[metric] for r in runs) for metric in METRICS if metric != "wall"})
+    result["wall"] = sorted(r["wall"] for r in runs)[len(runs) // 2]
+    return result
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float, min_wall: float) -> Tuple[List[str], List[str]]:
+    """
+    Regressões face à baseline e avisos de tempo, que não contam como regressão.
+    
+    Um contador (pedidos, ligações, bytes) regride quando até a melhor execução actual fica acima
+    da pior execução da baseline: a variação de ordem entre pedidos em paralelo não conta, e um
+    pedido ou ligação a mais em todas as execuções conta sempre. O tempo só é assinalado acima da
+    tolerância relativa e do mínimo absoluto.
+    """
+    regressions, warnings = [], []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            continue
+        for metric in METRICS:
+            old, new = previous.get(metric), current[metric]
+            if old is None:
+                continue
+            if metric == "wall":
+                if new > old * (1 + tolerance) and new - old > min_wall:
+                    warnings.append(f"{key}: tempo {old * 1000:.1f} → {new * 1000:.1f} ms")
+            elif current.get(f"{metric}_min", new) > old:
+                regressions.append(f"{key}: {metric} {old} → {current.get(f'{metric}_min', new)}")
+    return regressions, warnings
+
+
+def delta(new: float, old: Optional[float]) -> str:
+    if not old:
+        return ""
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do cliente ManAI contra um servidor local")
+    parser.add_argument("--latency", type=float, default=0.0, help="Atraso simulado por pedido (s)")
+    parser.add_argument("--answer-size", type=int, default=400, help="Tamanho da resposta do agente em caracteres")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracção de pedidos que falham (0-1)")
+    parser.add_argument("--error-status", type=int, default=503, help="Status HTTP das falhas simuladas")
+    parser.add_argument("--seed", type=int, default=1, help="Semente das falhas simuladas")
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções por comando e modo")
+    parser.add_argument("--commands", type=str, default=",".join(COMMANDS),
+                        help="Lista de comandos separados por vírgulas")
+    parser.add_argument("--modes", type=str, default="cold,warm", help="Modos a medir (cold, warm)")
+    parser.add_argument("--daemon", action="store_true", help="No modo warm, correr com o daemon residente activo")
+    parser.add_argument("--save-baseline", type=str, metavar="FICHEIRO", help="Guardar os resultados como baseline")
+    parser.add_argument("--baseline", type=str, metavar="FICHEIRO", help="Comparar com uma baseline guardada")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="Aumento relativo do tempo a partir do qual se avisa (padrão: 0.3)")
+    parser.add_argument("--min-wall", type=float, default=0.05,
+                        help="Aumento absoluto mínimo do tempo para avisar (s)")
+    args = parser.parse_args()
+
+    names = [c.strip() for c in args.commands.split(",") if c.strip()]
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    config = {"latency": args.latency, "answer_size": args.answer_size, "error_rate": args.error_rate,
+              "repeat": args.repeat}
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline = saved["results"]
+        if saved.get("config") != config:
+            print(f"⚠️  A baseline foi medida com outra configuração: {saved.get('config')}\n")
+
+    random.seed(args.seed)
+    results: Dict[str, Dict[str, float]] = {}
+    with MockAzureServer(latency=args.latency, answer_size=args.answer_size, error_rate=args.error_rate,
+                         error_status=args.error_status, daily_limit=0, today=STATS_DATE) as server:
+        print(f"{'comando':<20} {'modo':<5} {'pedidos':>8} {'handshakes':>11} {'↑ bytes':>9} "
+              f"{'↓ bytes':>9} {'tempo (ms)':>11} {'vs baseline':>12}")
+        for name in names:
+            for mode in modes:
+                key = f"{name}/{mode}"
+                result = measure(server, COMMANDS[name], mode, args.repeat, args.daemon)
+                results[key] = result
+                previous = baseline.get(key, {})
+                print(f"{name:<20} {mode:<5} {result['requests']:>8} {result['connections']:>11} "
+                      f"{result['sent']:>9} {result['received']:>9} {result['wall'] * 1000:>11.1f} "
+                      f"{delta(result['wall'], previous.get('wall')):>12}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            rounded = {key: dict(result, wall=round(result["wall"], 4)) for key, result in results.items()}
+            json.dump({"config": config, "results": rounded}, f, indent=2, sort_keys=True)
+        print(f"\nBaseline guardada em {args.save_baseline}")
+
+    if args.baseline:
+        regressions, warnings = compare(results, baseline, args.tolerance, args.min_wall)
+        if warnings:
+            print("\n⚠️  Mais lento que a baseline (apenas informativo, o tempo não conta como regressão):")
+            for line in warnings:
+                print(f"  {line}")
+        if regressions:
+            print("\n❌ Regressões face à baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\n✅ Sem regressões face à baseline")
+
+
+if __name__ == "__main__":
+    main()
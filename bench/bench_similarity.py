@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark do índice de perguntas semelhantes (SimilarityIndex).
+
+Gera N perguntas sintéticas, constrói o índice e mede o tempo de carregamento da base, de
+pesquisa, das actualizações incrementais (acréscimos ao registo) e da fusão do registo com a base.
+
+Utilização:
+    python3 bench/bench_similarity.py --entries 30000
+"""
+
+import argparse
+import fcntl
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "install"))
+from manai import SimilarityIndex  # noqa: E402
+
+VERBS = ["list", "find", "delete", "copy", "compress", "extract", "monitor", "kill", "mount", "archive",
+         "sort", "count", "search", "rename", "backup", "sync", "download", "watch", "show", "change"]
+OBJECTS = ["hidden files", "large files", "processes", "tar archive", "zip file", "disk usage", "open ports",
+           "symbolic links", "cron jobs", "log files", "users", "groups", "permissions", "environment variables",
+           "network interfaces", "docker containers", "systemd services", "kernel modules", "dns records"]
+MODIFIERS = ["recursively", "by size", "older than 7 days", "in a directory", "over ssh", "with sudo",
+             "in real time", "without confirmation", "as json", "by date", "to another server", ""]
+
+
+def make_question(rng: random.Random) -> str:
+    return f"how to {rng.choice(VERBS)} {rng.choice(OBJECTS)} {rng.choice(MODIFIERS)} #{rng.randrange(10 ** 6)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do índice de perguntas semelhantes")
+    parser.add_argument("--entries", type=int, default=30000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    index_dir = tempfile.mkdtemp(prefix="manai-sim-")
+    index = SimilarityIndex(index_dir, max_entries=args.entries * 2)
+
+    # Construção em bloco (equivalente a N chamadas a add(), sem passar pelo registo)
+    start = time.perf_counter()
+    with open(index.docs_file, "ab") as f:
+        for _ in range(args.entries):
+            f.write(f'{{"q":"{make_question(rng)}","l":"en","a":"answer","t":0}}\n'.encode())
+    index._rebuild()
+    print(f"construção:           {time.perf_counter() - start:8.2f} s ({args.entries} perguntas)")
+    print(f"base:                 {os.path.getsize(index.index_file) / 1024:8.0f} KiB")
+
+    fresh = SimilarityIndex(index_dir)
+    start = time.perf_counter()
+    fresh._load()
+    print(f"carregamento:         {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+    timings = []
+    hits = 0
+    for _ in range(args.queries):
+        question = make_question(rng)
+        start = time.perf_counter()
+        if fresh.search(question, "en", 0.75):
+            hits += 1
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"pesquisa p50/p99:     {timings[len(timings) // 2] * 1000:8.2f} / "
+          f"{timings[int(len(timings) * 0.99)] * 1000:.2f} ms ({hits}/{args.queries} acima do limiar)")
+
+    timings = []
+    for _ in range(args.updates):
+        start = time.perf_counter()
+        fresh.add(make_question(rng), "en", "answer")
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"actualização p50/p99: {timings[len(timings) // 2] * 1000:8.2f} / "
+          f"{timings[int(len(timings) * 0.99)] * 1000:.2f} ms ({args.updates} perguntas no registo)")
+
+    start = time.perf_counter()
+    with open(fresh.lock_file, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        fresh._merge()
+    print(f"fusão do registo:     {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark de arranque do CLI: tempo total (cold start) por comando.
+
+Cada comando corre num processo novo, tanto como script (python3 manai.py, recompilado a cada
+execução) como através do lançador instalado pelo install_v2.sh (módulo com bytecode em cache).
+Os comandos de rede usam o servidor local de bench/mock_azure.py.
+
+Utilização:
+    python3 bench/bench_startup.py --repeat 9
+    python3 bench/bench_startup.py --importtime     # módulos mais lentos a importar em --version
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_azure import MockAzureServer, TEST_USER, make_token  # noqa: E402
+
+INSTALL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "install")
+MANAI = os.path.join(INSTALL_DIR, "manai.py")
+
+COMMANDS = {
+    "--version": ["--version"],
+    "--help": ["--help"],
+    "--logout": ["--logout"],
+    "cached-query": ["--new-session", "como listar ficheiros ocultos?"],
+    "query": ["--no-cache", "como listar ficheiros ocultos?"],
+    "--status": ["--status"],
+}
+
+
+def make_launcher(workdir: str) -> List[str]:
+    """Instala o módulo com bytecode compilado e devolve o comando do lançador."""
+    lib_dir = os.path.join(workdir, "lib")
+    os.makedirs(lib_dir)
+    shutil.copy(MANAI, lib_dir)
+    subprocess.run([sys.executable, "-m", "compileall", "-q", lib_dir], check=True)
+    launcher = os.path.join(workdir, "manai")
+    with open(launcher, "w") as f:
+        f.write(f"import sys\nsys.path.insert(0, {lib_dir!r})\nfrom manai import main\nmain()\n")
+    return [sys.executable, launcher]
+
+
+def seed_home(home: str):
+    """Repõe o utilizador autenticado no HOME (--logout apaga-o); a cache de respostas mantém-se."""
+    config_dir = os.path.join(home, ".config", "manai")
+    os.makedirs(config_dir, exist_ok=True)
+    with open(os.path.join(config_dir, "config.json"), "w") as f:
+        json.dump({"token": make_token(), "user": TEST_USER}, f)
+
+
+def measure(argv: List[str], home: str, repeat: int) -> float:
+    """Mediana do tempo total de `repeat` execuções de argv, cada uma num processo novo."""
+    env = dict(os.environ, HOME=home)
+    timings = []
+    for _ in range(repeat):
+        seed_home(home)
+        start = time.perf_counter()
+        subprocess.run(argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque do CLI ManAI")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--importtime", action="store_true", help="Mostrar os imports mais lentos de --version")
+    args = parser.parse_args()
+
+    if args.importtime:
+        proc = subprocess.run([sys.executable, "-X", "importtime", MANAI, "--version"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        rows = [line.split("|") for line in proc.stderr.splitlines()[1:]]
+        rows.sort(key=lambda r: int(r[1]), reverse=True)
+        for row in rows[:15]:
+            print(f"{int(row[1]) / 1000:8.1f} ms  {row[2].rstrip()}")
+        return
+
+    workdir = tempfile.mkdtemp(prefix="manai-startup-")
+    home = os.path.join(workdir, "home")
+    launcher = make_launcher(workdir)
+    baseline = measure([sys.executable, "-c", "pass"], home, args.repeat)
+    print(f"interpretador vazio: {baseline * 1000:.1f} ms\n")
+
+    with MockAzureServer() as server:
+        # Pôr a pergunta em cache para o comando cached-query
+        seed_home(home)
+        subprocess.run(launcher + ["--url", server.base_url] + COMMANDS["cached-query"],
+                       env=dict(os.environ, HOME=home), stdout=subprocess.DEVNULL)
+
+        print(f"{'comando':<15} {'script (ms)':>12} {'lançador (ms)':>14}")
+        for name, cmd_args in COMMANDS.items():
+            if name != "--version":
+                cmd_args = ["--url", server.base_url] + cmd_args
+            script = measure([sys.executable, MANAI] + cmd_args, home, args.repeat)
+            module = measure(launcher + cmd_args, home, args.repeat)
+            print(f"{name:<15} {script * 1000:>12.1f} {module * 1000:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
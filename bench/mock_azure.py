@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita as Azure Functions do ManAI, para medir o cliente sem tocar em produção.
+
+Se o cliente pedir streaming ("Stream": true e Accept: text/event-stream), o agente responde
+com eventos SSE em chunked transfer encoding, uma palavra por evento.
+
+As respostas JSON são comprimidas com gzip se o cliente o aceitar (desactivar com --no-compress)
+e os pedidos com Content-Encoding: gzip são descomprimidos, como num servidor real.
+
+Com --error-rate, uma fracção dos pedidos falha com --error-status (e Retry-After, se indicado),
+para exercitar as novas tentativas e o circuit breaker do cliente.
+
+As respostas a GET levam ETag e um pedido com If-None-Match igual recebe 304 sem corpo.
+
+Conta pedidos por endpoint, ligações TCP aceites (cada ligação nova corresponde a um
+handshake TCP/TLS no servidor real) e bytes dos corpos recebidos e enviados (tal como passam
+na rede, comprimidos ou não). Os contadores estão disponíveis em GET /__stats e podem ser
+limpos com POST /__reset.
+
+Com --tls serve HTTPS (só HTTP/1.1) com um certificado auto-assinado; a variante HTTP/2 está
+em bench/mock_azure_h2.py.
+
+Utilização:
+    python3 bench/mock_azure.py --port 8765
+    manai --url http://127.0.0.1:8765/api --status
+"""
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import random
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+
+def make_token(email: str = "bench@manai.local", ttl: int = 3600) -> str:
+    """Gera um token com formato JWT (sem assinatura válida) para o utilizador de teste."""
+    def b64(data: Dict[str, Any]) -> str:
+        raw = json.dumps(data, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+    header = {"alg": "HS256", "typ": "JWT"}
+    payload = {"sub": email, "email": email, "exp": int(time.time()) + ttl}
+    return f"{b64(header)}.{b64(payload)}.bW9jaw"
+
+
+TEST_USER = {
+    "id": "bench-user",
+    "email": "bench@manai.local",
+    "firstName": "Bench",
+    "lastName": "Mock",
+    "tierType": "free",
+}
+
+
+def make_certificate(directory: str) -> Tuple[str, str]:
+    """Gera com o openssl um certificado auto-assinado para 127.0.0.1 e localhost."""
+    certfile = os.path.join(directory, "mock-cert.pem")
+    keyfile = os.path.join(directory, "mock-key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-keyout", keyfile, "-out", certfile, "-subj", "/CN=localhost",
+                    "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certfile, keyfile
+
+
+class MockState:
+    """Estado partilhado pelo servidor: contadores e parâmetros de simulação."""
+
+    def __init__(self, latency: float = 0.0, answer_size: int = 400, daily_limit: int = 50,
+                 stream_delay: float = 0.0, error_rate: float = 0.0, error_status: int = 503,
+                 retry_after: Any = None, compress: bool = True, today: Optional[str] = None):
+        self.lock = threading.Lock()
+        # Data fixa (AAAA-MM-DD) das estatísticas, para respostas com o mesmo tamanho todos os dias
+        self.today = today
+        self.compress = compress
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.latency = latency
+        self.stream_delay = stream_delay
+        self.answer_size = answer_size
+        self.daily_limit = daily_limit
+        self.queries_today = 0
+        self.reset()
+
+    def reset(self, usage: bool = False):
+        """Zera os contadores; com usage, também as consultas de hoje (usageInfo e estatísticas)."""
+        with self.lock:
+            if usage:
+                self.queries_today = 0
+            self.connections = 0
+            self.requests = 0
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.by_endpoint: Dict[str, int] = {}
+
+    def count_connection(self):
+        with self.lock:
+            self.connections += 1
+
+    def count_request(self, endpoint: str):
+        with self.lock:
+            self.requests += 1
+            self.by_endpoint[endpoint] = self.by_endpoint.get(endpoint, 0) + 1
+
+    def count_bytes(self, received: int = 0, sent: int = 0):
+        with self.lock:
+            self.bytes_in += received
+            self.bytes_out += sent
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "connections": self.connections,
+                "requests": self.requests,
+                "bytesIn": self.bytes_in,
+                "bytesOut": self.bytes_out,
+                "byEndpoint": dict(self.by_endpoint),
+            }
+
+
+def decode_body(state: MockState, raw: bytes, content_encoding: Optional[str]) -> Dict[str, Any]:
+    """Corpo JSON de um pedido (descomprimido se vier com gzip), contando os bytes recebidos."""
+    state.count_bytes(received=len(raw))
+    try:
+        if content_encoding == "gzip":
+            raw = gzip.decompress(raw)
+        return json.loads(raw or b"{}")
+    except (ValueError, OSError, EOFError):
+        return {}
+
+
+def encode_body(state: MockState, payload: Dict[str, Any], accept_encoding: str) -> Tuple[bytes, Dict[str, str]]:
+    """Corpo JSON de uma resposta, comprimido com gzip se o cliente o aceitar, e os seus cabeçalhos."""
+    body = json.dumps(payload).encode("utf-8")
+    headers = {}
+    if state.compress and len(body) >= 256 and "gzip" in accept_encoding:
+        body = gzip.compress(body, compresslevel=6, mtime=0)
+        headers["Content-Encoding"] = "gzip"
+    headers["Content-Type"] = "application/json; charset=utf-8"
+    headers["Content-Length"] = str(len(body))
+    return body, headers
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Handler HTTP/1.1 com keep-alive para os endpoints usados pelo cliente."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "ManaiMock/1.0"
+
+    def setup(self):
+        super().setup()
+        self.server.state.count_connection()
+
+    def log_message(self, format, *args):
+        pass
+
+    # -- utilitários -------------------------------------------------------
+
+    def _read_body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            raw = self.rfile.read(length)
+        except OSError:
+            return {}
+        return decode_body(self.server.state, raw, self.headers.get("Content-Encoding"))
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200, headers: Dict[str, str] = None):
+        body, body_headers = encode_body(self.server.state, payload, self.headers.get("Accept-Encoding", ""))
+        self.send_response(status)
+        for name, value in dict(headers or {}, **body_headers).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        if not self.path.endswith("/__stats"):
+            self.server.state.count_bytes(sent=len(body))
+
+    def _query(self) -> Dict[str, str]:
+        query = parse_qs(self.path.split("?", 1)[1]) if "?" in self.path else {}
+        return {name: values[-1] for name, values in query.items()}
+
+    def _endpoint(self) -> str:
+        path = self.path.split("?", 1)[0]
+        return path.rstrip("/").rsplit("/", 1)[-1]
+
+    # -- endpoints ---------------------------------------------------------
+
+    def _handle(self, method: str):
+        data = self._read_body() if method in ("POST", "PUT") else {}
+        status, payload, headers = self._respond(method, data)
+        if status == 304:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if status == 200 and data.get("Stream") and "text/event-stream" in self.headers.get("Accept", ""):
+            return self._send_stream(payload)
+        self._send_json(payload, status, headers)
+
+    def _respond(self, method: str, data: Dict[str, Any]) -> Tuple[int, Optional[Dict[str, Any]], Dict[str, str]]:
+        """Status, corpo (None num 304) e cabeçalhos da resposta; usado também pelo servidor HTTP/2."""
+        state = self.server.state
+        endpoint = self._endpoint()
+        if endpoint == "__stats":
+            return 200, state.snapshot(), {}
+        if endpoint == "__reset":
+            state.reset()
+            return 200, {"success": True}, {}
+
+        state.count_request(endpoint)
+        if state.latency:
+            time.sleep(state.latency)
+
+        if state.error_rate and random.random() < state.error_rate:
+            headers = {"Retry-After": str(state.retry_after)} if state.retry_after is not None else {}
+            return state.error_status, {"success": False, "error": "injected failure"}, headers
+
+        handler = getattr(self, f"ep_{endpoint}", None)
+        if handler is None:
+            return 404, {"success": False, "error": "not found"}, {}
+        status, payload = handler(method, data)
+        if status == 200 and method == "GET":
+            etag = '"%s"' % hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+            if self.headers.get("If-None-Match") == etag:
+                return 304, None, {"ETag": etag}
+            return status, payload, {"ETag": etag}
+        return status, payload, {}
+
+    def _send_stream(self, payload: Dict[str, Any]):
+        """Envia a resposta do agente como eventos SSE, uma palavra de cada vez."""
+        def chunk(event: Dict[str, Any]):
+            data = f"data: {json.dumps(event)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.server.state.count_bytes(sent=len(data))
+            self.wfile.flush()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        answer = payload.pop("answer", "")
+        for word in answer.split(" "):
+            chunk({"delta": word + " "})
+            if self.server.state.stream_delay:
+                time.sleep(self.server.state.stream_delay)
+        chunk(dict(payload, done=True))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def ep_LoginUser(self, method, data):
+        return 200, {"success": True, "token": make_token(data.get("Email", TEST_USER["email"])),
+                     "user": TEST_USER}
+
+    def ep_RegisterUser(self, method, data):
+        return self.ep_LoginUser(method, data)
+
+    def ep_ValidateToken(self, method, data):
+        return 200, {"success": True, "valid": True}
+
+    def ep_CheckUsageLimit(self, method, data):
+        state = self.server.state
+        return 200, {"success": True, "canMakeQuery": not state.daily_limit or state.queries_today < state.daily_limit,
+                     "currentUsage": state.queries_today, "dailyLimit": state.daily_limit}
+
+    def ep_GetUserProfile(self, method, data):
+        return 200, {"success": True, "user": TEST_USER}
+
+    def ep_GetTierConfiguration(self, method, data):
+        return 200, {
+            "success": True,
+            "tierType": "free",
+            "dailyQueryLimit": self.server.state.daily_limit,
+            "supportedLanguages": ["pt", "en", "es"],
+            "features": {"longTermMemory": False, "customCommands": False,
+                         "ideIntegration": False, "analytics": True},
+        }
+
+    def ep_GetUsageStatistics(self, method, data):
+        state = self.server.state
+        today = datetime.fromisoformat(state.today).date() if state.today else datetime.now().date()
+        daily = [{"date": (today - timedelta(days=i)).isoformat(), "queriesCount": max(0, 7 - i)}
+                 for i in range(30)]
+        daily[0]["queriesCount"] = state.queries_today
+        total = sum(d["queriesCount"] for d in daily)
+        # Com ?since=AAAA-MM-DD, só os dias a partir dessa data (o total é sempre o completo)
+        since = self._query().get("since")
+        if since:
+            daily = [d for d in daily if d["date"] >= since]
+        return 200, {"success": True, "totalQueries": total,
+                     "averageQueriesPerDay": 4.2, "currentTier": "free", "dailyStatistics": daily}
+
+    def ep_CheckFeatureAccess(self, method, data):
+        name = data.get("featureName", "")
+        return 200, {"success": True, "featureName": name, "hasAccess": name == "analytics",
+                     "requiredTier": "pro"}
+
+    def ep_ManaiAgentFreemiumHttpTrigger(self, method, data):
+        state = self.server.state
+        with state.lock:
+            if state.daily_limit and state.queries_today >= state.daily_limit:
+                return 429, {"success": False, "error": "Daily limit reached"}
+            state.queries_today += 1
+            used = state.queries_today
+            # Perguntas sem ThreadId começam uma conversa nova
+            thread_id = data.get("ThreadId") or f"thread_mock_{used:04d}"
+        question = data.get("Question", "")
+        answer = (f"Resposta simulada para: {question}\n" + "ls -la " * state.answer_size)[:state.answer_size]
+        return 200, {
+            "success": True,
+            "answer": answer,
+            "ThreadId": thread_id,
+            "SessionId": "session_mock_0001",
+            "usageInfo": {"queriesUsedToday": used, "dailyLimit": state.daily_limit},
+        }
+
+    def ep_ManaiAgentHttpTrigger(self, method, data):
+        if method == "GET":
+            return 200, {"success": True, "message": "ManaiAgentHttpTrigger disponível"}
+        return self.ep_ManaiAgentFreemiumHttpTrigger(method, data)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+
+class MockAzureServer(ThreadingHTTPServer):
+    """Servidor de teste; usar como context manager para correr numa thread em segundo plano."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, certfile: Optional[str] = None,
+                 keyfile: Optional[str] = None, **state_options):
+        super().__init__((host, port), MockHandler)
+        self.state = MockState(**state_options)
+        self._thread = None
+        self.tls = certfile is not None
+        if self.tls:
+            # HTTPS só com HTTP/1.1 (sem ALPN "h2"): um cliente HTTP/2 tem de recuar para HTTP/1.1
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(certfile, keyfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    def handle_error(self, request, client_address):
+        # Clientes que terminam com ligações keep-alive abertas não são erros
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError, ssl.SSLError)):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"{'https' if self.tls else 'http'}://{host}:{port}/api"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita as Azure Functions do ManAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Atraso por pedido em segundos")
+    parser.add_argument("--answer-size", type=int, default=400, help="Tamanho da resposta do agente em caracteres")
+    parser.add_argument("--stream-delay", type=float, default=0.0, help="Atraso entre eventos em streaming (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracção de pedidos que falham (0-1)")
+    parser.add_argument("--error-status", type=int, default=503, help="Status HTTP das falhas simuladas")
+    parser.add_argument("--retry-after", type=str, default=None, help="Valor do cabeçalho Retry-After nas falhas")
+    parser.add_argument("--daily-limit", type=int, default=50, help="Limite diário de perguntas (0 = ilimitado)")
+    parser.add_argument("--no-compress", action="store_true", help="Não comprimir as respostas")
+    parser.add_argument("--tls", action="store_true", help="Servir HTTPS com um certificado auto-assinado")
+    args = parser.parse_args()
+
+    certfile = keyfile = None
+    if args.tls:
+        certfile, keyfile = make_certificate(tempfile.mkdtemp(prefix="manai-mock-"))
+        print(f"Certificado: {certfile} (usar com REQUESTS_CA_BUNDLE)")
+    server = MockAzureServer(args.host, args.port, certfile, keyfile, latency=args.latency, answer_size=args.answer_size,
+                             stream_delay=args.stream_delay, error_rate=args.error_rate,
+                             error_status=args.error_status, retry_after=args.retry_after,
+                             daily_limit=args.daily_limit, compress=not args.no_compress)
+    print(f"Mock ManAI a escutar em {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Variante HTTP/2 do servidor de bench/mock_azure.py, para medir o transporte --http2 do cliente.
+
+Serve HTTPS com ALPN "h2" (certificado auto-assinado) e responde com os mesmos endpoints,
+latência simulada, falhas injectadas, ETags, gzip e contadores do servidor HTTP/1.1. Cada
+ligação TLS aceite conta como um handshake; os pedidos em paralelo de um cliente HTTP/2 chegam
+como streams da mesma ligação e são atendidos em simultâneo.
+
+O streaming SSE não é simulado: as perguntas com "Stream" recebem a resposta JSON completa.
+Requer o pacote h2 (pip install h2).
+
+Utilização:
+    python3 bench/mock_azure_h2.py --port 8766
+    REQUESTS_CA_BUNDLE=<certificado indicado> manai --http2 --url https://127.0.0.1:8766/api --status
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import ssl
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from typing import Dict, List, Optional, Tuple
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_azure import MockHandler, MockState, decode_body, encode_body, make_certificate  # noqa: E402
+
+
+class H2Exchange(MockHandler):
+    """Um pedido HTTP/2 com a interface do MockHandler, para reutilizar os seus endpoints."""
+
+    def __init__(self, server: "MockAzureH2Server", path: str, headers: List[Tuple[str, str]]):
+        # Não chamar o construtor do BaseHTTPRequestHandler, que trataria uma ligação
+        self.server = server
+        self.path = path
+        self.headers = Message()
+        for name, value in headers:
+            if not name.startswith(":"):
+                self.headers[name] = value
+
+
+class MockAzureH2Server:
+    """Servidor de teste HTTP/2; usar como context manager para correr numa thread em segundo plano."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, certfile: Optional[str] = None,
+                 keyfile: Optional[str] = None, **state_options):
+        self.state = MockState(**state_options)
+        if certfile is None:
+            certfile, keyfile = make_certificate(tempfile.mkdtemp(prefix="manai-mock-"))
+        self.certfile = certfile
+        self.context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.context.load_cert_chain(certfile, keyfile)
+        self.context.set_alpn_protocols(["h2"])
+        self.socket = socket.create_server((host, port), backlog=1024)
+        self.server_address = self.socket.getsockname()
+        # Os endpoints são síncronos (time.sleep para a latência): correm num pool de threads
+        self.executor = ThreadPoolExecutor(max_workers=256)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"https://{host}:{port}/api"
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        server = await asyncio.start_server(self._connection, sock=self.socket, ssl=self.context)
+        self._ready.set()
+        async with server:
+            await self._stop.wait()
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.state.count_connection()
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        pending: Dict[int, Tuple[List[Tuple[str, str]], bytearray]] = {}
+        window = asyncio.Event()
+        tasks = set()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        pending[event.stream_id] = (event.headers, bytearray())
+                    elif isinstance(event, h2.events.DataReceived):
+                        pending[event.stream_id][1].extend(event.data)
+                        conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        headers, body = pending.pop(event.stream_id)
+                        task = asyncio.create_task(self._stream(conn, writer, window, event.stream_id,
+                                                                headers, bytes(body)))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    elif isinstance(event, h2.events.WindowUpdated):
+                        window.set()
+                    elif isinstance(event, h2.events.StreamReset):
+                        pending.pop(event.stream_id, None)
+                writer.write(conn.data_to_send())
+                await writer.drain()
+        except (ConnectionError, ssl.SSLError, h2.exceptions.ProtocolError, asyncio.CancelledError):
+            # Ligações ainda abertas quando o servidor pára são canceladas
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _stream(self, conn: h2.connection.H2Connection, writer: asyncio.StreamWriter,
+                      window: asyncio.Event, stream_id: int, headers: List[Tuple[str, str]], body: bytes):
+        """Atende um stream: corre o endpoint e envia a resposta respeitando o controlo de fluxo."""
+        pseudo = dict(header for header in headers if header[0].startswith(":"))
+        method = pseudo.get(":method", "GET")
+        exchange = H2Exchange(self, pseudo.get(":path", "/"), headers)
+        data = decode_body(self.state, body, exchange.headers.get("Content-Encoding")) if body else {}
+        status, payload, extra = await asyncio.get_running_loop().run_in_executor(
+            self.executor, exchange._respond, method, data)
+
+        content = b""
+        if payload is not None:
+            content, body_headers = encode_body(self.state, payload, exchange.headers.get("Accept-Encoding", ""))
+            extra = dict(extra, **body_headers)
+            if not exchange.path.endswith("/__stats"):
+                self.state.count_bytes(sent=len(content))
+        try:
+            conn.send_headers(stream_id, [(":status", str(status))] +
+                              [(name.lower(), value) for name, value in extra.items()],
+                              end_stream=not content)
+            writer.write(conn.data_to_send())
+            while content:
+                size = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size, len(content))
+                if size <= 0:
+                    window.clear()
+                    await window.wait()
+                    continue
+                conn.send_data(stream_id, content[:size], end_stream=size == len(content))
+                content = content[size:]
+                writer.write(conn.data_to_send())
+        except h2.exceptions.StreamClosedError:
+            pass
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join()
+        self.executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local HTTP/2 que imita as Azure Functions do ManAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="Atraso por pedido em segundos")
+    parser.add_argument("--answer-size", type=int, default=400, help="Tamanho da resposta do agente em caracteres")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracção de pedidos que falham (0-1)")
+    parser.add_argument("--error-status", type=int, default=503, help="Status HTTP das falhas simuladas")
+    parser.add_argument("--daily-limit", type=int, default=50, help="Limite diário de perguntas (0 = ilimitado)")
+    parser.add_argument("--no-compress", action="store_true", help="Não comprimir as respostas")
+    args = parser.parse_args()
+
+    server = MockAzureH2Server(args.host, args.port, latency=args.latency, answer_size=args.answer_size,
+                               error_rate=args.error_rate, error_status=args.error_status,
+                               daily_limit=args.daily_limit, compress=not args.no_compress)
+    print(f"Mock ManAI (HTTP/2) a escutar em {server.base_url}")
+    print(f"Certificado: {server.certfile} (usar com REQUESTS_CA_BUNDLE)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
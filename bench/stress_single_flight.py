@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Teste de carga da partilha de perguntas iguais em curso (single flight, chave "single_flight").
+
+Simula vários utilizadores num bastion a fazer a mesma pergunta ao mesmo tempo: N processos
+manai, cada um com o seu HOME e credenciais, partilham um directório "single_flight" e correm
+contra o servidor local de bench/mock_azure.py com latência, e verifica no fim que:
+  - todos os processos terminaram sem erros e mostraram a resposta;
+  - o agente recebeu um único pedido para a pergunta repetida (e as restantes foram partilhadas);
+  - perguntas diferentes em simultâneo continuam a ter cada uma o seu pedido;
+  - sem o directório partilhado, cada utilizador faz o seu pedido (referência).
+
+Utilização:
+    python3 bench/stress_single_flight.py --processes 30 --latency 0.5
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_azure import MockAzureServer, TEST_USER, make_token  # noqa: E402
+
+MANAI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "install", "manai.py")
+
+AGENT_ENDPOINT = "ManaiAgentFreemiumHttpTrigger"
+
+
+def make_home(root: str, index: int, flight_dir: Optional[str]) -> str:
+    """HOME de um utilizador autenticado, com o directório de single flight indicado."""
+    home = os.path.join(root, f"user{index}")
+    config_dir = os.path.join(home, ".config", "manai")
+    os.makedirs(config_dir)
+    config = {"token": make_token(), "user": TEST_USER}
+    if flight_dir:
+        config["single_flight"] = {"dir": flight_dir}
+    with open(os.path.join(config_dir, "config.json"), "w") as f:
+        json.dump(config, f)
+    return home
+
+
+def burst(server: MockAzureServer, questions: List[str], flight_dir: Optional[str]) -> Dict[str, object]:
+    """Lança um processo por pergunta, todos ao mesmo tempo, e devolve o resultado observado."""
+    root = tempfile.mkdtemp(prefix="manai-flight-")
+    homes = [make_home(root, i, flight_dir) for i in range(len(questions))]
+    server.state.reset()
+
+    def run(item):
+        home, question = item
+        proc = subprocess.run([sys.executable, MANAI, "--url", server.base_url, "--no-daemon", "--agent",
+                               "--new-session", question],
+                              env=dict(os.environ, HOME=home), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              text=True)
+        return proc.returncode, proc.stdout
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=len(questions)) as executor:
+            results = list(executor.map(run, zip(homes, questions)))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {
+        "wall": time.perf_counter() - start,
+        "calls": server.state.snapshot()["byEndpoint"].get(AGENT_ENDPOINT, 0),
+        "failures": [out for code, out in results if code != 0 or "Resposta do ManAI" not in out],
+        "shared": sum(1 for _, out in results if "🤝" in out),
+        # Processos que só arrancaram depois de a resposta ter sido publicada (janela "reuse")
+        "recent": sum(1 for _, out in results if "🔁" in out),
+    }
+
+
+def check(condition, message):
+    print(f"  {'✅' if condition else '❌'} {message}")
+    return condition
+
+
+def report(label: str, result: Dict[str, object], processes: int) -> bool:
+    failures = result["failures"]
+    print(f"{label}: {result['calls']} pedidos ao agente, {result['shared']} respostas partilhadas, "
+          f"{result['recent']} reutilizadas, {result['wall']:.1f} s")
+    return check(not failures, f"{processes - len(failures)}/{processes} processos com resposta"
+                 + (f": {failures[0][-300:]}" if failures else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do single flight do ManAI")
+    parser.add_argument("--processes", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="Atraso simulado por pedido (s)")
+    args = parser.parse_args()
+
+    flight_dir = tempfile.mkdtemp(prefix="manai-inflight-")
+    question = "como listar ficheiros ocultos?"
+    # Variações que a normalização da cache de respostas trata como a mesma pergunta
+    variants = [question, "Como listar ficheiros ocultos", "  como listar   ficheiros ocultos?! "]
+    ok = True
+    try:
+        with MockAzureServer(latency=args.latency, daily_limit=0) as server:
+            same = [variants[i % len(variants)] for i in range(args.processes)]
+
+            result = burst(server, same, None)
+            ok &= report("1. Mesma pergunta, sem directório partilhado", result, args.processes)
+            ok &= check(result["calls"] == args.processes, f"um pedido por utilizador ({result['calls']})")
+
+            result = burst(server, same, flight_dir)
+            ok &= report("2. Mesma pergunta, directório partilhado", result, args.processes)
+            ok &= check(result["calls"] == 1, f"um único pedido ao agente ({result['calls']})")
+            ok &= check(result["shared"] + result["recent"] == args.processes - 1,
+                        f"{result['shared'] + result['recent']}/{args.processes - 1} respostas partilhadas")
+
+            distinct = [f"pergunta {i}" for i in range(args.processes)]
+            result = burst(server, distinct, flight_dir)
+            ok &= report("3. Perguntas diferentes, directório partilhado", result, args.processes)
+            ok &= check(result["calls"] == args.processes and result["shared"] + result["recent"] == 0,
+                        f"um pedido por pergunta ({result['calls']})")
+    finally:
+        shutil.rmtree(flight_dir, ignore_errors=True)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
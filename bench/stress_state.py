@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Teste de carga do estado partilhado (state.db): dezenas de invocações do CLI em paralelo.
+
+Lança N processos manai ao mesmo tempo contra o servidor local de bench/mock_azure.py, num HOME
+com credenciais no formato antigo (config.json), e verifica no fim que:
+  - todos os processos terminaram sem erros (nem "database is locked");
+  - a base de dados está íntegra e as credenciais foram migradas para o estado;
+  - o ledger de quota regista a utilização mais alta devolvida pelo servidor;
+  - a sessão guardada é a de um thread realmente criado, e não foi trocada por processos
+    concorrentes que começaram conversas diferentes;
+  - logins concorrentes com perguntas deixam um token válido.
+
+Utilização:
+    python3 bench/stress_state.py --processes 40
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_azure import MockAzureServer, TEST_USER, make_token  # noqa: E402
+
+INSTALL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "install")
+MANAI = os.path.join(INSTALL_DIR, "manai.py")
+
+LOGIN = (f"import sys; sys.path.insert(0, {INSTALL_DIR!r}); from manai import ManaiFreemiumAzureClient; "
+         "c = ManaiFreemiumAzureClient(sys.argv[1]); r = c.login('bench@manai.local', 'x'); "
+         "sys.exit(0 if r.get('success') else 1)")
+
+
+def run(argv, home):
+    proc = subprocess.run(argv, env=dict(os.environ, HOME=home), stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, text=True)
+    return proc.returncode, proc.stdout + proc.stderr
+
+
+def run_parallel(commands, home):
+    with ThreadPoolExecutor(max_workers=len(commands)) as executor:
+        return list(executor.map(lambda argv: run(argv, home), commands))
+
+
+def check(condition, message):
+    print(f"  {'✅' if condition else '❌'} {message}")
+    return condition
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do estado partilhado do ManAI")
+    parser.add_argument("--processes", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.05, help="Atraso simulado por pedido (s)")
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp(prefix="manai-stress-")
+    config_dir = os.path.join(home, ".config", "manai")
+    os.makedirs(config_dir)
+    with open(os.path.join(config_dir, "config.json"), "w") as f:
+        json.dump({"token": make_token(), "user": TEST_USER}, f)
+
+    ok = True
+    with MockAzureServer(latency=args.latency, daily_limit=10000) as server:
+        base = [sys.executable, MANAI, "--url", server.base_url, "--no-daemon"]
+
+        print(f"1. {args.processes} perguntas em simultâneo, sem sessão anterior")
+        start = time.perf_counter()
+        results = run_parallel([base + ["--agent", "--no-cache", f"pergunta {i}"]
+                                for i in range(args.processes)], home)
+        print(f"   {time.perf_counter() - start:.1f} s")
+        failures = [out for code, out in results if code != 0]
+        ok &= check(not failures, f"{len(results) - len(failures)}/{len(results)} processos sem erro"
+                    + (f": {failures[0][-300:]}" if failures else ""))
+
+        db = sqlite3.connect(os.path.join(config_dir, "state.db"))
+        state = {key: json.loads(value) for key, value in db.execute("SELECT key, value FROM state")}
+        ok &= check(db.execute("PRAGMA integrity_check").fetchone()[0] == "ok", "base de dados íntegra")
+        ok &= check(state.get("auth", {}).get("token") and "token" not in json.load(
+            open(os.path.join(config_dir, "config.json"))), "credenciais migradas de config.json")
+        used = max((entry.get("used") or 0) for entry in state.get("quota", {}).values()) if state.get("quota") else 0
+        ok &= check(used == server.state.queries_today,
+                    f"ledger de quota: {used} consultas (servidor: {server.state.queries_today})")
+        thread = (state.get("session") or {}).get("ThreadId")
+        # O primeiro processo a gravar fixa a sessão; os restantes não a substituem
+        ok &= check(thread is not None, f"sessão guardada: {thread}")
+
+        print(f"2. {args.processes} perguntas na mesma sessão, logins e --status em simultâneo")
+        commands = []
+        for i in range(args.processes):
+            if i % 5 == 0:
+                commands.append([sys.executable, "-c", LOGIN, server.base_url])
+            elif i % 5 == 1:
+                commands.append(base + ["--status"])
+            else:
+                commands.append(base + ["--agent", "--no-cache", f"seguimento {i}"])
+        start = time.perf_counter()
+        results = run_parallel(commands, home)
+        print(f"   {time.perf_counter() - start:.1f} s")
+        failures = [out for code, out in results if code != 0]
+        ok &= check(not failures, f"{len(results) - len(failures)}/{len(results)} processos sem erro"
+                    + (f": {failures[0][-300:]}" if failures else ""))
+        state = {key: json.loads(value) for key, value in db.execute("SELECT key, value FROM state")}
+        ok &= check((state.get("session") or {}).get("ThreadId") == thread,
+                    f"sessão mantida no mesmo thread ({thread})")
+        ok &= check(bool(state.get("auth", {}).get("token")), "token presente após logins concorrentes")
+        code, out = run(base + ["--status"], home)
+        ok &= check(code == 0 and "Não autenticado" not in out, "--status autenticado no fim")
+        db.close()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
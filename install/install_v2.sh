@@ -5,6 +5,7 @@
 
 SCRIPT_NAME="manai"
 INSTALL_DIR="$HOME/.local/bin"
+LIB_DIR="$HOME/.local/lib/manai"
 SCRIPT_FILE="manai.py"
 
 echo "A instalar o comando $SCRIPT_NAME v2.0..."
@@ -34,11 +35,21 @@ if ! python3 -c "import requests" &> /dev/null; then
     fi
 fi
 
-# Criar o diretório de instalação se não existir
-mkdir -p "$INSTALL_DIR"
+# Criar os diretórios de instalação se não existirem
+mkdir -p "$INSTALL_DIR" "$LIB_DIR"
 
-# Copiar o script para o diretório de instalação
-cp "./$SCRIPT_FILE" "$INSTALL_DIR/$SCRIPT_NAME"
+# Instalar o código como módulo (com bytecode pré-compilado) e um lançador mínimo,
+# para que o Python não tenha de recompilar o script a cada execução
+cp "./$SCRIPT_FILE" "$LIB_DIR/manai.py"
+python3 -m compileall -q "$LIB_DIR"
+
+cat > "$INSTALL_DIR/$SCRIPT_NAME" <<EOF
+#!/usr/bin/env python3
+import sys
+sys.path.insert(0, "$LIB_DIR")
+from manai import main
+main()
+EOF
 
 # Tornar executável
 chmod +x "$INSTALL_DIR/$SCRIPT_NAME"
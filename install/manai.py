@@ -1,75 +1,2717 @@
 #!/usr/bin/env python3
 
 import argparse
+import base64
+import fcntl
+import hashlib
+import heapq
 import json
+import marshal
+import math
+import mmap
 import os
+import random
+import re
+import signal
+import socket
+import socketserver
+import struct
 import sys
-import requests
+import threading
+import time
+import zlib
 import getpass
-from typing import Optional, Dict, Any
-from datetime import datetime
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Dict, Any, Awaitable, Callable, List, Sequence, Tuple
+from datetime import datetime, timedelta
+
+# Os módulos pesados (requests, asyncio, aiohttp) só são importados quando é feito um pedido
+# de rede, para que comandos locais (--version, --help, --logout, respostas em cache) arranquem depressa.
+
+VERSION = "manai-freemium-azure 2.0.0 - Modelo Freemium com Azure Functions"
+
+# Azure Functions em produção
+DEFAULT_BASE_URL = "https://manai-agent-function-app.azurewebsites.net/api"
+DEFAULT_FUNCTION_KEY = "58H0KD8feP9x2e6uqY1wkwW-6MqwrNkWI6U4-jdsSa5EAzFuACdqNA=="
+
+# Configuração por omissão do pool de ligações HTTP (pode ser sobreposta em config.json, chave "http")
+DEFAULT_HTTP_CONFIG = {
+    "keep_alive": True,        # Reutilizar ligações TCP/TLS entre pedidos
+    "pool_connections": 4,     # Número de hosts com pool próprio
+    "pool_maxsize": 8,         # Máximo de ligações em simultâneo por host
+    "pool_block": False,       # Bloquear quando o pool de um host está esgotado
+    "compress_requests": False,        # Enviar corpos grandes comprimidos (Content-Encoding: gzip)
+    "compress_min_bytes": 1024,        # Tamanho mínimo do corpo JSON para o comprimir
+    "http2": False,            # HTTP/2 multiplexado em https (requer httpx[http2]; senão HTTP/1.1)
+}
+
+def split_base_urls(value: str) -> List[str]:
+    """URLs base de --url (vários separados por vírgulas), sem a barra final."""
+    urls = [url.strip().rstrip('/') for url in value.split(',')]
+    return [url for url in urls if url] or [DEFAULT_BASE_URL]
+
+def format_bytes(size: float) -> str:
+    """Formata um número de bytes (ex.: 1.5 KiB)."""
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024 or unit == "MiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+# Validação local do token: revalidar no servidor só perto da expiração ou após um 401
+TOKEN_EXPIRY_MARGIN = 300           # Segundos antes do "exp" em que o token é considerado a expirar
+TOKEN_VALIDATION_TTL = 6 * 3600     # Validade da última validação no servidor (tokens sem "exp")
+
+# Ledger local de quota: a verificação CheckUsageLimit só é feita perto do limite diário
+QUOTA_HEADROOM_RATIO = 0.2          # Fracção do limite diário abaixo da qual se volta a verificar
+QUOTA_HEADROOM_MIN = 2              # Margem mínima de consultas antes de verificar no servidor
+
+# Estatísticas de utilização mantidas localmente (pode ser sobreposto em config.json, chave "usage_stats")
+DEFAULT_USAGE_STATS_CONFIG = {
+    "sync_interval": 3600,      # Segundos entre reconciliações com GetUsageStatistics
+    "max_days": 90,             # Dias guardados no rollup (os mais antigos ficam só no total)
+}
+
+# Configuração do tier em cache (pode ser sobreposto em config.json, chave "tier_cache")
+DEFAULT_TIER_CACHE_CONFIG = {
+    "ttl": 3600,                # Segundos até revalidar com If-None-Match (0 = revalidar sempre)
+}
+
+def decode_jwt_claims(token: str) -> Optional[Dict[str, Any]]:
+    """Lê as claims de um JWT sem verificar a assinatura (apenas para decisões locais)."""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload.encode('ascii')))
+        return claims if isinstance(claims, dict) else None
+    except (IndexError, ValueError, UnicodeError):
+        return None
+
+# Cache local de respostas (pode ser sobreposta em config.json, chave "answer_cache")
+DEFAULT_ANSWER_CACHE_CONFIG = {
+    "enabled": True,
+    "ttl": 7 * 24 * 3600,             # Segundos até uma resposta em cache expirar
+    "max_bytes": 20 * 1024 * 1024,    # Tamanho máximo da cache em disco (entradas comprimidas)
+    "with_session": False,            # Usar a cache também em perguntas com contexto de sessão
+}
+
+class AnswerCache:
+    """Cache em disco das respostas do agente, com entradas comprimidas e expulsão LRU/TTL."""
+    
+    def __init__(self, cache_dir: str, ttl: float = DEFAULT_ANSWER_CACHE_CONFIG["ttl"],
+                 max_bytes: int = DEFAULT_ANSWER_CACHE_CONFIG["max_bytes"]):
+        """
+        Args:
+            cache_dir: Directório onde guardar as entradas
+            ttl: Segundos até uma entrada expirar
+            max_bytes: Tamanho máximo total das entradas em disco
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+    
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Normaliza a pergunta (minúsculas, espaços e pontuação final) para a chave da cache."""
+        question = re.sub(r"\s+", " ", question.strip().lower())
+        return question.rstrip(" ?!.;:¿¡")
+    
+    def _path(self, question: str, language: str) -> str:
+        key = hashlib.sha256(f"{language}\n{self.normalize(question)}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.z")
+    
+    def get(self, question: str, language: str) -> Optional[Dict[str, Any]]:
+        """Devolve a entrada em cache para a pergunta, ou None se não existir ou tiver expirado."""
+        path = self._path(question, language)
+        try:
+            with open(path, 'rb') as f:
+                entry = json.loads(zlib.decompress(f.read()))
+        except (IOError, OSError, ValueError, zlib.error):
+            return None
+        
+        if time.time() - entry.get('createdAt', 0) > self.ttl:
+            self._remove(path)
+            return None
+        
+        # Marcar como usada recentemente (a ordem LRU segue o mtime)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+    
+    def put(self, question: str, language: str, answer: str):
+        """Guarda uma resposta e expulsa as entradas menos usadas se o limite for excedido."""
+        entry = {
+            'question': question,
+            'language': language,
+            'answer': answer,
+            'createdAt': time.time()
+        }
+        path = self._path(question, language)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(json.dumps(entry, separators=(',', ':')).encode('utf-8'), 6))
+            os.replace(tmp_path, path)
+        except (IOError, OSError):
+            self._remove(tmp_path)
+            return
+        self._evict()
+    
+    def clear(self):
+        """Remove todas as entradas da cache."""
+        for path, _, _ in self._entries():
+            self._remove(path)
+    
+    def _entries(self):
+        """Lista (caminho, mtime, tamanho) das entradas em disco."""
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for item in it:
+                    if item.name.endswith('.z'):
+                        st = item.stat()
+                        entries.append((item.path, st.st_mtime, st.st_size))
+        except OSError:
+            pass
+        return entries
+    
+    def _evict(self):
+        """Remove entradas expiradas e, depois, as menos usadas até caber no limite."""
+        now = time.time()
+        entries = []
+        for path, mtime, size in self._entries():
+            if now - mtime > self.ttl:
+                self._remove(path)
+            else:
+                entries.append((path, mtime, size))
+        
+        total = sum(size for _, _, size in entries)
+        for path, _, size in sorted(entries, key=lambda e: e[1]):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+    
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Perguntas iguais em curso partilhadas entre processos do mesmo host (config.json, chave "single_flight")
+DEFAULT_SINGLE_FLIGHT_CONFIG = {
+    "enabled": True,
+    "dir": "",                  # Directório dos locks e respostas (padrão: ~/.config/manai/inflight); um
+                                # directório do grupo (g+rwx, sem sticky bit) partilha entre utilizadores
+    "wait": 90.0,               # Espera máxima pela pergunta igual em curso antes de a enviar também (s)
+    "reuse": 10.0,              # Respostas publicadas há menos do que isto servem também quem chega depois (s)
+    "with_session": False,      # Partilhar também perguntas enviadas com o thread de uma sessão
+}
+
+class SingleFlight:
+    """
+    Junta num único pedido as perguntas iguais feitas ao mesmo tempo por vários processos.
+    
+    O primeiro processo fica com o flock da pergunta, faz o pedido e publica a resposta antes de
+    largar o lock; os outros esperam pelo lock e reutilizam a resposta se tiver sido publicada
+    depois de começarem a esperar (ou até `reuse` segundos antes, para os que arrancam logo a
+    seguir). Se o pedido falhar (nada publicado) o seguinte na fila tenta ele próprio; esgotada a
+    espera, cada processo faz o seu pedido.
+    
+    Uma resposta só fica no directório enquanto alguém a pode aceitar (o maior de `reuse` e
+    `wait`); é removida, com o lock, no fim da pergunta seguinte feita por qualquer processo.
+    As respostas publicadas são lidas por todos os que usam o directório: partilhá-lo entre
+    utilizadores implica confiar nas respostas que qualquer um deles publique.
+    """
+    
+    POLL_INTERVAL = 0.05        # Intervalo entre tentativas de obter o lock (s)
+    STALE_AFTER = 3600          # Ficheiros temporários abandonados há mais do que isto são removidos (s)
+    
+    def __init__(self, flight_dir: str, wait: float = DEFAULT_SINGLE_FLIGHT_CONFIG["wait"],
+                 reuse: float = DEFAULT_SINGLE_FLIGHT_CONFIG["reuse"]):
+        """
+        Args:
+            flight_dir: Directório dos ficheiros de lock e das respostas publicadas
+            wait: Segundos máximos à espera do processo que está a fazer o pedido
+            reuse: Idade máxima de uma resposta publicada antes de começar a esperar
+        """
+        self.flight_dir = flight_dir
+        self.wait = wait
+        self.reuse = reuse
+    
+    @staticmethod
+    def key(*parts: str) -> str:
+        return hashlib.sha256("\n".join(parts).encode('utf-8')).hexdigest()
+    
+    def run(self, key: str, call: Callable[[], Dict[str, Any]], reuse: bool = True) -> Dict[str, Any]:
+        """
+        Executa call() ou, se um pedido igual já estiver em curso, espera pela resposta dele.
+        
+        Args:
+            key: Identificador da pergunta (ver key())
+            call: Faz o pedido e devolve o resultado no formato de ask_question
+            reuse: Aceitar também respostas publicadas há menos de `reuse` segundos
+            
+        Returns:
+            Resultado de call(), ou {"success": True, "answer": ..., "shared": ...} com a
+            resposta publicada por outro processo: "shared" é "inflight" se o pedido dele estava
+            em curso quando este começou e "recent" se já tinha terminado (janela `reuse`)
+        """
+        started = time.time()
+        try:
+            os.makedirs(self.flight_dir, exist_ok=True)
+            fd = self._acquire(os.path.join(self.flight_dir, f"{key}.lock"), started + self.wait)
+        except OSError:
+            fd = None
+        if fd is None:
+            # Espera esgotada ou sistema de ficheiros sem flock: sem partilha
+            return call()
+        try:
+            entry = self._published(key, started - (self.reuse if reuse else 0))
+            if entry is not None:
+                # Publicada depois de começar a esperar: o pedido estava em curso noutro processo
+                shared = "inflight" if entry['publishedAt'] >= started else "recent"
+                return {"success": True, "answer": entry['answer'], "shared": shared}
+            result = call()
+            answer = result.get('answer') or result.get('Answer')
+            if result.get('success') and answer:
+                self._publish(key, answer)
+            return result
+        finally:
+            os.close(fd)
+            self._prune()
+    
+    def _acquire(self, lock_path: str, deadline: float) -> Optional[int]:
+        """
+        Descritor do lock da pergunta com o flock obtido, ou None se a espera terminar antes.
+        
+        _prune remove locks (sempre com o flock obtido): quem os tenha aberto antes e obtenha
+        depois o flock fica com um ficheiro que já não está no directório e volta a abri-lo, para
+        não haver dois processos a fazer o mesmo pedido.
+        """
+        while True:
+            # Só leitura: basta para o flock e funciona com locks criados por outros utilizadores
+            fd = os.open(lock_path, os.O_RDONLY | os.O_CREAT, 0o666)
+            try:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.time() >= deadline:
+                            os.close(fd)
+                            return None
+                        time.sleep(self.POLL_INTERVAL)
+                if self._same_file(fd, lock_path):
+                    return fd
+            except OSError:
+                os.close(fd)
+                raise
+            os.close(fd)
+    
+    @staticmethod
+    def _same_file(fd: int, path: str) -> bool:
+        """Se o descritor ainda é o ficheiro que está no caminho indicado."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        opened = os.fstat(fd)
+        return (st.st_dev, st.st_ino) == (opened.st_dev, opened.st_ino)
+    
+    def _published(self, key: str, since: float) -> Optional[Dict[str, Any]]:
+        """Entrada ({"answer", "publishedAt"}) publicada para a pergunta depois de `since`, ou None."""
+        try:
+            with open(os.path.join(self.flight_dir, f"{key}.json"), 'r') as f:
+                entry = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return None
+        if not isinstance(entry, dict) or entry.get('publishedAt', 0) < since or not entry.get('answer'):
+            return None
+        return entry
+    
+    def _publish(self, key: str, answer: str):
+        path = os.path.join(self.flight_dir, f"{key}.json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({"answer": answer, "publishedAt": time.time()}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except (IOError, OSError):
+            AnswerCache._remove(tmp_path)
+    
+    def _age(self, path: str) -> float:
+        try:
+            return time.time() - os.path.getmtime(path)
+        except OSError:
+            return float("inf")
+    
+    def _prune(self):
+        """
+        Remove as respostas que já ninguém pode aceitar e os respectivos locks. Cada lock só é
+        removido com o seu flock obtido, ou seja, sem nenhum pedido em curso nem à espera dele
+        (ver _acquire); locks ocupados ficam para a próxima vez.
+        """
+        retention = max(self.reuse, self.wait)
+        try:
+            names = os.listdir(self.flight_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.flight_dir, name)
+            if name.endswith(".tmp"):
+                if self._age(path) > self.STALE_AFTER:
+                    AnswerCache._remove(path)
+                continue
+            if not name.endswith(".lock"):
+                continue
+            result_path = f"{path[:-len('.lock')]}.json"
+            if self._age(result_path) < retention:
+                continue
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # Com o flock ninguém publica: a idade da resposta já não muda
+                if self._same_file(fd, path) and self._age(result_path) >= retention:
+                    AnswerCache._remove(result_path)
+                    os.remove(path)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+# Reutilização de respostas a perguntas semelhantes (config.json, chave "similar_answers")
+DEFAULT_SIMILAR_ANSWERS_CONFIG = {
+    "enabled": True,
+    "threshold": 0.75,        # Semelhança mínima (cosseno TF-IDF) para reutilizar uma resposta
+    "mode": "offer",          # "offer": perguntar ao utilizador; "auto": reutilizar sem perguntar
+    "max_entries": 50000,     # Perguntas guardadas no índice antes de compactar
+}
+
+# Palavras ignoradas na comparação de perguntas (pt, en, es e termos comuns a todas as perguntas)
+SIMILARITY_STOPWORDS = frozenset("""
+a o as os um uma uns umas de do da dos das em no na nos nas ao aos para por com como que se e ou
+é eu meu minha qual quais onde quando posso pode fazer usar todos todas
+the an of to in on at for with how do does did i can could what which is are my me and or by
+from use using all get
+el la los las un unos unas del en con cómo que y es mi puedo hacer
+linux comando comandos command commands terminal shell bash
+""".split())
+
+def similarity_terms(text: str) -> List[str]:
+    """Extrai os termos relevantes de uma pergunta (minúsculas, sem stopwords, plural simples)."""
+    terms = set()
+    for word in re.findall(r"\w+", text.lower()):
+        if len(word) < 2 or word in SIMILARITY_STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s'):
+            word = word[:-1]
+        terms.add(word)
+    return sorted(terms)
+
+class SimilarityIndex:
+    """
+    Índice TF-IDF incremental das perguntas já respondidas.
+    
+    As perguntas e respostas ficam num ficheiro JSONL só de acréscimo. O índice invertido tem
+    duas partes: uma base (index.bin) com o léxico ordenado, as postings e os termos de cada
+    pergunta em arrays de tamanho fixo, mapeada em memória como o ManPageIndex, pelo que só as
+    entradas do léxico e as postings dos termos pesquisados são lidas do disco; e um registo só
+    de acréscimo (index.log), com uma linha por pergunta indexada depois da base. Quando o
+    registo cresce, os dois são fundidos numa base nova; a geração gravada na base e no início
+    do registo impede que um registo seja lido com outra base.
+    """
+    
+    VERSION = 2
+    MAGIC = b"MANAISX2"
+    HEADER = struct.Struct("<8sQ")       # magic, tamanho dos metadados
+    # Arrays da base, pela ordem no ficheiro (os de 8 bytes primeiro, para ficarem alinhados)
+    SECTIONS = (("doc_offsets", "Q"), ("term_offsets", "I"), ("post_offsets", "I"), ("postings", "I"),
+                ("doc_term_offsets", "I"), ("doc_terms", "I"), ("doc_langs", "B"), ("terms", "B"))
+    CANDIDATES = 16      # Perguntas avaliadas com o cosseno exacto após a pontuação parcial
+    MERGE_MIN = 256      # Perguntas no registo antes de o fundir com a base...
+    MERGE_RATIO = 0.125  # ...ou esta fracção das perguntas da base, se for maior
+    
+    def __init__(self, index_dir: str, max_entries: int = DEFAULT_SIMILAR_ANSWERS_CONFIG["max_entries"]):
+        """
+        Args:
+            index_dir: Directório do índice
+            max_entries: Perguntas guardadas antes de compactar (mantém as mais recentes)
+        """
+        self.index_dir = index_dir
+        self.max_entries = max_entries
+        self.docs_file = os.path.join(index_dir, "docs.jsonl")
+        self.index_file = os.path.join(index_dir, "index.bin")
+        self.log_file = os.path.join(index_dir, "index.log")
+        self.lock_file = os.path.join(index_dir, "index.lock")
+        self._mmap = None
+        self._stat = None
+        self._views: Dict[str, memoryview] = {}
+        self.generation = 0
+        self.langs: List[str] = []
+        self.base_docs = 0
+        self.nterms = 0
+        self._reset_log()
+    
+    def _reset_log(self, key: Optional[Tuple[int, int]] = None):
+        self.tail_docs: List[Tuple[int, str, List[str]]] = []    # (offset, idioma, termos)
+        self.tail_postings: Dict[str, List[int]] = {}
+        self._log_key = key
+        self._log_pos = 0
+        self._log_valid = False
+    
+    def _load(self):
+        """Mapeia a base (de novo, se tiver sido substituída) e lê o que o registo tiver de novo."""
+        try:
+            st = os.stat(self.index_file)
+            key = (st.st_mtime_ns, st.st_ino)
+        except OSError:
+            key = None
+        if key != self._stat:
+            self.close()
+            self._stat = key
+            if key is not None:
+                self._map_base()
+        self._read_log()
+    
+    def _map_base(self):
+        try:
+            with open(self.index_file, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        try:
+            magic, meta_len = self.HEADER.unpack_from(mm, 0)
+            meta = marshal.loads(mm[self.HEADER.size:self.HEADER.size + meta_len]) if magic == self.MAGIC else {}
+        except (ValueError, EOFError, TypeError, struct.error):
+            meta = {}
+        if not isinstance(meta, dict) or meta.get("version") != self.VERSION:
+            # Formato antigo ou ficheiro danificado: a próxima add() reconstrói a partir de docs.jsonl
+            mm.close()
+            return
+        
+        self._mmap = mm
+        self.generation, self.langs = meta["generation"], meta["langs"]
+        self.base_docs, self.nterms = meta["docs"], meta["nterms"]
+        view = memoryview(mm)
+        at = self.HEADER.size + meta_len
+        for (name, code), length in zip(self.SECTIONS, meta["sections"]):
+            self._views[name] = view[at:at + length].cast(code)
+            at += length
+        view.release()
+    
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        self._views = {}
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # Ainda há vistas em uso; o mapeamento é libertado com elas
+        self._mmap, self._stat = None, None
+        self.generation, self.langs, self.base_docs, self.nterms = 0, [], 0, 0
+        self._reset_log()
+    
+    def _read_log(self):
+        """Indexa as perguntas acrescentadas ao registo desde a última leitura."""
+        try:
+            with open(self.log_file, 'rb') as f:
+                st = os.fstat(f.fileno())
+                key = (st.st_ino, self.generation)
+                if key != self._log_key or st.st_size < self._log_pos:
+                    self._reset_log(key)
+                f.seek(self._log_pos)
+                data = f.read()
+        except OSError:
+            self._reset_log()
+            return
+        
+        # Uma linha sem fim ainda está a ser escrita por outro processo
+        end = data.rfind(b'\n') + 1
+        self._log_pos += end
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                # Cabeçalho: só vale o registo começado para esta base
+                self._log_valid = self._mmap is not None and record.get("g") == self.generation
+            elif self._log_valid and isinstance(record, list) and len(record) == 3:
+                offset, language, terms = record
+                doc_id = self.base_docs + len(self.tail_docs)
+                self.tail_docs.append((offset, language, terms))
+                for term in terms:
+                    self.tail_postings.setdefault(term, []).append(doc_id)
+    
+    def __len__(self) -> int:
+        self._load()
+        return self.base_docs + len(self.tail_docs)
+    
+    def _idf(self, df: int, ndocs: int) -> float:
+        return math.log((ndocs + 1) / (df + 1)) + 1.0
+    
+    def _term(self, term_id: int) -> bytes:
+        offsets = self._views["term_offsets"]
+        return self._views["terms"][offsets[term_id]:offsets[term_id + 1]].tobytes()
+    
+    def _term_id(self, term: str) -> Optional[int]:
+        """Procura binária do termo no léxico ordenado da base."""
+        key = term.encode('utf-8')
+        lo, hi = 0, self.nterms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.nterms and self._term(lo) == key else None
+    
+    def _base_postings(self, term_id: Optional[int]) -> Sequence[int]:
+        if term_id is None:
+            return ()
+        offsets = self._views["post_offsets"]
+        return self._views["postings"][offsets[term_id]:offsets[term_id + 1]]
+    
+    def _doc_norm(self, doc_id: int, ndocs: int) -> float:
+        """Norma TF-IDF de uma pergunta indexada."""
+        if doc_id >= self.base_docs:
+            dfs = [len(self._base_postings(self._term_id(term))) + len(self.tail_postings.get(term, ()))
+                   for term in self.tail_docs[doc_id - self.base_docs][2]]
+        else:
+            offsets = self._views["doc_term_offsets"]
+            dfs = [len(self._base_postings(term_id)) + len(self.tail_postings.get(self._term(term_id).decode('utf-8'), ()))
+                   for term_id in self._views["doc_terms"][offsets[doc_id]:offsets[doc_id + 1]]]
+        return math.sqrt(sum(self._idf(df, ndocs) ** 2 for df in dfs))
+    
+    def _read_doc(self, doc_id: int) -> Optional[Dict[str, Any]]:
+        if doc_id >= self.base_docs:
+            offset = self.tail_docs[doc_id - self.base_docs][0]
+        else:
+            offset = self._views["doc_offsets"][doc_id]
+        try:
+            with open(self.docs_file, 'rb') as f:
+                f.seek(offset)
+                return json.loads(f.readline())
+        except (IOError, OSError, ValueError):
+            return None
+    
+    def search(self, question: str, language: str, threshold: float) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """
+        Procura a pergunta guardada mais semelhante no mesmo idioma.
+        
+        Returns:
+            (semelhança, entrada) se a semelhança for >= threshold, senão None
+        """
+        ndocs = len(self)
+        terms = similarity_terms(question)
+        if not ndocs or not terms:
+            return None
+        base_lang = self.langs.index(language) if language in self.langs else -1
+        
+        # Pontuação parcial (produto interno) a partir das postings dos termos conhecidos
+        query_norm = 0.0
+        scores: Dict[int, float] = {}
+        for term in terms:
+            base_postings = self._base_postings(self._term_id(term)) if self.nterms else ()
+            tail_postings = self.tail_postings.get(term, ())
+            idf = self._idf(len(base_postings) + len(tail_postings), ndocs)
+            query_norm += idf * idf
+            weight = idf * idf
+            if base_lang >= 0:
+                doc_langs = self._views["doc_langs"]
+                for doc_id in base_postings:
+                    if doc_langs[doc_id] == base_lang:
+                        scores[doc_id] = scores.get(doc_id, 0.0) + weight
+            for doc_id in tail_postings:
+                if self.tail_docs[doc_id - self.base_docs][1] == language:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weight
+        if not scores:
+            return None
+        
+        # Cosseno exacto só para os melhores candidatos
+        best_score, best_doc = 0.0, None
+        query_norm = math.sqrt(query_norm)
+        for doc_id, dot in heapq.nlargest(self.CANDIDATES, scores.items(), key=lambda item: item[1]):
+            doc_norm = self._doc_norm(doc_id, ndocs)
+            score = dot / (query_norm * doc_norm) if doc_norm else 0.0
+            if score > best_score:
+                best_score, best_doc = score, doc_id
+        
+        if best_doc is None or best_score < threshold:
+            return None
+        entry = self._read_doc(best_doc)
+        return (best_score, entry) if entry else None
+    
+    def add(self, question: str, language: str, answer: str):
+        """
+        Acrescenta uma pergunta respondida ao índice: uma linha em docs.jsonl e outra no registo,
+        sem regravar a base (que só é reescrita ao fundir o registo ou ao compactar).
+        """
+        terms = similarity_terms(question)
+        if not terms:
+            return
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            with open(self.lock_file, 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                # Incluir respostas acrescentadas por outros processos
+                self._load()
+                if self._mmap is None:
+                    self._rebuild()
+                
+                existing = self.search(question, language, 0.999)
+                if existing and AnswerCache.normalize(existing[1].get('q', '')) == AnswerCache.normalize(question):
+                    return
+                
+                if len(self) >= self.max_entries:
+                    self._rebuild(keep=int(self.max_entries * 0.8))
+                
+                line = json.dumps({'q': question, 'l': language, 'a': answer, 't': time.time()},
+                                  separators=(',', ':')).encode('utf-8') + b'\n'
+                with open(self.docs_file, 'ab') as f:
+                    offset = f.tell()
+                    f.write(line)
+                with open(self.log_file, 'ab') as f:
+                    f.write(json.dumps([offset, language, terms], separators=(',', ':')).encode('utf-8') + b'\n')
+                
+                self._read_log()
+                if len(self.tail_docs) >= max(self.MERGE_MIN, self.base_docs * self.MERGE_RATIO):
+                    self._merge()
+        except (IOError, OSError):
+            # O índice é apenas uma optimização; falhas de escrita não afectam a resposta
+            self.close()
+    
+    def _merge(self):
+        """Funde o registo com a base numa base nova (com o lock do índice)."""
+        entries = []
+        offsets = self._views["doc_term_offsets"]
+        terms = [self._term(term_id).decode('utf-8') for term_id in range(self.nterms)]
+        for doc_id in range(self.base_docs):
+            entries.append((self._views["doc_offsets"][doc_id], self.langs[self._views["doc_langs"][doc_id]],
+                            [terms[t] for t in self._views["doc_terms"][offsets[doc_id]:offsets[doc_id + 1]]]))
+        entries.extend(self.tail_docs)
+        self._write_base(entries)
+    
+    def _rebuild(self, keep: Optional[int] = None):
+        """
+        Reconstrói a base a partir de docs.jsonl (com o lock do índice), mantendo apenas as
+        `keep` perguntas mais recentes, se indicado. Também converte índices de versões antigas.
+        """
+        try:
+            with open(self.docs_file, 'rb') as f:
+                lines = [line for line in f if line.endswith(b'\n')]
+        except (IOError, OSError):
+            lines = []
+        if keep is not None:
+            lines = lines[-keep:] if keep else []
+            tmp_path = f"{self.docs_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.writelines(lines)
+            os.replace(tmp_path, self.docs_file)
+        
+        entries = []
+        offset = 0
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = None
+            if isinstance(entry, dict):
+                entries.append((offset, entry.get('l', ''), similarity_terms(entry.get('q', ''))))
+            offset += len(line)
+        self._write_base(entries)
+    
+    def _write_base(self, entries: List[Tuple[int, str, List[str]]]):
+        """Grava uma base nova com as perguntas indicadas e começa um registo vazio para ela."""
+        vocab = sorted({term for _, _, terms in entries for term in terms})
+        term_ids = {term: i for i, term in enumerate(vocab)}
+        langs = sorted({language for _, language, _ in entries})
+        lang_ids = {language: i for i, language in enumerate(langs)}
+        
+        postings = [array('I') for _ in vocab]
+        doc_offsets = array('Q')
+        doc_term_offsets = array('I', [0])
+        doc_terms = array('I')
+        doc_langs = bytearray()
+        for doc_id, (offset, language, terms) in enumerate(entries):
+            doc_offsets.append(offset)
+            doc_langs.append(lang_ids[language])
+            for term in terms:
+                postings[term_ids[term]].append(doc_id)
+                doc_terms.append(term_ids[term])
+            doc_term_offsets.append(len(doc_terms))
+        
+        term_offsets = array('I', [0])
+        terms_data = bytearray()
+        for term in vocab:
+            terms_data += term.encode('utf-8')
+            term_offsets.append(len(terms_data))
+        post_offsets = array('I', [0])
+        postings_data = array('I')
+        for doc_ids in postings:
+            postings_data.extend(doc_ids)
+            post_offsets.append(len(postings_data))
+        
+        sections = [doc_offsets.tobytes(), term_offsets.tobytes(), post_offsets.tobytes(),
+                    postings_data.tobytes(), doc_term_offsets.tobytes(), doc_terms.tobytes(),
+                    bytes(doc_langs), bytes(terms_data)]
+        generation = time.time_ns()
+        meta = marshal.dumps({
+            "version": self.VERSION,
+            "generation": generation,
+            "langs": langs,
+            "docs": len(entries),
+            "nterms": len(vocab),
+            "sections": [len(data) for data in sections],
+        })
+        meta += b"\0" * (-(self.HEADER.size + len(meta)) % 8)  # doc_offsets alinhados a 8 bytes
+        
+        tmp_path = f"{self.index_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, len(meta)))
+            f.write(meta)
+            for data in sections:
+                f.write(data)
+        os.replace(tmp_path, self.index_file)
+        
+        # Registo novo para a nova base; um leitor com o registo antigo ignora-o pela geração
+        tmp_path = f"{self.log_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps({"g": generation}).encode('utf-8') + b'\n')
+        os.replace(tmp_path, self.log_file)
+        self.close()
+        self._load()
+
+# Índice local das páginas man (pode ser sobreposto em config.json, chave "man_index")
+DEFAULT_MAN_INDEX_CONFIG = {
+    "enabled": True,
+    "paths": [],                 # Vazio: $MANPATH ou /usr/share/man e /usr/local/share/man
+    "sections": ["1", "8"],      # Secções indexadas (comandos de utilizador e de administração)
+    "answer_locally": False,     # Responder com as páginas man sem perguntar ao agente quando o resultado
+                                 # é claro; por omissão os excertos só aparecem com --offline ou sem ligação
+    "threshold": 1.0,            # Fracção do peso (IDF) dos termos da pergunta que o excerto tem de conter...
+    "margin": 0.5,               # ...com a pontuação BM25 acima da do excerto seguinte nesta proporção...
+                                 # ...e o nome da página (o comando) entre os termos da pergunta
+    "max_results": 3,            # Excertos mostrados numa resposta local
+}
+
+# Caracteres especiais do roff (\(xx e \[xx]) mais comuns nas páginas man
+ROFF_CHARS = {
+    "em": "—", "en": "–", "hy": "-", "mi": "-", "aq": "'", "dq": '"', "lq": '"', "rq": '"',
+    "oq": "'", "cq": "'", "ga": "`", "ti": "~", "ha": "^", "rs": "\\", "bu": "•", "co": "©",
+    "Lq": '"', "Rq": '"', "la": "<", "ra": ">", "<=": "<=", ">=": ">=", "mu": "x",
+}
+
+# Macros de texto do mdoc (páginas BSD) que não produzem texto visível
+MDOC_SILENT = frozenset("Ar Op Oo Oc Pa Cm Ns Ql Li Em Sy Dq Sq Pq Ic Ev Va Dv Xr Ft Fn Fa Ta Ap No".split())
+
+def roff_to_text(line: str) -> str:
+    """Converte uma linha de texto roff em texto simples (sem fontes nem escapes)."""
+    line = re.sub(r"\\f(\[[^\]]*\]|\(..|.)", "", line)
+    line = re.sub(r"\\s[+-]?\d+", "", line)
+    line = re.sub(r"\\\*?\((..)", lambda m: ROFF_CHARS.get(m.group(1), ""), line)
+    line = re.sub(r"\\\*?\[([^\]]*)\]", lambda m: ROFF_CHARS.get(m.group(1), ""), line)
+    line = line.replace("\\e", "\\\\")
+    line = re.sub(r"\\[&,/%|^c]", "", line)
+    line = re.sub(r"\\(.)", r"\1", line)
+    return line.strip()
+
+def _macro_text(macro: str, arg: str) -> str:
+    """Texto produzido por uma macro de formatação (.B, .BR, .Fl, ...)."""
+    words = re.findall(r'"[^"]*"|\S+', arg)
+    words = [w[1:-1] if w.startswith('"') else w for w in words]
+    if macro in ("BR", "RB", "BI", "IB", "IR", "RI"):
+        return roff_to_text("".join(words))
+    if macro in ("B", "I", "SM", "SB", "Nm", "Nd", "Dl"):
+        return roff_to_text(" ".join(words))
+    if macro == "Fl" or macro[:1].isupper():
+        # mdoc: "Fl x Ar file" -> "-x file"
+        out = []
+        prefix = "-" if macro == "Fl" else ""
+        for word in words:
+            if word == "Fl":
+                prefix = "-"
+            elif word in MDOC_SILENT:
+                continue
+            else:
+                out.append(prefix + word)
+                prefix = ""
+        return roff_to_text(" ".join(out))
+    return ""
+
+def parse_man_page(text: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Extrai o resumo (secção NAME) e os itens documentados de uma página man.
+    
+    Reconhece listas do man(7) (.TP/.IP) e do mdoc(7) (.It). Cada item é um par
+    (termo, descrição), em que o termo é normalmente uma opção (ex.: "-a, --all").
+    
+    Returns:
+        (resumo, [(termo, descrição), ...])
+    """
+    summary: List[str] = []
+    items: List[Tuple[str, str]] = []
+    section = ""
+    term: Optional[str] = None
+    desc: List[str] = []
+    pending_term = False
+    
+    def flush():
+        if term and desc and len(term) <= 80:
+            items.append((term, " ".join(desc)[:400]))
+    
+    for raw in text.splitlines():
+        if raw.startswith(('.\\"', "'\\\"", '.\\}')):
+            continue
+        if raw.startswith(('.', "'")):
+            parts = raw[1:].strip().split(None, 1)
+            macro = parts[0] if parts else ""
+            arg = parts[1] if len(parts) > 1 else ""
+            if macro in ("SH", "Sh"):
+                flush()
+                term, desc = None, []
+                section = arg.strip('"').upper()
+                continue
+            if macro in ("TP", "TQ"):
+                if macro == "TP":
+                    flush()
+                    term, desc = None, []
+                pending_term = True
+                continue
+            if macro == "IP":
+                label = arg.split('"')[1] if arg.startswith('"') else (arg.split() or [""])[0]
+                label = roff_to_text(label)
+                if label and label not in ("•", "-", "*"):
+                    flush()
+                    term, desc = label, []
+                # .IP sem termo (ou com um marcador) continua a descrição do item actual
+                continue
+            if macro == "It":
+                flush()
+                term, desc = _macro_text("It", arg) or None, []
+                continue
+            if macro in ("PP", "P", "LP", "SS", "Ss", "El"):
+                flush()
+                term, desc = None, []
+                continue
+            line = _macro_text(macro, arg)
+            if not line:
+                continue
+            if macro == "Nd":
+                line = f"- {line}"
+        else:
+            line = roff_to_text(raw)
+            if not line:
+                continue
+        
+        if pending_term:
+            # Com .TQ, o termo seguinte junta-se ao anterior (ex.: -a seguido de --all)
+            term = f"{term}, {line}" if term and not desc else line
+            pending_term = False
+        elif section == "NAME":
+            summary.append(line)
+        elif term is not None and len(desc) < 12:
+            desc.append(line)
+    flush()
+    return " ".join(summary), items
+
+def man_terms(text: str) -> List[str]:
+    """Termos de pesquisa no índice man: os de similarity_terms mais nomes compostos (ex.: apt-get)."""
+    terms = set(similarity_terms(text))
+    terms.update(w.strip("-") for w in re.findall(r"\w[\w.+]*-[\w.+-]*\w", text.lower()))
+    return sorted(terms)
+
+class ManPageIndex:
+    """
+    Índice invertido das páginas man instaladas, para respostas locais e sem rede.
+    
+    Cada item documentado de uma página (normalmente uma opção) e o resumo NAME são documentos.
+    Tudo fica num único ficheiro (substituído de forma atómica): cabeçalho, metadados marshal
+    (léxico, offsets e manifesto dos ficheiros), postings uint32 e documentos JSON. O ficheiro
+    é mapeado em memória, pelo que só as postings dos termos pesquisados são lidas do disco.
+    A reconstrução é incremental: páginas com o mesmo mtime e tamanho reaproveitam os
+    documentos já extraídos em vez de voltar a descomprimir e interpretar o roff.
+    """
+    
+    VERSION = 1
+    MAGIC = b"MANAIMX1"
+    HEADER = struct.Struct("<8sQQQ")      # magic, tamanho dos metadados, das postings e dos documentos
+    K1, B = 1.2, 0.75                     # Parâmetros BM25
+    DEFAULT_PATHS = ["/usr/share/man", "/usr/local/share/man"]
+    
+    def __init__(self, index_file: str, paths: Optional[List[str]] = None,
+                 sections: Optional[List[str]] = None):
+        """
+        Args:
+            index_file: Ficheiro do índice
+            paths: Directórios de páginas man (por omissão $MANPATH ou DEFAULT_PATHS)
+            sections: Secções a indexar (ex.: ["1", "8"])
+        """
+        self.index_file = index_file
+        self.lock_file = f"{index_file}.lock"
+        if not paths:
+            paths = [p for p in os.environ.get("MANPATH", "").split(":") if p] or self.DEFAULT_PATHS
+        self.paths = paths
+        self.sections = sections or DEFAULT_MAN_INDEX_CONFIG["sections"]
+        self._mmap = None
+        self._stat = None
+        self.meta: Dict[str, Any] = {}
+    
+    def _load(self) -> bool:
+        """Mapeia o ficheiro do índice (de novo, se tiver sido reconstruído entretanto)."""
+        try:
+            st = os.stat(self.index_file)
+        except OSError:
+            self.close()
+            return False
+        if self._mmap is not None and (st.st_mtime_ns, st.st_ino) == self._stat:
+            return True
+        self.close()
+        try:
+            with open(self.index_file, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, meta_len, postings_len, docs_len = self.HEADER.unpack_from(mm, 0)
+            meta = marshal.loads(mm[self.HEADER.size:self.HEADER.size + meta_len])
+            if magic != self.MAGIC or meta.get("version") != self.VERSION:
+                mm.close()
+                return False
+        except (OSError, ValueError, EOFError, TypeError, struct.error):
+            return False
+        
+        self._mmap, self._stat, self.meta = mm, (st.st_mtime_ns, st.st_ino), meta
+        self._postings_at = self.HEADER.size + meta_len
+        self._docs_at = self._postings_at + postings_len
+        self.doc_offsets = array('Q')
+        self.doc_offsets.frombytes(meta["doc_offsets"])
+        self.doc_lengths = array('H')
+        self.doc_lengths.frombytes(meta["doc_lengths"])
+        return True
+    
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap, self._stat, self.meta = None, None, {}
+    
+    def __len__(self) -> int:
+        return len(self.doc_offsets) - 1 if self._load() else 0
+    
+    def _read_doc(self, doc_id: int) -> Dict[str, Any]:
+        start = self._docs_at + self.doc_offsets[doc_id]
+        end = self._docs_at + self.doc_offsets[doc_id + 1]
+        return json.loads(self._mmap[start:end])
+    
+    def _postings(self, term: str) -> memoryview:
+        offset, count = self.meta["terms"].get(term, (0, 0))
+        start = self._postings_at + offset * 4
+        return memoryview(self._mmap)[start:start + count * 4].cast('I')
+    
+    def _idf(self, df: int, ndocs: int) -> float:
+        return math.log(1 + (ndocs - df + 0.5) / (df + 0.5))
+    
+    def search(self, question: str, limit: int = 3) -> List[Tuple[float, float, Dict[str, Any]]]:
+        """
+        Procura os itens das páginas man mais relevantes para a pergunta (BM25).
+        
+        A confiança de cada resultado é a fracção do peso (IDF) dos termos da pergunta que o
+        item contém; termos que não existem em nenhuma página contam com o peso máximo.
+        
+        Returns:
+            Lista de (pontuação, confiança, documento), por ordem decrescente de pontuação
+        """
+        terms = man_terms(question)
+        if not terms or not self._load():
+            return []
+        ndocs = len(self.doc_offsets) - 1
+        avgdl = self.meta["avgdl"] or 1.0
+        
+        total_idf = 0.0
+        scores: Dict[int, float] = {}
+        matched: Dict[int, float] = {}
+        for term in terms:
+            postings = self._postings(term)
+            idf = self._idf(len(postings), ndocs)
+            total_idf += idf
+            for doc_id in postings:
+                norm = 1 + self.K1 * (1 - self.B + self.B * self.doc_lengths[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * (self.K1 + 1) / norm
+                matched[doc_id] = matched.get(doc_id, 0.0) + idf
+            postings.release()
+        
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(score, matched[doc_id] / total_idf, self._read_doc(doc_id)) for doc_id, score in best]
+    
+    def _man_files(self) -> Dict[str, Tuple[str, str, int, int]]:
+        """Ficheiros de páginas man a indexar: caminho -> (página, secção, mtime_ns, tamanho)."""
+        files = {}
+        seen = set()
+        for root in self.paths:
+            for section in self.sections:
+                try:
+                    entries = list(os.scandir(os.path.join(root, f"man{section}")))
+                except OSError:
+                    continue
+                for entry in sorted(entries, key=lambda e: e.name):
+                    # Ligações simbólicas são aliases de outras páginas, já indexadas
+                    if entry.is_symlink() or not entry.is_file():
+                        continue
+                    name = re.sub(r"\.(gz|bz2|xz)$", "", entry.name)
+                    page, _, page_section = name.rpartition(".")
+                    if not page or (page, page_section) in seen:
+                        continue
+                    seen.add((page, page_section))
+                    st = entry.stat()
+                    files[entry.path] = (page, page_section, st.st_mtime_ns, st.st_size)
+        return files
+    
+    @staticmethod
+    def _parse_file(path: str, page: str, section: str) -> List[Dict[str, Any]]:
+        """Extrai os documentos (resumo e itens) de um ficheiro de página man."""
+        if path.endswith(".gz"):
+            import gzip as opener
+        elif path.endswith(".bz2"):
+            import bz2 as opener
+        elif path.endswith(".xz"):
+            import lzma as opener
+        else:
+            opener = None
+        try:
+            with (opener.open(path, 'rb') if opener else open(path, 'rb')) as f:
+                text = f.read().decode('utf-8', errors='replace')
+        except (OSError, EOFError, ValueError):
+            return []
+        if text.lstrip().startswith(".so "):
+            return []  # Página que apenas inclui outra
+        
+        summary, items = parse_man_page(text)
+        docs = [{"p": page, "s": section, "o": "", "t": summary}] if summary else []
+        docs.extend({"p": page, "s": section, "o": term, "t": desc} for term, desc in items)
+        return docs
+    
+    def build(self, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+        """
+        Constrói ou actualiza o índice. Só as páginas novas ou alteradas são interpretadas.
+        
+        Args:
+            progress: Função chamada com (páginas processadas, total)
+            
+        Returns:
+            Contadores: pages, parsed, reused, removed, docs, terms
+        """
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        with open(self.lock_file, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            files = self._man_files()
+            previous = self.meta.get("files", {}) if self._load() else {}
+            stats = {"pages": len(files), "parsed": 0, "reused": 0,
+                     "removed": len(set(previous) - set(files)), "docs": 0, "terms": 0}
+            
+            unchanged = set(previous) == set(files) and all(
+                tuple(previous[path][:2]) == info[2:] for path, info in files.items())
+            if unchanged:
+                stats.update(reused=len(files), docs=len(self), terms=len(self.meta["terms"]))
+                return stats
+            
+            postings: Dict[str, array] = {}
+            doc_offsets = array('Q', [0])
+            doc_lengths = array('H')
+            docs_data = bytearray()
+            manifest = {}
+            for n, (path, (page, section, mtime, size)) in enumerate(files.items()):
+                old = previous.get(path)
+                if old and tuple(old[:2]) == (mtime, size):
+                    docs = [self._read_doc(doc_id) for doc_id in range(old[2], old[2] + old[3])]
+                    stats["reused"] += 1
+                else:
+                    docs = self._parse_file(path, page, section)
+                    stats["parsed"] += 1
+                
+                manifest[path] = (mtime, size, len(doc_lengths), len(docs))
+                for doc in docs:
+                    doc_id = len(doc_lengths)
+                    terms = set(man_terms(f"{doc['o']} {doc['t']}"))
+                    terms.update(man_terms(page))
+                    terms.add(page.lower())
+                    for term in terms:
+                        postings.setdefault(term, array('I')).append(doc_id)
+                    doc_lengths.append(min(len(terms), 65535))
+                    docs_data += json.dumps(doc, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                    doc_offsets.append(len(docs_data))
+                if progress:
+                    progress(n + 1, len(files))
+            
+            postings_data = bytearray()
+            lexicon = {}
+            for term, doc_ids in postings.items():
+                lexicon[term] = (len(postings_data) // 4, len(doc_ids))
+                postings_data += doc_ids.tobytes()
+            meta = marshal.dumps({
+                "version": self.VERSION,
+                "terms": lexicon,
+                "doc_offsets": doc_offsets.tobytes(),
+                "doc_lengths": doc_lengths.tobytes(),
+                "avgdl": sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0,
+                "files": manifest,
+            })
+            meta += b"\0" * (-len(meta) % 4)  # Postings alinhadas a 4 bytes
+            
+            tmp_path = f"{self.index_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, len(meta), len(postings_data), len(docs_data)))
+                f.write(meta)
+                f.write(postings_data)
+                f.write(docs_data)
+            os.replace(tmp_path, self.index_file)
+            self.close()
+            
+            stats.update(docs=len(doc_lengths), terms=len(lexicon))
+            return stats
+
+# Política de novas tentativas (pode ser sobreposta em config.json, chave "retry")
+DEFAULT_RETRY_CONFIG = {
+    "enabled": True,
+    "max_attempts": 3,                          # Tentativas no total (1 = sem novas tentativas)
+    "base_delay": 0.5,                          # Espera base do backoff exponencial (s)
+    "max_delay": 8.0,                           # Espera máxima entre tentativas (s)
+    "max_retry_after": 30.0,                    # Não esperar mais do que isto por um Retry-After (s)
+    "retry_statuses": [429, 500, 502, 503, 504],
+    "endpoints": {},                            # Sobreposições por endpoint, ex.: {"GetUsageStatistics": {"max_attempts": 5}}
+}
+
+# Endpoints sem efeitos secundários: podem ser repetidos automaticamente. Perguntas ao agente,
+# login e registo não são repetidos (salvo "idempotent": true na política do endpoint).
+IDEMPOTENT_ENDPOINTS = frozenset({
+    "ValidateToken", "CheckUsageLimit", "GetUserProfile", "GetTierConfiguration",
+    "GetUsageStatistics", "CheckFeatureAccess",
+})
+
+# Circuit breaker partilhado entre processos (pode ser sobreposto em config.json, chave "circuit_breaker")
+DEFAULT_CIRCUIT_BREAKER_CONFIG = {
+    "enabled": True,
+    "failure_threshold": 5,     # Falhas seguidas (timeouts, erros de ligação, 5xx) até abrir o circuito
+    "cooldown": 30.0,           # Segundos a falhar de imediato antes de voltar a experimentar o servidor
+}
+
+# Vários URLs base, um por região (config.json, chave "endpoints", ou --url URL1,URL2,...)
+DEFAULT_ENDPOINTS_CONFIG = {
+    "urls": [],                 # URLs base a usar quando --url não é indicado
+    "probe_interval": 300.0,    # Segundos entre rondas de sondas de saúde em segundo plano
+    "probe_timeout": 3.0,       # Timeout de cada sonda (s)
+    "ewma_alpha": 0.3,          # Peso da sonda mais recente na latência média de cada URL
+}
+
+# Respostas 5xx em que o pedido não chegou à function app: mesmo perguntas ao agente (não
+# idempotentes) podem ser repetidas noutro URL base
+FAILOVER_SAFE_STATUSES = frozenset({502, 503})
+
+# Timeouts por endpoint (podem ser sobrepostos em config.json, chave "timeouts")
+DEFAULT_TIMEOUT_CONFIG = {
+    "connect": 4.0,             # Timeout de ligação TCP/TLS (s)
+    "read": None,               # Timeout de leitura fixo (s); None = derivado da latência observada
+    "multiplier": 3.0,          # Timeout de leitura = p99 da latência observada x multiplier...
+    "floor": 5.0,               # ...com este mínimo...
+    "ceiling": 120.0,           # ...e este máximo (s)
+    "min_samples": 10,          # Amostras necessárias antes de usar o p99
+    "history_size": 200,        # Amostras guardadas por endpoint
+    "endpoints": {},            # Sobreposições por endpoint, ex.: {"GetUsageStatistics": {"read": 10}}
+}
+
+# Timeout de leitura enquanto não há histórico suficiente (as perguntas ao agente são lentas)
+INITIAL_READ_TIMEOUTS = {
+    "ManaiAgentFreemiumHttpTrigger": 120.0,
+    "ManaiAgentHttpTrigger": 120.0,
+}
+INITIAL_READ_TIMEOUT = 30.0
+
+# Timeout de leitura mínimo por endpoint, acima do "floor" global: uma pergunta ao agente não pode
+# ser repetida, pelo que um timeout curto demais gasta a quota sem mostrar resposta
+READ_TIMEOUT_FLOORS = {
+    "ManaiAgentFreemiumHttpTrigger": 30.0,
+    "ManaiAgentHttpTrigger": 30.0,
+}
+
+class LatencyHistory:
+    """
+    Histórico persistente da latência por endpoint (tempo até à resposta do servidor).
+    
+    Fica numa chave do StateStore. As amostras novas ficam em memória e são juntadas ao histórico
+    em flush(), numa transacção, para não escrever a cada pedido nem perder amostras de outros
+    processos.
+    """
+    
+    def __init__(self, store: "StateStore", key: str = "latency",
+                 history_size: int = DEFAULT_TIMEOUT_CONFIG["history_size"]):
+        """
+        Args:
+            store: Estado partilhado onde o histórico é guardado
+            key: Chave do histórico no estado
+            history_size: Amostras guardadas por endpoint
+        """
+        self.store = store
+        self.key = key
+        self.history_size = history_size
+        self._samples: Optional[Dict[str, List[float]]] = None
+        self._pending: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+    
+    def _read(self) -> Dict[str, List[float]]:
+        try:
+            samples = self.store.get(self.key)
+        except Exception:
+            samples = None
+        return samples if isinstance(samples, dict) else {}
+    
+    def percentile(self, endpoint: str, q: float, min_samples: int) -> Optional[float]:
+        """Percentil q (0-1) da latência do endpoint, ou None se houver menos de min_samples amostras."""
+        with self._lock:
+            if self._samples is None:
+                self._samples = self._read()
+            samples = self._samples.get(endpoint, []) + self._pending.get(endpoint, [])
+        if len(samples) < max(1, min_samples):
+            return None
+        samples = sorted(samples)
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+    
+    def record(self, endpoint: str, seconds: float):
+        with self._lock:
+            self._pending.setdefault(endpoint, []).append(round(seconds, 4))
+            pending = sum(len(v) for v in self._pending.values())
+        if pending >= 50:
+            # Processos de longa duração (daemon, batch) guardam o histórico periodicamente
+            self.flush()
+    
+    def flush(self):
+        """Junta as amostras novas ao histórico guardado."""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            
+            def merge(samples: Optional[Dict[str, List[float]]]) -> Dict[str, List[float]]:
+                samples = samples if isinstance(samples, dict) else {}
+                for endpoint, values in pending.items():
+                    samples[endpoint] = (samples.get(endpoint, []) + values)[-self.history_size:]
+                return samples
+            try:
+                self._samples = self.store.update(self.key, merge)
+            except Exception:
+                # O histórico é apenas uma optimização; sem ele usam-se os timeouts iniciais
+                pass
+
+class SharedState:
+    """
+    Estado por servidor numa chave do StateStore, partilhado por todos os processos: cada
+    alteração é um read-modify-write numa transacção, para não perder as de outros processos.
+    """
+    
+    def __init__(self, store: "StateStore", key: str):
+        self.store = store
+        self.key = key
+    
+    def _read(self) -> Dict[str, Dict[str, float]]:
+        """Estado actual de todos os servidores."""
+        try:
+            state = self.store.get(self.key)
+        except Exception:
+            state = None
+        return state if isinstance(state, dict) else {}
+    
+    def _update(self, key: str, change: Callable[[Dict[str, float]], bool]):
+        """Altera o estado de um servidor numa transacção (change devolve False se não alterou nada)."""
+        def apply(state: Optional[Dict[str, Dict[str, float]]]) -> Dict[str, Dict[str, float]]:
+            state = state if isinstance(state, dict) else {}
+            change(state.setdefault(key, {}))
+            return state
+        try:
+            self.store.update(self.key, apply)
+        except Exception:
+            # O estado é só uma optimização: sem ele o circuit breaker não abre e o router usa a ordem configurada
+            pass
+
+class CircuitBreaker(SharedState):
+    """
+    Circuit breaker persistente, partilhado por todos os processos através do StateStore.
+    
+    Depois de failure_threshold falhas seguidas num servidor, os pedidos falham de imediato durante
+    cooldown segundos. Terminado esse período, um único processo volta a experimentar o servidor
+    (half-open): se o pedido correr bem o circuito fecha, se falhar volta a abrir.
+    """
+    
+    def __init__(self, store: "StateStore", failure_threshold: int = DEFAULT_CIRCUIT_BREAKER_CONFIG["failure_threshold"],
+                 cooldown: float = DEFAULT_CIRCUIT_BREAKER_CONFIG["cooldown"]):
+        super().__init__(store, "circuit_breaker")
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+    
+    def retry_in(self, key: str) -> float:
+        """Segundos até o servidor voltar a aceitar pedidos (0 se o pedido pode avançar)."""
+        entry = self._read().get(key)
+        if not entry or entry.get("failures", 0) < self.failure_threshold:
+            return 0.0
+        remaining = entry.get("openUntil", 0) - time.time()
+        if remaining > 0:
+            return remaining
+        
+        # Half-open: só o processo que reservar a experiência avança, os restantes esperam mais um período
+        claimed = []
+        def claim(entry: Dict[str, float]) -> bool:
+            if entry.get("failures", 0) < self.failure_threshold or entry.get("openUntil", 0) > time.time():
+                return False
+            entry["openUntil"] = time.time() + self.cooldown
+            claimed.append(True)
+            return True
+        self._update(key, claim)
+        if claimed:
+            return 0.0
+        entry = self._read().get(key) or {}
+        return max(0.0, entry.get("openUntil", 0) - time.time())
+    
+    def record_success(self, key: str):
+        entry = self._read().get(key)
+        if not entry or not entry.get("failures"):
+            return
+        def reset(entry: Dict[str, float]) -> bool:
+            entry["failures"] = 0
+            entry["openUntil"] = 0
+            return True
+        self._update(key, reset)
+    
+    def record_failure(self, key: str):
+        def fail(entry: Dict[str, float]) -> bool:
+            entry["failures"] = entry.get("failures", 0) + 1
+            if entry["failures"] >= self.failure_threshold:
+                entry["openUntil"] = time.time() + self.cooldown
+            return True
+        self._update(key, fail)
+
+class EndpointRouter(SharedState):
+    """
+    Escolha entre vários URLs base (uma function app por região): o mais rápido dos saudáveis.
+    
+    A latência de cada URL é uma média exponencial (EWMA) das sondas de saúde ao endpoint de teste,
+    guardada no StateStore e partilhada pelos processos. As sondas correm numa thread em segundo
+    plano quando as últimas têm mais de probe_interval segundos, e só num processo de cada vez.
+    Um erro de ligação ou 5xx num pedido marca o URL como indisponível até uma sonda ou um pedido
+    voltarem a ter sucesso; os indisponíveis ficam no fim da lista, o que falhou há mais tempo primeiro.
+    """
+    
+    PROBE_KEY = "_probe"
+    
+    def __init__(self, urls: List[str], store: "StateStore",
+                 probe_interval: float = DEFAULT_ENDPOINTS_CONFIG["probe_interval"],
+                 ewma_alpha: float = DEFAULT_ENDPOINTS_CONFIG["ewma_alpha"]):
+        super().__init__(store, "endpoints")
+        self.urls = urls
+        self.probe_interval = probe_interval
+        self.ewma_alpha = ewma_alpha
+        self._probe_thread: Optional[threading.Thread] = None
+    
+    @staticmethod
+    def _healthy(entry: Dict[str, float]) -> bool:
+        return entry.get("failedAt", 0) <= entry.get("okAt", 0)
+    
+    def ranked(self) -> List[str]:
+        """URLs pela ordem a experimentar (empates e URLs ainda sem medições pela ordem configurada)."""
+        state = self._read()
+        
+        def key(item: Tuple[int, str]):
+            index, url = item
+            entry = state.get(url, {})
+            if self._healthy(entry):
+                return (0, entry.get("ewma", math.inf), index)
+            return (1, entry["failedAt"], index)
+        return [url for _, url in sorted(enumerate(self.urls), key=key)]
+    
+    def status(self) -> List[Dict[str, Any]]:
+        """Latência média e saúde de cada URL, pela ordem de preferência."""
+        state = self._read()
+        return [{"url": url, "ewma": state.get(url, {}).get("ewma"),
+                 "healthy": self._healthy(state.get(url, {}))} for url in self.ranked()]
+    
+    def record_success(self, url: str, latency: Optional[float] = None):
+        """Regista uma resposta do servidor; com latency (sondas), actualiza também a média."""
+        if latency is None and self._healthy(self._read().get(url, {})):
+            return  # Nada a alterar: não escrever o estado a cada pedido
+        
+        def change(entry: Dict[str, float]) -> bool:
+            if latency is not None:
+                previous = entry.get("ewma")
+                entry["ewma"] = round(latency if previous is None else
+                                      self.ewma_alpha * latency + (1 - self.ewma_alpha) * previous, 4)
+            entry["okAt"] = time.time()
+            return True
+        self._update(url, change)
+    
+    def record_failure(self, url: str):
+        def change(entry: Dict[str, float]) -> bool:
+            entry["failedAt"] = time.time()
+            return True
+        self._update(url, change)
+    
+    def probe_in_background(self, probe: Callable[[List[str]], Dict[str, Optional[float]]]):
+        """
+        Lança as sondas numa thread em segundo plano se as últimas tiverem mais de probe_interval
+        segundos. probe(urls) devolve a latência de cada URL (None se estiver indisponível).
+        """
+        if self._probe_thread is not None and self._probe_thread.is_alive():
+            return
+        if self._read().get(self.PROBE_KEY, {}).get("until", 0) > time.time():
+            return
+        
+        # Reservar a ronda de sondas: os outros processos esperam pelo intervalo seguinte
+        claimed = []
+        def claim(entry: Dict[str, float]) -> bool:
+            if entry.get("until", 0) > time.time():
+                return False
+            entry["until"] = time.time() + self.probe_interval
+            claimed.append(True)
+            return True
+        self._update(self.PROBE_KEY, claim)
+        if not claimed:
+            return
+        self._probe_thread = threading.Thread(target=self.probe_now, args=(probe,), daemon=True)
+        self._probe_thread.start()
+    
+    def probe_now(self, probe: Callable[[List[str]], Dict[str, Optional[float]]]) -> Dict[str, Optional[float]]:
+        """Sonda todos os URLs e regista os resultados."""
+        results = probe(self.urls)
+        for url, latency in results.items():
+            if latency is None:
+                self.record_failure(url)
+            else:
+                self.record_success(url, latency)
+        return results
+
+class RequestTracer:
+    """
+    Spans de latência por chamada a um endpoint, acrescentados a um ficheiro JSON lines.
+    
+    Cada span tem as tentativas feitas (incluindo novas tentativas), cada uma com o status, os
+    bytes e as fases: resolve (DNS), connect (TCP), tls, ttfb (do envio do pedido aos cabeçalhos
+    da resposta, inclui o tempo no servidor), body (leitura do corpo) e parse (JSON). As fases de
+    ligação só existem em ligações novas ("reused": false). O span activo é guardado por thread,
+    porque é na thread do pedido que o urllib3 abre as ligações.
+    """
+    
+    CONNECTION_PHASES = ("resolve", "connect", "tls")
+    
+    def __init__(self, trace_file: str):
+        self.trace_file = trace_file
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def begin(self, endpoint: str, method: str):
+        self._local.span = {"ts": time.time(), "endpoint": endpoint, "method": method,
+                            "attempts": [], "_start": time.perf_counter()}
+    
+    def _attempt(self) -> Optional[Dict[str, Any]]:
+        span = getattr(self._local, "span", None)
+        return span["attempts"][-1] if span and span["attempts"] else None
+    
+    def attempt(self):
+        """Começa uma tentativa do pedido actual."""
+        span = getattr(self._local, "span", None)
+        if span is not None:
+            span["attempts"].append({"phases": {}, "reused": True, "_start": time.perf_counter()})
+    
+    def phase(self, name: str, seconds: float):
+        attempt = self._attempt()
+        if attempt is not None:
+            attempt["phases"][name] = attempt["phases"].get(name, 0.0) + seconds
+            if name in self.CONNECTION_PHASES:
+                attempt["reused"] = False
+    
+    def exchange(self, sent_at: float, headers_at: float, body_at: float):
+        """Regista ttfb e body de uma tentativa (o ttfb exclui o tempo de abrir a ligação)."""
+        attempt = self._attempt()
+        if attempt is not None:
+            connecting = sum(attempt["phases"].get(name, 0.0) for name in self.CONNECTION_PHASES)
+            self.phase("ttfb", max(0.0, headers_at - sent_at - connecting))
+            self.phase("body", body_at - headers_at)
+    
+    def note(self, **fields):
+        """Acrescenta campos (status, bytes, erro, espera até à tentativa seguinte) à tentativa actual."""
+        attempt = self._attempt()
+        if attempt is not None:
+            if "delay" in fields and "_start" in attempt:
+                attempt["duration"] = time.perf_counter() - attempt.pop("_start")
+            attempt.update(fields)
+    
+    def end(self, result: Dict[str, Any]):
+        """Fecha o span actual e escreve-o no ficheiro."""
+        span = getattr(self._local, "span", None)
+        if span is None:
+            return
+        self._local.span = None
+        now = time.perf_counter()
+        attempts = span["attempts"]
+        for attempt in attempts:
+            if "_start" in attempt:
+                attempt["duration"] = now - attempt.pop("_start")
+            attempt["phases"] = {name: round(value, 6) for name, value in attempt["phases"].items()}
+            attempt["duration"] = round(attempt["duration"], 6)
+        last = attempts[-1] if attempts else {}
+        span.update({
+            "duration": round(now - span.pop("_start"), 6),
+            "status": last.get("status"),
+            "success": bool(result.get("success", True)),
+            "retries": max(0, len(attempts) - 1),
+            "phases": last.get("phases", {}),
+            "reused": last.get("reused"),
+            "sent": sum(a.get("sent", 0) for a in attempts),
+            "received": sum(a.get("received", 0) for a in attempts),
+            "decoded": sum(a.get("decoded", 0) for a in attempts),
+            "pid": os.getpid(),
+            "version": VERSION,
+        })
+        if not span["success"]:
+            span["error"] = result.get("error")
+        line = json.dumps(span, separators=(',', ':'), ensure_ascii=False) + "\n"
+        # Uma única escrita em modo append por span: vários processos podem partilhar o ficheiro
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.trace_file) or ".", exist_ok=True)
+                with open(self.trace_file, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError:
+                pass
+
+def trace_file_from_env() -> Optional[str]:
+    """Ficheiro de trace indicado em MANAI_TRACE ("1" = ~/.config/manai/trace.jsonl; vazio ou "0" = desligado)."""
+    value = os.environ.get("MANAI_TRACE", "").strip()
+    if value.lower() in ("", "0", "false", "no"):
+        return None
+    if value.lower() in ("1", "true", "yes"):
+        return os.path.expanduser("~/.config/manai/trace.jsonl")
+    return os.path.expanduser(value)
+
+def traced_pool_classes(tracer: RequestTracer) -> Dict[str, type]:
+    """
+    Pools do urllib3 cujas ligações novas registam no tracer a resolução DNS, a ligação TCP
+    e o handshake TLS (o urllib3 não expõe estes tempos).
+    """
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    from urllib3.exceptions import ConnectTimeoutError
+    
+    class TracedConnection:
+        def _new_conn(self):
+            host = self._dns_host
+            start = time.perf_counter()
+            try:
+                infos = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+                addresses = list(dict.fromkeys(info[4][0] for info in infos))
+            except OSError:
+                addresses = [host]  # O urllib3 reporta o erro de resolução
+            resolved = time.perf_counter()
+            tracer.phase("resolve", resolved - start)
+            try:
+                # Tentar cada endereço, como socket.create_connection faria com o nome
+                for index, address in enumerate(addresses):
+                    self._dns_host = address
+                    try:
+                        sock = super()._new_conn()
+                        break
+                    except ConnectTimeoutError:
+                        if index == len(addresses) - 1:
+                            raise
+            finally:
+                self._dns_host = host
+            self._trace_socket_time = time.perf_counter() - start
+            tracer.phase("connect", time.perf_counter() - resolved)
+            return sock
+    
+    class TracedHTTPSConnection(TracedConnection, HTTPSConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            tracer.phase("tls", time.perf_counter() - start - getattr(self, "_trace_socket_time", 0.0))
+    
+    class TracedHTTPConnection(TracedConnection, HTTPConnection):
+        pass
+    
+    class TracedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TracedHTTPConnection
+    
+    class TracedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = TracedHTTPSConnection
+    
+    return {"http": TracedHTTPConnectionPool, "https": TracedHTTPSConnectionPool}
+    
+def http2_adapter(pool_maxsize: int, tracer: Optional[RequestTracer] = None, fallback=None):
+    """
+    Adaptador de transporte do requests que envia os pedidos pelo httpx com HTTP/2 negociado por
+    ALPN: os pedidos em paralelo ao mesmo host partilham uma única ligação TLS multiplexada em vez
+    de abrirem uma ligação (e um handshake) cada. Servidores sem HTTP/2 recebem HTTP/1.1.
+    
+    O proxy (HTTPS_PROXY, NO_PROXY), a verificação TLS e o certificado de cliente são os que o
+    requests resolveu para cada pedido. Pedidos por proxies que o httpx não suporta sem módulos
+    extra (SOCKS) vão para o adaptador `fallback` (HTTP/1.1).
+    
+    Devolve None se o httpx ou o h2 não estiverem instalados.
+    """
+    try:
+        import httpx
+        import h2  # noqa: F401  (necessário para http2=True no httpx)
+    except ImportError:
+        return None
+    import contextlib
+    import ssl
+    import requests
+    from requests.adapters import BaseAdapter
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import DEFAULT_CA_BUNDLE_PATH, get_encoding_from_headers, select_proxy
+    
+    # Cabeçalhos de ligação proibidos em HTTP/2 (RFC 9113, secção 8.2.2)
+    HOP_BY_HOP = {"connection", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade"}
+    TRACE_PHASES = {"connection.connect_tcp": "connect", "connection.start_tls": "tls"}
+    
+    @contextlib.contextmanager
+    def translate_errors(request, body: bool = False):
+        """Converte as excepções do httpx nas do requests, que o cliente já trata."""
+        try:
+            yield
+        except httpx.ConnectTimeout as e:
+            raise requests.exceptions.ConnectTimeout(e, request=request)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.ReadTimeout(e, request=request)
+        except httpx.TransportError as e:
+            if body:
+                raise requests.exceptions.ChunkedEncodingError(e)
+            raise requests.exceptions.ConnectionError(e, request=request)
+        except httpx.HTTPError as e:
+            raise requests.exceptions.RequestException(e, request=request)
+    
+    def ssl_context(verify: Any, cert: Any) -> ssl.SSLContext:
+        """Contexto TLS equivalente aos argumentos verify e cert do requests."""
+        if verify is False:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        else:
+            # Caminho de um bundle de CAs (REQUESTS_CA_BUNDLE) ou de um directório; por omissão o do certifi
+            ca = verify if isinstance(verify, str) else DEFAULT_CA_BUNDLE_PATH
+            context = ssl.create_default_context(**{"capath" if os.path.isdir(ca) else "cafile": ca})
+        if cert:
+            context.load_cert_chain(*((cert,) if isinstance(cert, str) else cert))
+        return context
+    
+    class RawResponse:
+        """O pouco de urllib3.HTTPResponse que o requests e o cliente usam."""
+        
+        def __init__(self, response: "httpx.Response"):
+            self._response = response
+        
+        def stream(self, amt: Optional[int] = None, decode_content: bool = True):
+            # O httpx já descomprime o corpo (gzip, br, zstd)
+            with translate_errors(None, body=True):
+                yield from self._response.iter_bytes(amt)
+        
+        def tell(self) -> int:
+            """Bytes recebidos tal como vieram na rede (antes de descomprimir)."""
+            return self._response.num_bytes_downloaded
+        
+        def close(self):
+            self._response.close()
+        
+        release_conn = close
+    
+    class Http2Adapter(BaseAdapter):
+        def __init__(self):
+            super().__init__()
+            self._clients: Dict[Any, "httpx.Client"] = {}
+            self._lock = threading.Lock()
+        
+        def _client(self, verify: Any, cert: Any, proxy: Optional[str]) -> "httpx.Client":
+            """Um cliente httpx (com o seu pool de ligações) por verificação TLS, certificado e proxy."""
+            verify = verify if isinstance(verify, str) else bool(verify)
+            cert = tuple(cert) if isinstance(cert, (list, tuple)) else cert
+            key = (verify, cert, proxy)
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    # trust_env=False: o proxy e os CAs do ambiente já vêm resolvidos pelo requests
+                    client = httpx.Client(http2=True, verify=ssl_context(verify, cert), proxy=proxy,
+                                          trust_env=False, limits=httpx.Limits(max_connections=pool_maxsize))
+                    self._clients[key] = client
+                return client
+        
+        def _trace(self):
+            """Callback do httpcore que regista no tracer a ligação TCP e o handshake TLS."""
+            started: Dict[str, float] = {}
+            
+            def callback(event: str, info: Dict[str, Any]):
+                name, _, stage = event.rpartition(".")
+                if name not in TRACE_PHASES:
+                    return
+                if stage == "started":
+                    started[name] = time.perf_counter()
+                elif stage == "complete" and name in started:
+                    tracer.phase(TRACE_PHASES[name], time.perf_counter() - started.pop(name))
+            return callback
+        
+        def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+            proxy = select_proxy(request.url, proxies or {})
+            if proxy and not proxy.lower().startswith(("http://", "https://")) and fallback is not None:
+                return fallback.send(request, stream=stream, timeout=timeout, verify=verify, cert=cert,
+                                     proxies=proxies)
+            client = self._client(verify, cert, proxy)
+            connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            headers = [(name, value) for name, value in request.headers.items()
+                       if name.lower() not in HOP_BY_HOP]
+            extensions = {"trace": self._trace()} if tracer is not None else {}
+            with translate_errors(request):
+                outgoing = client.build_request(request.method, request.url, headers=headers,
+                                                content=request.body,
+                                                timeout=httpx.Timeout(read, connect=connect),
+                                                extensions=extensions)
+                response = client.send(outgoing, stream=True)
+            
+            result = requests.Response()
+            result.status_code = response.status_code
+            result.reason = response.reason_phrase
+            result.headers = CaseInsensitiveDict(response.headers.items())
+            result.encoding = get_encoding_from_headers(result.headers)
+            result.raw = RawResponse(response)
+            result.url = request.url
+            result.request = request
+            result.connection = self
+            # Sem stream, o requests lê já o corpo através de raw.stream()
+            return result
+        
+        def close(self):
+            with self._lock:
+                for client in self._clients.values():
+                    client.close()
+                self._clients.clear()
+    
+    return Http2Adapter()
+
+class SQLiteStore:
+    """
+    Base das bases de dados SQLite locais: uma ligação por thread (o sqlite3 não partilha
+    ligações entre threads), modo WAL e transacções que obtêm o lock de escrita logo no início.
+    """
+    
+    SCHEMA: Tuple[str, ...] = ()
+    
+    def __init__(self, db_path: str, busy_timeout: float = 10.0):
+        """
+        Args:
+            db_path: Ficheiro da base de dados
+            busy_timeout: Segundos a aguardar por outro escritor antes de falhar
+        """
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.created = not os.path.exists(db_path)
+        self._local = threading.local()
+    
+    def _connection(self):
+        """Ligação da thread actual, criada (com o esquema) no primeiro uso."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            import sqlite3
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._init_schema(conn)
+            self._local.conn = conn
+        return conn
+    
+    def _init_schema(self, conn):
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+    
+    class _transaction:
+        """BEGIN IMMEDIATE ... COMMIT/ROLLBACK."""
+        
+        def __init__(self, conn):
+            self.conn = conn
+        
+        def __enter__(self):
+            self.conn.execute("BEGIN IMMEDIATE")
+        
+        def __exit__(self, exc_type, *exc_info):
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+    
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class StateStore(SQLiteStore):
+    """
+    Estado persistente do cliente numa base de dados SQLite em modo WAL.
+    
+    Guarda credenciais, sessão, validação do token e ledger de quota como pares chave -> JSON.
+    Vários processos (terminais, scripts em batch, o daemon) podem ler e escrever em simultâneo:
+    os leitores não bloqueiam os escritores e cada actualização é uma transacção atómica, pelo que
+    nenhum processo apaga as alterações de outro.
+    """
+    
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)",)
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self._connection().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+    
+    def set(self, key: str, value: Any):
+        self.update(key, lambda _: value)
+    
+    def delete(self, *keys: str):
+        """Apaga várias chaves numa só transacção."""
+        conn = self._connection()
+        with self._transaction(conn):
+            conn.executemany("DELETE FROM state WHERE key = ?", [(key,) for key in keys])
+    
+    def update(self, key: str, change: Callable[[Any], Any]) -> Any:
+        """
+        Lê, altera e grava uma chave numa transacção exclusiva (read-modify-write atómico).
+        
+        Args:
+            change: Função que recebe o valor actual (None se não existir) e devolve o novo
+                valor; devolver None apaga a chave
+            
+        Returns:
+            O novo valor
+        """
+        conn = self._connection()
+        with self._transaction(conn):
+            row = conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+            value = change(json.loads(row[0]) if row else None)
+            if value is None:
+                conn.execute("DELETE FROM state WHERE key = ?", (key,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO state (key, value, updated_at) VALUES (?, ?, ?)",
+                             (key, json.dumps(value, separators=(',', ':')), time.time()))
+        return value
+
+# Histórico local de perguntas e respostas (pode ser sobreposto em config.json, chave "history")
+DEFAULT_HISTORY_CONFIG = {
+    "enabled": True,
+    "max_results": 10,          # Resultados mostrados por manai --history
+}
+
+class HistoryStore(SQLiteStore):
+    """
+    Histórico das perguntas e respostas, com pesquisa de texto integral (SQLite FTS5).
+    
+    O índice FTS5 usa a tabela do histórico como conteúdo externo e é mantido por triggers, pelo
+    que cada resposta é gravada uma só vez. Sem FTS5 no SQLite do sistema, a pesquisa recorre a LIKE.
+    """
+    
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY, asked_at REAL NOT NULL, "
+        "language TEXT, question TEXT NOT NULL, answer TEXT NOT NULL, thread_id TEXT)",
+    )
+    FTS_SCHEMA = (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(question, answer, content='history', "
+        "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN "
+        "INSERT INTO history_fts(rowid, question, answer) VALUES (new.id, new.question, new.answer); END",
+        "CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN "
+        "INSERT INTO history_fts(history_fts, rowid, question, answer) "
+        "VALUES ('delete', old.id, old.question, old.answer); END",
+    )
+    
+    RANK_WINDOW = 1000
+    
+    def __init__(self, db_path: str, busy_timeout: float = 10.0):
+        super().__init__(db_path, busy_timeout)
+        self.fts = True
+    
+    def _init_schema(self, conn):
+        import sqlite3
+        super()._init_schema(conn)
+        try:
+            for statement in self.FTS_SCHEMA:
+                conn.execute(statement)
+        except sqlite3.OperationalError:
+            self.fts = False
+    
+    def add(self, question: str, language: str, answer: str, thread_id: Optional[str] = None,
+            asked_at: Optional[float] = None):
+        conn = self._connection()
+        with self._transaction(conn):
+            conn.execute("INSERT INTO history (asked_at, language, question, answer, thread_id) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         (asked_at or time.time(), language, question, answer, thread_id))
+    
+    @staticmethod
+    def _match_expression(query: str) -> str:
+        """Converte o texto pesquisado numa expressão FTS5 (todas as palavras, por prefixo)."""
+        return " ".join(f'"{word}"*' for word in re.findall(r"\w+", query))
+    
+    def search(self, query: str, limit: int = 10,
+               highlight: Tuple[str, str] = ("[", "]")) -> List[Dict[str, Any]]:
+        """
+        Procura no histórico, com as perguntas mais relevantes primeiro (BM25, pergunta com mais
+        peso que a resposta). Sem texto, devolve as entradas mais recentes.
+        
+        Returns:
+            Entradas com askedAt, language, question, threadId e snippet (excerto da resposta)
+        """
+        conn = self._connection()
+        match = self._match_expression(query)
+        if not match:
+            rows = conn.execute("SELECT asked_at, language, question, substr(answer, 1, 160), thread_id "
+                                "FROM history ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        elif self.fts:
+            # O BM25 é calculado para cada entrada encontrada: palavras comuns encontrariam o histórico
+            # todo, por isso só as RANK_WINDOW entradas mais recentes (intervalo de rowid) são ordenadas
+            rows = conn.execute(
+                "SELECT h.asked_at, h.language, h.question, snippet(history_fts, 1, ?1, ?2, '…', 24), h.thread_id "
+                "FROM history_fts JOIN history h ON h.id = history_fts.rowid "
+                "WHERE history_fts MATCH ?3 AND history_fts.rowid >= (SELECT min(rowid) FROM ("
+                "SELECT rowid FROM history_fts WHERE history_fts MATCH ?3 ORDER BY rowid DESC LIMIT ?5)) "
+                "ORDER BY bm25(history_fts, 2.0, 1.0) LIMIT ?4",
+                (highlight[0], highlight[1], match, limit, self.RANK_WINDOW)).fetchall()
+        else:
+            words = re.findall(r"\w+", query)
+            where = " AND ".join("(question LIKE ? OR answer LIKE ?)" for _ in words)
+            params = [p for word in words for p in (f"%{word}%", f"%{word}%")]
+            rows = conn.execute(f"SELECT asked_at, language, question, substr(answer, 1, 160), thread_id "
+                                f"FROM history WHERE {where} ORDER BY id DESC LIMIT ?",
+                                params + [limit]).fetchall()
+        return [{"askedAt": asked_at, "language": language, "question": question, "snippet": snippet,
+                 "threadId": thread_id} for asked_at, language, question, snippet, thread_id in rows]
 
 class ManaiFreemiumAzureClient:
     """Cliente para interagir com o ManAI Freemium através das Azure Functions em produção."""
     
-    def __init__(self, base_url: str = "https://manai-agent-function-app.azurewebsites.net/api", 
-                 function_key: str = "58H0KD8feP9x2e6uqY1wkwW-6MqwrNkWI6U4-jdsSa5EAzFuACdqNA=="):
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, function_key: str = DEFAULT_FUNCTION_KEY,
+                 http_config: Optional[Dict[str, Any]] = None,
+                 retry_config: Optional[Dict[str, Any]] = None,
+                 timeout_config: Optional[Dict[str, Any]] = None,
+                 circuit_breaker_config: Optional[Dict[str, Any]] = None):
         """
         Inicializa o cliente ManAI Freemium para Azure.
         
         Args:
-            base_url: URL base das Azure Functions em produção
+            base_url: URL base das Azure Functions em produção; vários separados por vírgulas são
+                escolhidos pela latência e saúde de cada um (ver DEFAULT_ENDPOINTS_CONFIG)
             function_key: Chave de acesso às Azure Functions
+            http_config: Opções do pool de ligações (ver DEFAULT_HTTP_CONFIG)
+            retry_config: Opções das novas tentativas (ver DEFAULT_RETRY_CONFIG)
+            timeout_config: Opções dos timeouts (ver DEFAULT_TIMEOUT_CONFIG)
+            circuit_breaker_config: Opções do circuit breaker (ver DEFAULT_CIRCUIT_BREAKER_CONFIG)
         """
-        self.base_url = base_url.rstrip('/')
+        self._requested_urls = split_base_urls(base_url)
+        self.base_url = self._requested_urls[0]
         self.function_key = function_key
         self.config_dir = os.path.expanduser("~/.config/manai")
         self.config_file = os.path.join(self.config_dir, "config.json")
-        self.session_file = os.path.join(self.config_dir, "session.json")
+        self.state_file = os.path.join(self.config_dir, "state.db")
+        # Chave do histórico de latência no estado (o teste de carga usa outra)
+        self.latency_key = "latency"
+        
+        # Configuração, pool HTTP e caches são criados no primeiro uso (o construtor não faz I/O)
+        self._config = None
+        self._config_mtime = None
+        self._http_overrides = http_config or {}
+        self._http_config = None
+        self._http_session = None
+        self._http_session_lock = threading.Lock()
+        self._answer_cache_config = None
+        self._answer_cache = None
+        self._similar_config = None
+        self._similar_index = None
+        self._single_flight_config = None
+        self._single_flight = None
+        self._man_index_config = None
+        self._man_index = None
+        self._retry_overrides = retry_config or {}
+        self._retry_config = None
+        self._circuit_breaker = None
+        self._circuit_breaker_overrides = circuit_breaker_config or {}
+        self._endpoints_config = None
+        self._router = None
+        self._timeout_overrides = timeout_config or {}
+        self._timeout_config = None
+        self._latency_history = None
+        self._state = None
+        self._state_lock = threading.Lock()
+        self._history = None
+        self._history_config = None
+        self._usage_stats_config = None
+        self._tier_cache_config = None
+        self._history_writer = None
+        self._token_rejected = False
+        
+        # Bytes transferidos (corpo dos pedidos e respostas); com verbose, cada pedido é mostrado em stderr
+        self.verbose = False
+        self.transfer_stats = {"requests": 0, "sent": 0, "received": 0, "decoded": 0}
+        self._transfer_lock = threading.Lock()
+        # Spans de latência por pedido (RequestTracer); definir antes do primeiro pedido
+        self.tracer: Optional[RequestTracer] = None
+    
+    @property
+    def state(self) -> StateStore:
+        """Estado partilhado entre processos (credenciais, sessão, validação, quota)."""
+        if self._state is None:
+            with self._state_lock:
+                if self._state is None:
+                    self._ensure_config_dir()
+                    store = StateStore(self.state_file)
+                    if store.created:
+                        self._migrate_legacy_state(store)
+                    self._migrate_legacy_server_state(store)
+                    self._state = store
+        return self._state
+    
+    @property
+    def usage_stats_config(self) -> Dict[str, Any]:
+        if self._usage_stats_config is None:
+            self._usage_stats_config = self._config_section("usage_stats", DEFAULT_USAGE_STATS_CONFIG)
+        return self._usage_stats_config
+    
+    @property
+    def tier_cache_config(self) -> Dict[str, Any]:
+        if self._tier_cache_config is None:
+            self._tier_cache_config = self._config_section("tier_cache", DEFAULT_TIER_CACHE_CONFIG)
+        return self._tier_cache_config
+    
+    @property
+    def history_config(self) -> Dict[str, Any]:
+        if self._history_config is None:
+            self._history_config = self._config_section("history", DEFAULT_HISTORY_CONFIG)
+        return self._history_config
+    
+    @property
+    def history(self) -> HistoryStore:
+        """Histórico local de perguntas e respostas."""
+        if self._history is None:
+            self._ensure_config_dir()
+            self._history = HistoryStore(os.path.join(self.config_dir, "history.db"))
+        return self._history
+    
+    def _migrate_legacy_state(self, store: StateStore):
+        """Importa session.json, validation.json e quota.json das versões anteriores."""
+        for key in ("session", "validation", "quota"):
+            path = os.path.join(self.config_dir, f"{key}.json")
+            try:
+                with open(path, 'r') as f:
+                    store.set(key, json.load(f))
+                os.remove(path)
+            except (json.JSONDecodeError, IOError, OSError):
+                pass
+    
+    def _migrate_legacy_server_state(self, store: StateStore):
+        """
+        Importa latency.json e apaga circuit.json e endpoints.json das versões anteriores (o estado
+        do circuit breaker e do router é de curta duração e volta a ser medido).
+        """
+        for name in ("latency", "circuit", "endpoints"):
+            path = os.path.join(self.config_dir, f"{name}.json")
+            if not os.path.exists(path):
+                continue
+            try:
+                if name == "latency":
+                    with open(path, 'r') as f:
+                        samples = json.load(f)
+                    if isinstance(samples, dict):
+                        store.update("latency", lambda current: current or samples)
+                os.remove(path)
+            except (json.JSONDecodeError, IOError, OSError):
+                pass
+            try:
+                os.remove(f"{path}.lock")
+            except OSError:
+                pass
+    
+    @property
+    def config(self) -> Dict[str, Any]:
+        """Configuração do utilizador (config.json mais as credenciais do estado, lida no primeiro acesso)."""
+        if self._config is None:
+            self._config_mtime = self._config_file_mtime()
+            self._config = self._load_config()
+        return self._config
+    
+    @config.setter
+    def config(self, value: Dict[str, Any]):
+        self._config = value
+    
+    def _config_section(self, name: str, defaults: Dict[str, Any]) -> Dict[str, Any]:
+        """Junta uma secção de config.json aos valores por omissão."""
+        section = dict(defaults)
+        section.update(self.config.get(name, {}))
+        return section
+    
+    @property
+    def http_config(self) -> Dict[str, Any]:
+        """Opções do pool de ligações HTTP partilhado por todos os endpoints."""
+        if self._http_config is None:
+            self._http_config = self._config_section("http", DEFAULT_HTTP_CONFIG)
+            self._http_config.update(self._http_overrides)
+        return self._http_config
+    
+    @property
+    def answer_cache_config(self) -> Dict[str, Any]:
+        if self._answer_cache_config is None:
+            self._answer_cache_config = self._config_section("answer_cache", DEFAULT_ANSWER_CACHE_CONFIG)
+        return self._answer_cache_config
+    
+    @property
+    def answer_cache(self) -> AnswerCache:
+        """Cache local de respostas do agente."""
+        if self._answer_cache is None:
+            self._answer_cache = AnswerCache(
+                os.path.join(self.config_dir, "cache", "answers"),
+                ttl=self.answer_cache_config["ttl"],
+                max_bytes=self.answer_cache_config["max_bytes"]
+            )
+        return self._answer_cache
+    
+    @property
+    def single_flight_config(self) -> Dict[str, Any]:
+        if self._single_flight_config is None:
+            self._single_flight_config = self._config_section("single_flight", DEFAULT_SINGLE_FLIGHT_CONFIG)
+        return self._single_flight_config
+    
+    @property
+    def single_flight(self) -> Optional[SingleFlight]:
+        """Partilha de perguntas iguais em curso noutros processos (None se estiver desactivada)."""
+        if self._single_flight is None:
+            config = self.single_flight_config
+            if not config["enabled"] or float(config["wait"]) <= 0:
+                return None
+            flight_dir = config["dir"] or os.path.join(self.config_dir, "inflight")
+            self._single_flight = SingleFlight(os.path.expanduser(flight_dir), wait=float(config["wait"]),
+                                               reuse=float(config["reuse"]))
+        return self._single_flight
+    
+    @property
+    def similar_config(self) -> Dict[str, Any]:
+        if self._similar_config is None:
+            self._similar_config = self._config_section("similar_answers", DEFAULT_SIMILAR_ANSWERS_CONFIG)
+        return self._similar_config
+    
+    @property
+    def similar_index(self) -> SimilarityIndex:
+        """Índice de perguntas semelhantes já respondidas."""
+        if self._similar_index is None:
+            self._similar_index = SimilarityIndex(
+                os.path.join(self.config_dir, "cache", "similar"),
+                max_entries=self.similar_config["max_entries"]
+            )
+        return self._similar_index
+    
+    @property
+    def man_index_config(self) -> Dict[str, Any]:
+        if self._man_index_config is None:
+            self._man_index_config = self._config_section("man_index", DEFAULT_MAN_INDEX_CONFIG)
+        return self._man_index_config
+    
+    @property
+    def man_index(self) -> ManPageIndex:
+        """Índice local das páginas man instaladas (construído com manai --index)."""
+        if self._man_index is None:
+            self._man_index = ManPageIndex(
+                os.path.join(self.config_dir, "cache", "man", "index.bin"),
+                paths=self.man_index_config["paths"],
+                sections=self.man_index_config["sections"]
+            )
+        return self._man_index
+    
+    @property
+    def retry_config(self) -> Dict[str, Any]:
+        if self._retry_config is None:
+            self._retry_config = self._config_section("retry", DEFAULT_RETRY_CONFIG)
+            self._retry_config.update(self._retry_overrides)
+        return self._retry_config
+    
+    @property
+    def circuit_breaker(self) -> Optional[CircuitBreaker]:
+        """Circuit breaker partilhado entre processos (None se estiver desactivado)."""
+        if self._circuit_breaker is None:
+            config = self._config_section("circuit_breaker", DEFAULT_CIRCUIT_BREAKER_CONFIG)
+            config.update(self._circuit_breaker_overrides)
+            if not config["enabled"]:
+                return None
+            self._circuit_breaker = CircuitBreaker(
+                self.state,
+                failure_threshold=int(config["failure_threshold"]),
+                cooldown=float(config["cooldown"])
+            )
+        return self._circuit_breaker
+    
+    @property
+    def url_spec(self) -> str:
+        """URLs base indicados no construtor, separados por vírgulas (identificam o daemon)."""
+        return ",".join(self._requested_urls)
+    
+    @property
+    def endpoints_config(self) -> Dict[str, Any]:
+        if self._endpoints_config is None:
+            self._endpoints_config = self._config_section("endpoints", DEFAULT_ENDPOINTS_CONFIG)
+        return self._endpoints_config
+    
+    @property
+    def base_urls(self) -> List[str]:
+        """URLs base disponíveis: os indicados ou, sem --url, os de config.json ("endpoints")."""
+        configured = [url.rstrip('/') for url in self.endpoints_config["urls"]]
+        if self._requested_urls == [DEFAULT_BASE_URL] and configured:
+            return configured
+        return self._requested_urls
+    
+    @property
+    def router(self) -> Optional[EndpointRouter]:
+        """Escolha do URL base pela latência e saúde (None com um único URL)."""
+        if self._router is None and len(self.base_urls) > 1:
+            self._router = EndpointRouter(
+                self.base_urls, self.state,
+                probe_interval=float(self.endpoints_config["probe_interval"]),
+                ewma_alpha=float(self.endpoints_config["ewma_alpha"])
+            )
+        return self._router
+    
+    def _route(self) -> List[str]:
+        """URLs base pela ordem a experimentar num pedido, actualizando as sondas em segundo plano."""
+        router = self.router
+        if router is None:
+            return self.base_urls
+        router.probe_in_background(self._probe_endpoints)
+        return router.ranked()
+    
+    def _probe_endpoints(self, urls: List[str]) -> Dict[str, Optional[float]]:
+        """
+        Latência de um GET ao endpoint de teste em cada URL, em paralelo (None se não responder ou
+        responder 5xx). Usa uma sessão própria, para não competir com os pedidos pelo pool.
+        """
+        import requests
+        
+        timeout = float(self.endpoints_config["probe_timeout"])
+        headers = self._get_headers(include_auth=False)
         
-        # Criar directório de configuração se não existir
+        def probe(session: "requests.Session", url: str) -> Optional[float]:
+            try:
+                response = session.get(f"{url}/ManaiAgentHttpTrigger", headers=headers, timeout=timeout)
+            except requests.exceptions.RequestException:
+                return None
+            return response.elapsed.total_seconds() if response.status_code < 500 else None
+        
+        with requests.Session() as session, ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            return dict(zip(urls, executor.map(lambda url: probe(session, url), urls)))
+    
+    @property
+    def timeout_config(self) -> Dict[str, Any]:
+        if self._timeout_config is None:
+            self._timeout_config = self._config_section("timeouts", DEFAULT_TIMEOUT_CONFIG)
+            self._timeout_config.update(self._timeout_overrides)
+        return self._timeout_config
+    
+    @property
+    def latency_history(self) -> LatencyHistory:
+        """Histórico da latência observada por endpoint, usado para calcular os timeouts."""
+        if self._latency_history is None:
+            self._latency_history = LatencyHistory(self.state, self.latency_key,
+                                                   history_size=int(self.timeout_config["history_size"]))
+        return self._latency_history
+    
+    def get_timeouts(self, endpoint: str) -> Tuple[float, float]:
+        """
+        Timeouts (ligação, leitura) de um endpoint.
+        
+        O timeout de leitura é o p99 da latência observada vezes o multiplicador, limitado ao
+        intervalo [floor, ceiling]; sem histórico suficiente usa-se um valor inicial conservador.
+        Valores "connect"/"read" em config.json (globais ou por endpoint) ou na linha de comandos
+        têm prioridade.
+        """
+        config = dict(self.timeout_config)
+        overrides = config.pop("endpoints", {}).get(endpoint, {})
+        config.update(overrides)
+        connect = float(config["connect"])
+        if config.get("read") is not None:
+            return connect, float(config["read"])
+        
+        p99 = self.latency_history.percentile(endpoint, 0.99, int(config["min_samples"]))
+        if p99 is None:
+            read = INITIAL_READ_TIMEOUTS.get(endpoint, INITIAL_READ_TIMEOUT)
+        else:
+            read = p99 * float(config["multiplier"])
+        floor = float(config["floor"])
+        if "floor" not in overrides:
+            floor = max(floor, READ_TIMEOUT_FLOORS.get(endpoint, 0.0))
+        return connect, min(float(config["ceiling"]), max(floor, read))
+    
+    def _ensure_config_dir(self):
+        """Cria o directório de configuração antes da primeira escrita."""
         os.makedirs(self.config_dir, exist_ok=True)
         
-        # Carregar configuração
-        self.config = self._load_config()
+    def _get_http_session(self) -> "requests.Session":
+        """Retorna a sessão HTTP persistente, criando o pool de ligações se necessário."""
+        if self._http_session is None:
+            # Pedidos em paralelo (run_concurrently) não podem criar cada um o seu pool
+            with self._http_session_lock:
+                if self._http_session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    
+                    session = requests.Session()
+                    # Respostas comprimidas: gzip e deflate, mais br/zstd se os módulos estiverem instalados
+                    from urllib3.util.request import ACCEPT_ENCODING
+                    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+                    adapter = HTTPAdapter(
+                        pool_connections=int(self.http_config["pool_connections"]),
+                        pool_maxsize=int(self.http_config["pool_maxsize"]),
+                        pool_block=bool(self.http_config["pool_block"]),
+                        max_retries=0
+                    )
+                    if self.tracer is not None:
+                        adapter.poolmanager.pool_classes_by_scheme = traced_pool_classes(self.tracer)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    if self.http_config["http2"]:
+                        adapter2 = http2_adapter(int(self.http_config["pool_maxsize"]), self.tracer, adapter)
+                        if adapter2 is not None:
+                            session.mount("https://", adapter2)
+                        elif self.verbose:
+                            print("⚠️  HTTP/2 indisponível (pip install 'httpx[http2]'); a usar HTTP/1.1", file=sys.stderr)
+                    if not self.http_config["keep_alive"]:
+                        session.headers["Connection"] = "close"
+                    self._http_session = session
+        return self._http_session
+    
+    def close(self):
+        """Fecha as ligações abertas no pool HTTP e termina as escritas pendentes (histórico, latência)."""
+        if self._http_session is not None:
+            self._http_session.close()
+            self._http_session = None
+        if self._history_writer is not None:
+            self._history_writer.shutdown(wait=True)
+            self._history_writer = None
+        if self._latency_history is not None:
+            self._latency_history.flush()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+        
+    def run_concurrently(self, calls: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """
+        Executa chamadas independentes aos endpoints em paralelo.
+        
+        Args:
+            calls: Mapa nome -> função sem argumentos (ex.: client.get_profile)
+            
+        Returns:
+            Mapa nome -> resultado; excepções são convertidas num dicionário de erro
+        """
+        if len(calls) <= 1:
+            return {name: call() for name, call in calls.items()}
+        
+        # Não abrir mais threads do que ligações disponíveis no pool
+        workers = max(1, min(len(calls), int(self.http_config["pool_maxsize"])))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {name: executor.submit(call) for name, call in calls.items()}
         
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = {"success": False, "error": f"Erro inesperado: {str(e)}"}
+        return results
+    
+    def _config_file_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.config_file)
+        except OSError:
+            return None
+    
+    def reload_config(self):
+        """Recarrega config.json e as credenciais se outro processo os tiver alterado (ex.: login ou logout)."""
+        if self._config is None:
+            return
+        token = self.config.get('token')
+        mtime = self._config_file_mtime()
+        if mtime != self._config_mtime:
+            self._config_mtime = mtime
+            self.config = self._load_config()
+        else:
+            self._config.pop('token', None)
+            self._config.pop('user', None)
+            self._config.update(self._load_credentials())
+        if self.config.get('token') != token:
+            self._token_rejected = False
+    
     def _load_config(self) -> Dict[str, Any]:
-        """Carrega a configuração do utilizador."""
+        """Carrega a configuração do utilizador e as credenciais guardadas no estado."""
+        config = {}
         try:
             if os.path.exists(self.config_file):
                 with open(self.config_file, 'r') as f:
-                    return json.load(f)
+                    config = json.load(f)
         except (json.JSONDecodeError, IOError):
             pass
-        return {}
+        
+        # Versões anteriores guardavam token e utilizador em config.json: passam para o estado
+        if 'token' in config or 'user' in config:
+            legacy = {key: config.pop(key) for key in ('token', 'user') if key in config}
+            self.state.set('auth', legacy if legacy.get('token') else None)
+            self._write_config_file(config)
+        config.update(self._load_credentials())
+        return config
+    
+    def _load_credentials(self) -> Dict[str, Any]:
+        if not os.path.exists(self.state_file) and self._state is None:
+            return {}
+        return self.state.get('auth') or {}
+    
+    def _write_config_file(self, config: Dict[str, Any]):
+        """Grava config.json de forma atómica (ficheiro temporário + rename)."""
+        self._ensure_config_dir()
+        tmp_path = f"{self.config_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp_path, self.config_file)
+        self._config_mtime = self._config_file_mtime()
     
     def _save_config(self):
-        """Guarda a configuração do utilizador."""
+        """Guarda as credenciais (token e utilizador) no estado partilhado."""
         try:
-            with open(self.config_file, 'w') as f:
-                json.dump(self.config, f, indent=2)
-        except IOError as e:
+            auth = {key: self.config[key] for key in ('token', 'user') if key in self.config}
+            self.state.set('auth', auth if auth.get('token') else None)
+        except Exception as e:
             print(f"⚠️  Aviso: Não foi possível guardar configuração: {e}")
     
     def _load_session(self) -> Optional[Dict[str, Any]]:
         """Carrega informações da sessão anterior."""
-        try:
-            if os.path.exists(self.session_file):
-                with open(self.session_file, 'r') as f:
-                    return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-        return None
+        return self.state.get('session')
     
-    def _save_session(self, session_data: Dict[str, Any]):
-        """Guarda informações da sessão."""
+    def _save_session(self, session_data: Dict[str, Any], previous_thread: Optional[str] = None):
+        """
+        Guarda informações da sessão.
+        
+        A gravação é condicional: se outro processo tiver entretanto mudado a sessão para outro
+        thread (diferente do que foi enviado com a pergunta), essa sessão mantém-se, em vez de
+        ganhar o último processo a terminar.
+        """
         print(f"🔒 Guardando sessão...{session_data}")
+        def change(current: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            current_thread = (current or {}).get('ThreadId')
+            if current_thread and current_thread not in (previous_thread, session_data.get('ThreadId')):
+                return current
+            return session_data
         try:
-            with open(self.session_file, 'w') as f:
-                json.dump(session_data, f, indent=2)
-        except IOError as e:
+            self.state.update('session', change)
+        except Exception as e:
             print(f"⚠️  Aviso: Não foi possível guardar sessão: {e}")
     
+    def _token_fingerprint(self) -> str:
+        """Identifica o token actual sem o guardar em claro noutro ficheiro."""
+        return hashlib.sha256(self.config.get('token', '').encode('utf-8')).hexdigest()[:16]
+    
+    def _load_validation(self) -> Optional[Dict[str, Any]]:
+        """Carrega a última validação do token feita no servidor, se for do token actual."""
+        validation = self.state.get('validation')
+        if validation and validation.get('token') == self._token_fingerprint():
+            return validation
+        return None
+    
+    def _save_validation(self, valid: bool):
+        """Regista o resultado de uma validação do token (servidor, login ou resposta 401)."""
+        try:
+            self.state.set('validation', {
+                'token': self._token_fingerprint(),
+                'valid': valid,
+                'validatedAt': time.time()
+            })
+        except Exception:
+            # Sem cache de validação, o token volta a ser validado no servidor
+            pass
+    
+    def _quota_user_key(self) -> str:
+        """Identifica o utilizador no ledger de quota."""
+        user = self.config.get('user') or {}
+        return str(user.get('id') or user.get('email') or self._token_fingerprint())
+    
+    def _load_quota(self) -> Dict[str, Any]:
+        """Carrega o ledger de quota (utilizador -> utilização do dia)."""
+        return self.state.get('quota') or {}
+    
+    def _update_quota(self, used: Any = None, limit: Any = None):
+        """
+        Actualiza o ledger de quota do dia actual.
+        
+        Args:
+            used: Consultas feitas hoje segundo o servidor (ignorado se não for inteiro)
+            limit: Limite diário segundo o servidor (0 = ilimitado)
+        """
+        if not isinstance(used, int) and not isinstance(limit, int):
+            return
+        
+        key = self._quota_user_key()
+        today = datetime.now().date().isoformat()
+        
+        def change(ledger: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            ledger = ledger or {}
+            entry = ledger.get(key) or {}
+            if entry.get('date') != today:
+                # Novo dia: a utilização volta a zero, mas o limite do tier mantém-se
+                entry = {'date': today, 'used': None, 'limit': entry.get('limit')}
+            if isinstance(used, int):
+                # Respostas concorrentes podem chegar fora de ordem; a utilização só aumenta
+                entry['used'] = max(used, entry.get('used') or 0)
+            if isinstance(limit, int):
+                entry['limit'] = limit
+            entry['updatedAt'] = time.time()
+            ledger[key] = entry
+            return ledger
+        
+        try:
+            self.state.update('quota', change)
+        except Exception:
+            # Sem ledger, a verificação no servidor é feita antes de cada pergunta
+            pass
+        if isinstance(used, int):
+            self._record_usage(used)
+    
+    def _record_usage(self, used: int):
+        """
+        Acrescenta a utilização de hoje (usageInfo ou CheckUsageLimit) ao rollup local de estatísticas.
+        
+        Só actualiza um rollup já sincronizado com o servidor: sem ele, o total é desconhecido.
+        """
+        key = self._quota_user_key()
+        today = datetime.now().date().isoformat()
+        
+        def change(rollup: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            entry = (rollup or {}).get(key)
+            if entry:
+                entry['days'][today] = max(used, entry['days'].get(today, 0))
+            return rollup
+        
+        try:
+            self.state.update('usage_stats', change)
+        except Exception:
+            # A próxima reconciliação com o servidor corrige o rollup
+            pass
+    
+    def _sync_usage_stats(self) -> Optional[Dict[str, Any]]:
+        """
+        Reconcilia o rollup local com GetUsageStatistics, pedindo apenas os dias desde a última
+        sincronização (parâmetro "since"). Os dias devolvidos pelo servidor substituem os locais.
+        
+        Returns:
+            None se bem-sucedido, ou a resposta de erro do servidor
+        """
+        key = self._quota_user_key()
+        entry = (self.state.get('usage_stats') or {}).get(key)
+        since = entry.get('syncedThrough') if entry else None
+        result = self._make_request("GetUsageStatistics", "GET", params={"since": since} if since else None)
+        if not result.get('success', True):
+            return result
+        
+        today = datetime.now().date().isoformat()
+        max_days = int(self.usage_stats_config["max_days"])
+        
+        def change(rollup: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            rollup = rollup or {}
+            current = rollup.get(key) or {}
+            days = dict(current.get('days') or {})
+            for stat in result.get('dailyStatistics') or []:
+                day = datetime.fromisoformat(stat['date']).date().isoformat()
+                count = int(stat.get('queriesCount') or 0)
+                # Respostas recebidas durante o pedido podem já ter aumentado o dia de hoje
+                days[day] = max(count, days.get(day, 0)) if day == today else count
+            for day in sorted(days)[:-max_days]:
+                del days[day]
+            
+            total = result.get('totalQueries')
+            rollup[key] = {
+                'days': days,
+                # Consultas anteriores aos dias guardados: o total local é offset + soma dos dias
+                'offset': total - sum(days.values()) if isinstance(total, int) else current.get('offset', 0),
+                'averageQueriesPerDay': result.get('averageQueriesPerDay', current.get('averageQueriesPerDay', 0)),
+                'currentTier': result.get('currentTier', current.get('currentTier')),
+                'syncedAt': time.time(),
+                'syncedThrough': today,
+            }
+            return rollup
+        
+        self.state.update('usage_stats', change)
+        return None
+    
+    def usage_statistics(self, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Estatísticas de utilização servidas a partir do rollup local, com o formato de
+        GetUsageStatistics. O rollup é reconciliado com o servidor quando tem mais de
+        sync_interval segundos ou com refresh=True; se a reconciliação falhar, os dados
+        locais são devolvidos com "stale": True.
+        
+        Returns:
+            Dicionário com totalQueries, averageQueriesPerDay, currentTier e dailyStatistics
+            (um dia por entrada, de hoje para trás)
+        """
+        key = self._quota_user_key()
+        entry = (self.state.get('usage_stats') or {}).get(key)
+        stale = False
+        if refresh or not entry or time.time() - entry['syncedAt'] > self.usage_stats_config["sync_interval"]:
+            error = self._sync_usage_stats()
+            if error and not entry:
+                return error
+            stale = error is not None
+            entry = (self.state.get('usage_stats') or {}).get(key) or entry
+        
+        days = entry['days']
+        daily = []
+        day = datetime.now().date()
+        oldest = min(days) if days else day.isoformat()
+        while day.isoformat() >= oldest:
+            daily.append({"date": day.isoformat(), "queriesCount": days.get(day.isoformat(), 0)})
+            day -= timedelta(days=1)
+        return {
+            "success": True,
+            "totalQueries": entry['offset'] + sum(days.values()),
+            "averageQueriesPerDay": entry['averageQueriesPerDay'],
+            "currentTier": entry['currentTier'],
+            "dailyStatistics": daily,
+            "syncedAt": entry['syncedAt'],
+            "stale": stale,
+        }
+    
+    def quota_remaining(self) -> Optional[int]:
+        """Consultas restantes hoje segundo o ledger local (None se ilimitado ou desconhecido)."""
+        entry = self._load_quota().get(self._quota_user_key())
+        if not entry or entry.get('date') != datetime.now().date().isoformat():
+            return None
+        used, limit = entry.get('used'), entry.get('limit')
+        if not isinstance(used, int) or not isinstance(limit, int) or limit == 0:
+            return None
+        return max(0, limit - used)
+    
+    def needs_usage_check(self) -> bool:
+        """
+        Indica se é necessário chamar CheckUsageLimit antes de uma pergunta.
+        
+        A verificação é dispensada quando o ledger local do dia mostra margem suficiente
+        até ao limite diário (ou o tier é ilimitado).
+        """
+        entry = self._load_quota().get(self._quota_user_key())
+        if not entry or entry.get('date') != datetime.now().date().isoformat():
+            return True
+        
+        used, limit = entry.get('used'), entry.get('limit')
+        if limit == 0:
+            return False
+        if not isinstance(used, int) or not isinstance(limit, int):
+            return True
+        
+        headroom = max(QUOTA_HEADROOM_MIN, limit * QUOTA_HEADROOM_RATIO)
+        return limit - used <= headroom
+    
     def _get_headers(self, include_auth: bool = True, include_function_key: bool = True) -> Dict[str, str]:
         """Retorna os cabeçalhos HTTP necessários."""
         headers = {
@@ -87,50 +2729,437 @@ class ManaiFreemiumAzureClient:
             
         return headers
     
-    def _make_request(self, endpoint: str, method: str = "GET", data: Optional[Dict] = None, 
-                     include_auth: bool = True, include_function_key: bool = True) -> Dict[str, Any]:
-        """Faz uma requisição HTTP para a API Azure."""
-        url = f"{self.base_url}/{endpoint}"
-        headers = self._get_headers(include_auth, include_function_key)
+    def _check_status(self, status_code: int, endpoint: str,
+                      include_auth: bool) -> Optional[Dict[str, Any]]:
+        """Converte status codes de erro conhecidos num dicionário de erro (None se não houver erro)."""
+        if status_code == 401:
+            if include_auth and self.config.get('token'):
+                self._token_rejected = True
+                self._save_validation(False)
+            return {"success": False, "error": "Token inválido ou expirado. Execute 'manai login'"}
+        elif status_code == 403:
+            return {"success": False, "error": "Acesso negado. Verifique a chave da função Azure"}
+        elif status_code == 404:
+            return {"success": False, "error": f"Endpoint não encontrado: {endpoint}"}
+        elif status_code == 429:
+            return {"success": False, "error": "Limite de consultas atingido. Considere fazer upgrade para ManAI Pro"}
+        elif status_code == 500:
+            return {"success": False, "error": "Erro interno do servidor Azure. Tente novamente mais tarde"}
+        return None
+    
+    def _retry_policy(self, endpoint: str, method: str) -> Dict[str, Any]:
+        """Política de novas tentativas de um endpoint (max_attempts 1 se não for idempotente)."""
+        policy = dict(self.retry_config)
+        policy.update(policy.pop("endpoints", {}).get(endpoint, {}))
+        idempotent = policy.get("idempotent", method.upper() == "GET" or endpoint in IDEMPOTENT_ENDPOINTS)
+        policy["idempotent"] = idempotent
+        if not policy["enabled"] or not idempotent:
+            policy["max_attempts"] = 1
+        return policy
+    
+    @staticmethod
+    def _can_fail_over(policy: Dict[str, Any], status_code: int) -> bool:
+        """Se uma resposta 5xx permite repetir o pedido noutro URL base."""
+        return status_code >= 500 and (policy["idempotent"] or status_code in FAILOVER_SAFE_STATUSES)
+    
+    @staticmethod
+    def _connect_failed(error: Exception) -> bool:
+        """Se o pedido falhou ao abrir a ligação, antes de chegar ao servidor."""
+        import requests
+        from urllib3.exceptions import NewConnectionError
         
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        reason = error.args[0] if error.args else None
+        reason = getattr(reason, "reason", reason)
+        httpx = sys.modules.get("httpx")
+        return isinstance(reason, NewConnectionError) or (httpx is not None and isinstance(reason, httpx.ConnectError))
+    
+    @staticmethod
+    def _retry_after(value: Optional[str]) -> Optional[float]:
+        """Converte o cabeçalho Retry-After (segundos ou data HTTP) em segundos."""
+        if not value:
+            return None
         try:
-            if method.upper() == "GET":
-                response = requests.get(url, headers=headers, timeout=120)  # Timeout maior para Azure
-            elif method.upper() == "POST":
-                response = requests.post(url, headers=headers, json=data, timeout=120)
-            elif method.upper() == "PUT":
-                response = requests.put(url, headers=headers, json=data, timeout=120)
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            from email.utils import parsedate_to_datetime
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError, IndexError):
+            return None
+    
+    @staticmethod
+    def _retry_delay(policy: Dict[str, Any], attempt: int, retry_after: Optional[float]) -> Optional[float]:
+        """
+        Espera antes da tentativa seguinte, ou None se não se deve voltar a tentar.
+        
+        Backoff exponencial com "full jitter" (espera aleatória entre 0 e base * 2^tentativa) para
+        que clientes em simultâneo não repitam os pedidos todos ao mesmo tempo. Um Retry-After do
+        servidor tem prioridade, desde que não exceda max_retry_after.
+        """
+        if attempt + 1 >= int(policy["max_attempts"]):
+            return None
+        if retry_after is not None:
+            if retry_after > float(policy["max_retry_after"]):
+                return None
+            return retry_after + random.uniform(0, float(policy["base_delay"]))
+        return random.uniform(0, min(float(policy["max_delay"]), float(policy["base_delay"]) * 2 ** attempt))
+    
+    def _circuit_open_error(self, base_url: str) -> Optional[Dict[str, Any]]:
+        """Erro imediato se o circuit breaker estiver aberto para este servidor."""
+        breaker = self.circuit_breaker
+        wait_time = breaker.retry_in(base_url) if breaker else 0
+        if not wait_time:
+            return None
+        return {"success": False, "circuitOpen": True,
+                "error": f"Azure Functions indisponíveis após falhas repetidas. Tente novamente dentro de {math.ceil(wait_time)}s"}
+    
+    def _record_outcome(self, status_code: Optional[int], base_url: str):
+        """Regista o resultado de um pedido no circuit breaker e no router (None = timeout ou erro de ligação)."""
+        if self.tracer is not None:
+            self.tracer.note(status=status_code)
+        failed = status_code is None or status_code >= 500
+        router = self.router
+        if router is not None:
+            if failed:
+                router.record_failure(base_url)
             else:
-                return {"success": False, "error": f"Método HTTP não suportado: {method}"}
-            
-            # Verificar status codes específicos
-            if response.status_code == 401:
-                return {"success": False, "error": "Token inválido ou expirado. Execute 'manai login'"}
-            elif response.status_code == 403:
-                return {"success": False, "error": "Acesso negado. Verifique a chave da função Azure"}
-            elif response.status_code == 404:
-                return {"success": False, "error": f"Endpoint não encontrado: {endpoint}"}
-            elif response.status_code == 429:
-                return {"success": False, "error": "Limite de consultas atingido. Considere fazer upgrade para ManAI Pro"}
-            elif response.status_code == 500:
-                return {"success": False, "error": "Erro interno do servidor Azure. Tente novamente mais tarde"}
-            
-            response.raise_for_status()
-            
-            # Tentar fazer parse do JSON
+                router.record_success(base_url)
+        breaker = self.circuit_breaker
+        if breaker is None:
+            return
+        if failed:
+            breaker.record_failure(base_url)
+        else:
+            breaker.record_success(base_url)
+    
+    def _encode_body(self, data: Dict[str, Any], headers: Dict[str, str]) -> bytes:
+        """Serializa o corpo em JSON compacto e comprime-o (gzip) se for grande e estiver activado."""
+        body = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        headers["Content-Type"] = "application/json; charset=utf-8"
+        if self.http_config["compress_requests"] and len(body) >= int(self.http_config["compress_min_bytes"]):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: formato gzip
+            body = compressor.compress(body) + compressor.flush()
+            headers["Content-Encoding"] = "gzip"
+        return body
+    
+    def _record_transfer(self, endpoint: str, sent: int, received: int, decoded: int,
+                         encoding: Optional[str] = None):
+        """Contabiliza os bytes de um pedido e mostra-os em stderr no modo verbose."""
+        with self._transfer_lock:
+            self.transfer_stats["requests"] += 1
+            self.transfer_stats["sent"] += sent
+            self.transfer_stats["received"] += received
+            self.transfer_stats["decoded"] += decoded
+        if self.tracer is not None:
+            self.tracer.note(sent=sent, received=received, decoded=decoded)
+        if self.verbose:
+            detail = f" ({format_bytes(decoded)} descomprimidos, {encoding})" if encoding else ""
+            print(f"📦 {endpoint}: ↑ {format_bytes(sent)} · ↓ {format_bytes(received)}{detail}", file=sys.stderr)
+    
+    @staticmethod
+    def _wire_bytes(response: "requests.Response") -> int:
+        """Bytes do corpo recebidos na rede (antes de descomprimir)."""
+        try:
+            return int(response.raw.tell())
+        except (AttributeError, TypeError, ValueError):
+            return len(response.content)
+    
+    @staticmethod
+    def _connect_timeout_error(seconds: float) -> Dict[str, Any]:
+        return {"success": False, "timeout": "connect",
+                "error": f"Sem conexão com Azure após {seconds:g}s. Verifique sua internet"}
+    
+    def _read_timeout_error(self, endpoint: str, seconds: float) -> Dict[str, Any]:
+        # Contar o timeout como amostra, para que o p99 (e o timeout seguinte) suba se o servidor ficou lento
+        self.latency_history.record(endpoint, seconds)
+        return {"success": False, "timeout": "read",
+                "error": f"Timeout na comunicação com Azure ({seconds:g}s). Tente novamente"}
+    
+    def _traced(self, endpoint: str, method: str, send: Callable[..., Dict[str, Any]], *args) -> Dict[str, Any]:
+        """Chama send(*args) dentro de um span do tracer, se estiver activo."""
+        if self.tracer is None:
+            return send(*args)
+        self.tracer.begin(endpoint, method)
+        result = {"success": False, "error": "excepção no cliente"}
+        try:
+            result = send(*args)
+            return result
+        finally:
+            self.tracer.end(result)
+    
+    def _make_request(self, endpoint: str, method: str = "GET", data: Optional[Dict] = None, 
+                     include_auth: bool = True, include_function_key: bool = True,
+                     params: Optional[Dict[str, Any]] = None,
+                     extra_headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Faz uma requisição HTTP para a API Azure, repetindo-a segundo a política do endpoint.
+        
+        Uma resposta 304 (pedido condicional) devolve {"success": True, "notModified": True};
+        se a resposta trouxer ETag, é incluída no resultado como "etag".
+        """
+        return self._traced(endpoint, method.upper(), self._send_request, endpoint, method, data,
+                            include_auth, include_function_key, params, extra_headers)
+    
+    def _send_request(self, endpoint: str, method: str, data: Optional[Dict], include_auth: bool,
+                      include_function_key: bool, params: Optional[Dict[str, Any]],
+                      extra_headers: Optional[Dict[str, str]]) -> Dict[str, Any]:
+        """
+        Ciclo de tentativas de _make_request. Com vários URLs base, um erro de ligação ou 5xx passa
+        de imediato ao URL seguinte (sem espera nem gastar uma tentativa); esgotados os URLs, segue
+        a política de novas tentativas, voltando a escolher pelo mais rápido dos saudáveis.
+        """
+        import requests
+        
+        headers = self._get_headers(include_auth, include_function_key)
+        headers.update(extra_headers or {})
+        
+        if method.upper() not in ("GET", "POST", "PUT"):
+            return {"success": False, "error": f"Método HTTP não suportado: {method}"}
+        
+        body = self._encode_body(data, headers) if data is not None and method.upper() != "GET" else None
+        policy = self._retry_policy(endpoint, method)
+        timeouts = self.get_timeouts(endpoint)
+        attempt = 0
+        urls = self._route()
+        index = 0
+        while True:
+            base_url = urls[index]
+            url = f"{base_url}/{endpoint}"
+            error = self._circuit_open_error(base_url)
+            if error:
+                if index + 1 < len(urls):
+                    index += 1
+                    continue
+                return error
+            
+            retry_after = None
+            retryable = failover = False
+            tracer = self.tracer
             try:
-                return response.json()
-            except json.JSONDecodeError:
-                # Se não for JSON válido, retornar texto como resposta
-                return {"success": True, "message": response.text}
-            
-        except requests.exceptions.Timeout:
-            return {"success": False, "error": "Timeout na comunicação com Azure. Tente novamente"}
-        except requests.exceptions.ConnectionError:
-            return {"success": False, "error": "Erro de conexão com Azure. Verifique sua internet"}
-        except requests.exceptions.RequestException as e:
-            return {"success": False, "error": f"Erro de comunicação: {str(e)}"}
+                if tracer:
+                    tracer.attempt()
+                    sent_at = time.perf_counter()
+                # Reutilizar o pool de ligações em vez de abrir uma ligação nova por pedido
+                response = self._get_http_session().request(
+                    method.upper(), url, headers=headers, data=body, params=params, timeout=timeouts,
+                    stream=tracer is not None
+                )
+                if tracer:
+                    # Com stream=True o pedido termina nos cabeçalhos; o corpo é lido a seguir
+                    headers_at = time.perf_counter()
+                    response.content
+                    tracer.exchange(sent_at, headers_at, time.perf_counter())
+                self._record_outcome(response.status_code, base_url)
+                self.latency_history.record(endpoint, response.elapsed.total_seconds())
+                self._record_transfer(endpoint, len(body or b""), self._wire_bytes(response),
+                                      len(response.content), response.headers.get("Content-Encoding"))
+                
+                if response.status_code in policy["retry_statuses"]:
+                    retry_after = self._retry_after(response.headers.get("Retry-After"))
+                
+                if response.status_code == 304:
+                    return {"success": True, "notModified": True}
+                
+                # Verificar status codes específicos
+                error = self._check_status(response.status_code, endpoint, include_auth)
+                if error:
+                    error["status"] = response.status_code
+                else:
+                    response.raise_for_status()
+                    
+                    # Tentar fazer parse do JSON
+                    parse_start = time.perf_counter()
+                    try:
+                        result = response.json()
+                    except json.JSONDecodeError:
+                        # Se não for JSON válido, retornar texto como resposta
+                        return {"success": True, "message": response.text}
+                    if tracer:
+                        tracer.phase("parse", time.perf_counter() - parse_start)
+                    if isinstance(result, dict) and response.headers.get("ETag"):
+                        result["etag"] = response.headers["ETag"]
+                    return result
+                
+                retryable = response.status_code in policy["retry_statuses"]
+                failover = self._can_fail_over(policy, response.status_code)
+                
+            except requests.exceptions.ConnectTimeout:
+                self._record_outcome(None, base_url)
+                error = self._connect_timeout_error(timeouts[0])
+                retryable = failover = True
+            except requests.exceptions.Timeout:
+                self._record_outcome(None, base_url)
+                error = self._read_timeout_error(endpoint, timeouts[1])
+                retryable, failover = True, policy["idempotent"]
+            except requests.exceptions.ConnectionError as e:
+                self._record_outcome(None, base_url)
+                error = {"success": False, "error": "Erro de conexão com Azure. Verifique sua internet"}
+                retryable, failover = True, policy["idempotent"] or self._connect_failed(e)
+            except requests.exceptions.HTTPError as e:
+                error = {"success": False, "error": f"Erro de comunicação: {str(e)}"}
+                if e.response is not None:
+                    error["status"] = e.response.status_code
+                    retryable = e.response.status_code in policy["retry_statuses"]
+                    failover = self._can_fail_over(policy, e.response.status_code)
+            except requests.exceptions.RequestException as e:
+                return {"success": False, "error": f"Erro de comunicação: {str(e)}"}
+            
+            if failover and index + 1 < len(urls):
+                index += 1
+                if tracer:
+                    tracer.note(error=error.get("error"), failover=urls[index])
+                continue
+            if not retryable:
+                return error
+            
+            delay = self._retry_delay(policy, attempt, retry_after)
+            attempt += 1
+            if delay is None:
+                if attempt > 1:
+                    error["attempts"] = attempt
+                return error
+            if tracer:
+                tracer.note(error=error.get("error"), delay=round(delay, 3))
+            time.sleep(delay)
+            urls, index = self._route(), 0
+    
+    def _stream_request(self, endpoint: str, data: Dict[str, Any],
+                        on_token: Callable[[str], None]) -> Dict[str, Any]:
+        """
+        Faz um POST em modo streaming e entrega o texto da resposta à medida que chega.
+        
+        O servidor responde com eventos SSE ("data: {...}"): eventos {"delta": "..."} com
+        partes da resposta e um evento final {"done": true, ...} com os restantes campos
+        (ThreadId, usageInfo, ...). Se o servidor responder com JSON normal, a resposta
+        completa é entregue de uma só vez (modo buffered).
+        
+        Returns:
+            Dicionário com a resposta, incluindo "timing" com "ttfb" e "total" em segundos
+        """
+        return self._traced(endpoint, "POST", self._send_stream, endpoint, data, on_token)
     
+    def _send_stream(self, endpoint: str, data: Dict[str, Any],
+                     on_token: Callable[[str], None]) -> Dict[str, Any]:
+        """Pedido em streaming de _stream_request."""
+        import requests
+        
+        headers = self._get_headers()
+        headers["Accept"] = "text/event-stream, application/json"
+        request_body = self._encode_body(dict(data, Stream=True), headers)
+        
+        policy = self._retry_policy(endpoint, "POST")
+        error = None
+        urls = self._route()
+        for index, base_url in enumerate(urls):
+            # Falhas antes de a resposta começar podem passar ao URL base seguinte
+            can_fail_over = index + 1 < len(urls)
+            error = self._circuit_open_error(base_url)
+            if error:
+                continue
+                
+            url = f"{base_url}/{endpoint}"
+            timeouts = self.get_timeouts(endpoint)
+            if self.tracer:
+                self.tracer.attempt()
+            start = time.perf_counter()
+            ttfb = None
+            try:
+                with self._get_http_session().post(url, headers=headers, data=request_body,
+                                                   timeout=timeouts, stream=True) as response:
+                    headers_at = time.perf_counter()
+                    self._record_outcome(response.status_code, base_url)
+                    if can_fail_over and self._can_fail_over(policy, response.status_code):
+                        error = {"success": False, "status": response.status_code,
+                                 "error": f"Erro do servidor ({response.status_code})"}
+                        continue
+                    error = self._check_status(response.status_code, endpoint, True)
+                    if error:
+                        return error
+                    response.raise_for_status()
+                    
+                    if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                        # Servidor sem suporte de streaming: resposta completa em JSON
+                        body = response.content
+                        decoded = len(body)
+                        ttfb = time.perf_counter() - start
+                        try:
+                            result = json.loads(body)
+                        except ValueError:
+                            result = {"success": True, "message": response.text}
+                        answer = result.get('answer') or result.get('Answer')
+                        if result.get('success') and answer:
+                            on_token(answer)
+                    else:
+                        result = {"success": True}
+                        parts = []
+                        event_data = []
+                        decoded = 0
+                        for line in response.iter_lines(decode_unicode=True):
+                            decoded += len(line.encode('utf-8')) + 1
+                            if ttfb is None:
+                                ttfb = time.perf_counter() - start
+                            if line.startswith("data:"):
+                                event_data.append(line[5:].lstrip())
+                                continue
+                            if line or not event_data:
+                                continue
+                                
+                            # Linha vazia: fim do evento
+                            raw = "\n".join(event_data)
+                            event_data = []
+                            if raw == "[DONE]":
+                                break
+                            try:
+                                event = json.loads(raw)
+                            except ValueError:
+                                event = {"delta": raw}
+                            if event.get("delta"):
+                                parts.append(event["delta"])
+                                on_token(event["delta"])
+                            if event.get("error"):
+                                result = {"success": False, "error": event["error"]}
+                                break
+                            if event.get("done"):
+                                result.update({k: v for k, v in event.items() if k not in ("done", "delta")})
+                                break
+                        if result.get("success") and not (result.get("answer") or result.get("Answer")):
+                            result["answer"] = "".join(parts)
+                            
+                    # Em chunked transfer encoding o urllib3 não conta os bytes lidos da rede
+                    self._record_transfer(endpoint, len(request_body), self._wire_bytes(response) or decoded,
+                                          decoded, response.headers.get("Content-Encoding"))
+                    if self.tracer:
+                        self.tracer.exchange(start, headers_at, time.perf_counter())
+                        
+                # Duração total, como nos pedidos sem streaming: response.elapsed só mede até aos
+                # cabeçalhos e baixaria o timeout de leitura das perguntas seguintes
+                self.latency_history.record(endpoint, time.perf_counter() - start)
+                result["streamed"] = True
+                result["timing"] = {"ttfb": ttfb, "total": time.perf_counter() - start}
+                return result
+                
+            except requests.exceptions.ConnectTimeout:
+                self._record_outcome(None, base_url)
+                error = self._connect_timeout_error(timeouts[0])
+                if can_fail_over:
+                    continue
+                return error
+            except requests.exceptions.Timeout:
+                self._record_outcome(None, base_url)
+                return self._read_timeout_error(endpoint, timeouts[1])
+            except requests.exceptions.ConnectionError as e:
+                self._record_outcome(None, base_url)
+                error = {"success": False, "error": "Erro de conexão com Azure. Verifique sua internet"}
+                if can_fail_over and (policy["idempotent"] or self._connect_failed(e)):
+                    continue
+                return error
+            except requests.exceptions.RequestException as e:
+                return {"success": False, "error": f"Erro de comunicação: {str(e)}"}
+        return error
+        
     def register(self, email: str, password: str, first_name: str, last_name: str, 
                 language: str = "pt") -> Dict[str, Any]:
         """Regista um novo utilizador."""
@@ -143,13 +3172,7 @@ class ManaiFreemiumAzureClient:
         }
         
         result = self._make_request("RegisterUser", "POST", data, include_auth=False)
-        
-        if result.get("success"):
-            # Guardar token e informações do utilizador
-            self.config["token"] = result["token"]
-            self.config["user"] = result["user"]
-            self._save_config()
-            
+        self._store_credentials(result)
         return result
     
     def login(self, email: str, password: str) -> Dict[str, Any]:
@@ -160,14 +3183,16 @@ class ManaiFreemiumAzureClient:
         }
         
         result = self._make_request("LoginUser", "POST", data, include_auth=False)
-        
+        self._store_credentials(result)
+        return result
+    
+    def _store_credentials(self, result: Dict[str, Any]):
+        """Guarda token e informações do utilizador após um registo ou login bem-sucedido."""
         if result.get("success"):
-            # Guardar token e informações do utilizador
             self.config["token"] = result["token"]
             self.config["user"] = result["user"]
             self._save_config()
-            
-        return result
+            self._save_validation(True)
     
     def logout(self):
         """Faz logout do utilizador."""
@@ -175,33 +3200,237 @@ class ManaiFreemiumAzureClient:
         self.config.pop("user", None)
         self._save_config()
         
-        # Limpar sessão
-        if os.path.exists(self.session_file):
-            os.remove(self.session_file)
+        # Limpar sessão, validação do token, ledger de quota, estatísticas e tier em cache
+        self.state.delete('session', 'validation', 'quota', 'usage_stats', 'tier_config')
     
     def get_profile(self) -> Dict[str, Any]:
         """Obtém o perfil do utilizador."""
         return self._make_request("GetUserProfile", "GET")
     
-    def get_tier_config(self) -> Dict[str, Any]:
-        """Obtém a configuração do tier actual."""
-        return self._make_request("GetTierConfiguration", "GET")
+    def get_tier_config(self, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Obtém a configuração do tier actual, da cache local enquanto tiver menos de
+        tier_cache.ttl segundos. Depois disso (ou com refresh=True) é revalidada com
+        If-None-Match: se o servidor responder 304, a cópia local continua válida.
+        Se o servidor não estiver acessível, a cópia local é devolvida com "stale": True.
+        """
+        key = self._quota_user_key()
+        entry = (self.state.get('tier_config') or {}).get(key)
+        if entry and not refresh and time.time() - entry['fetchedAt'] < self.tier_cache_config["ttl"]:
+            return entry['config']
+        
+        headers = {"If-None-Match": entry['etag']} if entry and entry.get('etag') else None
+        result = self._make_request("GetTierConfiguration", "GET", extra_headers=headers)
+        if result.get('notModified') and entry:
+            config = entry['config']
+        elif result.get('success', True) and not result.get('notModified'):
+            config = result
+            self._handle_tier_config(result)
+        else:
+            return dict(entry['config'], stale=True) if entry else result
+        
+        etag = result.pop('etag', None) or (entry or {}).get('etag')
+        # Os tiers necessários já conhecidos (ver _feature_checks) valem enquanto a configuração não mudar
+        required = (entry or {}).get('requiredTier') if result.get('notModified') else None
+        def change(cache: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            cache = cache or {}
+            cache[key] = {'config': config, 'etag': etag, 'fetchedAt': time.time()}
+            if required:
+                cache[key]['requiredTier'] = required
+            return cache
+        try:
+            self.state.update('tier_config', change)
+        except Exception:
+            # Sem cache, o próximo pedido volta a descarregar a configuração
+            pass
+        return config
+    
+    def _handle_tier_config(self, result: Dict[str, Any]):
+        """Actualiza o ledger de quota com o limite diário do tier."""
+        if result.get('success', True):
+            self._update_quota(limit=result.get('dailyQueryLimit'))
     
     def check_usage_limits(self, language: str = "pt") -> Dict[str, Any]:
         """Verifica os limites de utilização."""
         data = {"Language": language}
-        return self._make_request("CheckUsageLimit", "POST", data)
+        result = self._make_request("CheckUsageLimit", "POST", data)
+        self._handle_usage_limits(result)
+        return result
+    
+    def _handle_usage_limits(self, result: Dict[str, Any]):
+        """Actualiza o ledger de quota com a utilização devolvida por CheckUsageLimit."""
+        if result.get('success'):
+            self._update_quota(used=result.get('currentUsage'), limit=result.get('dailyLimit'))
     
     def get_usage_stats(self) -> Dict[str, Any]:
         """Obtém estatísticas de utilização."""
         return self._make_request("GetUsageStatistics", "GET")
     
     def check_feature_access(self, feature_name: str) -> Dict[str, Any]:
-        """Verifica acesso a uma funcionalidade específica."""
-        data = {"featureName": feature_name}
-        return self._make_request("CheckFeatureAccess", "POST", data)
+        """
+        Verifica acesso a uma funcionalidade específica. As incluídas no mapa "features" da
+        configuração do tier (em cache) são respondidas localmente; as restantes perguntam a
+        CheckFeatureAccess, a única que indica o tier necessário (requiredTier).
+        """
+        tier = self.get_tier_config()
+        features = tier.get('features') or {}
+        if tier.get('success', True) and features.get(feature_name):
+            return {"success": True, "featureName": feature_name, "hasAccess": True}
+        result = self._feature_checks([feature_name])[feature_name]
+        if not result.get('success', True) and tier.get('success', True) and feature_name in features:
+            # Sem resposta do servidor, o mapa do tier continua a saber que não está incluída
+            return {"success": True, "featureName": feature_name, "hasAccess": False}
+        return result
+    
+    def check_features(self, feature_names: List[str], refresh: bool = False) -> Dict[str, Any]:
+        """
+        Verifica várias funcionalidades de uma vez, a partir da configuração do tier (no máximo
+        um pedido, para revalidar a cache). As que o tier não inclui são confirmadas em paralelo
+        com CheckFeatureAccess, para saber o tier necessário.
+        
+        Returns:
+            Dicionário com tierType, features (nome -> True/False, ou None se o tier não a indicar)
+            e requiredTier (nome -> tier necessário, para as não disponíveis)
+        """
+        tier = self.get_tier_config(refresh)
+        if not tier.get('success', True):
+            return tier
+        features = tier.get('features') or {}
+        access = {name: bool(features[name]) if name in features else None for name in feature_names}
+        checks = self._feature_checks([name for name in feature_names if not access[name]])
+        required = {}
+        for name, check in checks.items():
+            # Sem resposta (ou sem o endpoint), fica o que o mapa do tier indicar
+            if check.get('success', True) and 'hasAccess' in check:
+                access[name] = bool(check['hasAccess'])
+                if not access[name] and check.get('requiredTier'):
+                    required[name] = check['requiredTier']
+        return {
+            "success": True,
+            "tierType": tier.get('tierType'),
+            "features": access,
+            "requiredTier": required,
+            "stale": bool(tier.get('stale')),
+        }
+    
+    def _feature_checks(self, feature_names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Resultado de CheckFeatureAccess por funcionalidade, em paralelo. O tier necessário das
+        recusadas fica guardado com a configuração do tier em cache e é reutilizado enquanto esta
+        for válida, sem voltar a perguntar ao servidor.
+        """
+        key = self._quota_user_key()
+        entry = (self.state.get('tier_config') or {}).get(key) or {}
+        known = entry.get('requiredTier') or {}
+        results = {name: {"success": True, "featureName": name, "hasAccess": False, "requiredTier": known[name]}
+                   for name in feature_names if name in known}
+        checks = self.run_concurrently({
+            name: lambda name=name: self._make_request("CheckFeatureAccess", "POST", {"featureName": name})
+            for name in feature_names if name not in known
+        })
+        learned = {name: check['requiredTier'] for name, check in checks.items()
+                   if check.get('success', True) and check.get('hasAccess') is False and check.get('requiredTier')}
+        if learned and entry:
+            def change(cache: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+                cache = cache or {}
+                if key in cache:
+                    cache[key].setdefault('requiredTier', {}).update(learned)
+                return cache
+            try:
+                self.state.update('tier_config', change)
+            except Exception:
+                pass
+        results.update(checks)
+        return results
+    
+    def _can_cache_answer(self, use_session: bool) -> bool:
+        """Indica se a cache de respostas se aplica (perguntas sem contexto, por omissão)."""
+        return bool(self.answer_cache_config["enabled"]) and (
+            not use_session or bool(self.answer_cache_config["with_session"]))
+    
+    def lookup_cached_answer(self, question: str, language: str = "pt",
+                             use_session: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Procura a resposta na cache local, sem rede nem consumo de quota.
+        
+        Returns:
+            Resultado no formato de ask_question (com "cached": True) ou None
+        """
+        if not self._can_cache_answer(use_session):
+            return None
+        entry = self.answer_cache.get(question, language)
+        if not entry:
+            return None
+        return {
+            "success": True,
+            "answer": entry['answer'],
+            "cached": True,
+            "cachedAt": datetime.fromtimestamp(entry['createdAt']).isoformat()
+        }
+    
+    def find_similar_answer(self, question: str, language: str = "pt",
+                            use_session: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Procura uma resposta guardada para uma pergunta semelhante (sem rede nem quota).
+        
+        Returns:
+            Resultado no formato de ask_question (com "similar": True) ou None
+        """
+        if not self.similar_config["enabled"] or not self._can_cache_answer(use_session):
+            return None
+        match = self.similar_index.search(question, language, float(self.similar_config["threshold"]))
+        if not match:
+            return None
+        score, entry = match
+        return {
+            "success": True,
+            "answer": entry['a'],
+            "similar": True,
+            "similarTo": entry['q'],
+            "similarity": score,
+            "mode": self.similar_config["mode"]
+        }
+    
+    def build_man_index(self, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+        """Constrói ou actualiza o índice local das páginas man."""
+        return self.man_index.build(progress)
+    
+    def search_man_pages(self, question: str, language: str = "pt") -> Optional[Dict[str, Any]]:
+        """
+        Procura a resposta nas páginas man instaladas, sem rede nem consumo de quota.
+        
+        A confiança (fracção dos termos da pergunta presentes no excerto) não basta para dispensar
+        o agente: "como apagar um ficheiro" cobre todos os termos de userdel(8). Só com
+        "answer_locally" o resultado é "confident", e apenas se o comando da página for um dos
+        termos da pergunta e o melhor excerto se destacar do seguinte (BM25, ver "margin").
+        
+        Returns:
+            Dicionário com "confidence", "confident" e "results" (excertos: página, secção,
+            opção e texto), ou None se não houver índice ou resultados
+        """
+        config = self.man_index_config
+        if not config["enabled"]:
+            return None
+        results = self.man_index.search(question, max(2, int(config["max_results"])))
+        if not results:
+            return None
+        score, confidence, doc = results[0]
+        runner_up = results[1][0] if len(results) > 1 else 0.0
+        confident = (bool(config["answer_locally"]) and confidence >= float(config["threshold"])
+                     and doc["p"].lower() in man_terms(question)
+                     and score >= runner_up * (1 + float(config["margin"])))
+        results = results[:int(config["max_results"])]
+        return {
+            "success": True,
+            "confidence": confidence,
+            "confident": confident,
+            "results": [{"page": doc["p"], "section": doc["s"], "option": doc["o"], "text": doc["t"],
+                         "confidence": conf} for _, conf, doc in results],
+        }
     
-    def ask_question(self, question: str, language: str = "pt", use_session: bool = True) -> Dict[str, Any]:
+    def ask_question(self, question: str, language: str = "pt", use_session: bool = True,
+                     use_cache: bool = True, refresh: bool = False,
+                     on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """
         Envia uma pergunta para o agente ManAI.
         
@@ -209,15 +3438,47 @@ class ManaiFreemiumAzureClient:
             question: A pergunta a fazer ao agente
             language: Idioma da resposta
             use_session: Se deve usar a sessão anterior para contexto
+            use_cache: Se deve usar a cache local de respostas
+            refresh: Ignorar a entrada em cache e actualizá-la com uma resposta nova
+            on_token: Se indicado, pede a resposta em streaming e chama-o com cada parte do texto
             
         Returns:
             Dicionário com a resposta do agente
         """
+        if use_cache and not refresh:
+            cached = self.lookup_cached_answer(question, language, use_session)
+            if cached:
+                return cached
+        
         # Verificar se está autenticado
         if not self.config.get('token'):
             return {"success": False, "error": "É necessário fazer login primeiro. Execute 'manai login'"}
         
-        # Preparar o payload
+        payload = self._question_payload(question, language, use_session)
+        
+        # Tentar primeiro a função freemium (se disponível)
+        def send() -> Dict[str, Any]:
+            if on_token:
+                return self._stream_request("ManaiAgentFreemiumHttpTrigger", payload, on_token)
+            return self._make_request("ManaiAgentFreemiumHttpTrigger", "POST", payload)
+        
+        # A mesma pergunta já em curso noutro processo: esperar pela resposta em vez de a repetir.
+        # Com o thread de uma sessão a resposta depende do contexto, pelo que só é partilhada se configurado.
+        flight = self.single_flight if use_cache else None
+        if flight and (not payload.get("ThreadId") or self.single_flight_config["with_session"]):
+            key = flight.key(self.url_spec, language, AnswerCache.normalize(question))
+            result = flight.run(key, send, reuse=not refresh)
+            if result.get('shared') and on_token:
+                on_token(result['answer'])
+                result["streamed"] = True
+        else:
+            result = send()
+        
+        self._handle_answer(question, language, use_session, use_cache, result, payload.get("ThreadId"))
+        return result
+    
+    def _question_payload(self, question: str, language: str, use_session: bool) -> Dict[str, Any]:
+        """Prepara o payload de uma pergunta, com o thread ID da sessão anterior se aplicável."""
         payload = {
             "Question": question,
             "Language": language
@@ -228,9 +3489,24 @@ class ManaiFreemiumAzureClient:
             session = self._load_session()
             if session and session.get('ThreadId'):
                 payload["ThreadId"] = session['ThreadId']
+        return payload
+    
+    def _handle_answer(self, question: str, language: str, use_session: bool, use_cache: bool,
+                       result: Dict[str, Any], sent_thread: Optional[str] = None):
+        """Actualiza quota, caches e sessão a partir da resposta do agente."""
+        # Actualizar ledger de quota com a utilização devolvida na resposta
+        usage_info = result.get('usageInfo') or {}
+        if result.get('success') and usage_info:
+            self._update_quota(used=usage_info.get('queriesUsedToday'), limit=usage_info.get('dailyLimit'))
         
-        # Tentar primeiro a função freemium (se disponível)
-        result = self._make_request("ManaiAgentFreemiumHttpTrigger", "POST", payload)
+        # Guardar resposta na cache local e no histórico
+        answer = result.get('answer') or result.get('Answer')
+        if result.get('success') and answer:
+            self._record_history(question, language, answer, result.get('ThreadId') or result.get('threadId'))
+        if result.get('success') and answer and use_cache and self._can_cache_answer(use_session):
+            self.answer_cache.put(question, language, answer)
+            if self.similar_config["enabled"]:
+                self.similar_index.add(question, language, answer)
         
         # Guardar informações da sessão se bem-sucedido
         if result.get('success') and use_session:
@@ -243,62 +3519,630 @@ class ManaiFreemiumAzureClient:
                     'SessionId': session_id,
                     'lastUsed': datetime.now().isoformat()
                 }
-                self._save_session(session_data)
+                self._save_session(session_data, previous_thread=sent_thread)
+    
+    def _record_history(self, question: str, language: str, answer: str, thread_id: Optional[str]):
+        """
+        Acrescenta uma resposta ao histórico numa thread de escrita, para não atrasar a resposta;
+        close() espera pelas escritas pendentes.
+        """
+        if not self.history_config["enabled"]:
+            return
+        if self._history_writer is None:
+            with self._state_lock:
+                if self._history_writer is None:
+                    self._history_writer = ThreadPoolExecutor(max_workers=1)
+        
+        def write():
+            try:
+                self.history.add(question, language, answer, thread_id)
+            except Exception:
+                # O histórico é auxiliar: uma falha de escrita não afecta a resposta
+                pass
+        self._history_writer.submit(write)
+    
+    def search_history(self, query: str = "", limit: Optional[int] = None,
+                       highlight: Tuple[str, str] = ("[", "]")) -> List[Dict[str, Any]]:
+        """Pesquisa o histórico local (ver HistoryStore.search)."""
+        if not os.path.exists(os.path.join(self.config_dir, "history.db")):
+            return []
+        return self.history.search(query, int(limit or self.history_config["max_results"]), highlight)
+    
+    def is_authenticated(self) -> bool:
+        """
+        Verifica se o utilizador está autenticado.
+        
+        O token só é validado no servidor (ValidateToken) quando está perto de expirar,
+        quando um pedido anterior recebeu 401 ou, para tokens sem "exp", quando a última
+        validação guardada é mais antiga que o TTL.
+        """
+        if not self.config.get('token'):
+            return False
+        if self._token_locally_valid():
+            return True
+        
+        # Tentar validar token (se função disponível)
+        result = self._make_request("ValidateToken", "POST")
+        return self._handle_validation(result)
+    
+    def _token_locally_valid(self) -> bool:
+        """Indica se o token pode ser aceite sem o validar no servidor."""
+        claims = decode_jwt_claims(self.config['token']) or {}
+        expires_at = claims.get('exp')
+        validation = self._load_validation()
+        now = time.time()
+        
+        if validation and not validation.get('valid'):
+            return False
+        if isinstance(expires_at, (int, float)):
+            return expires_at - now > TOKEN_EXPIRY_MARGIN
+        if validation:
+            ttl = self.config.get('token_validation_ttl', TOKEN_VALIDATION_TTL)
+            return now - validation.get('validatedAt', 0) < ttl
+        return False
+    
+    def _handle_validation(self, result: Dict[str, Any]) -> bool:
+        """Interpreta e guarda a resposta de ValidateToken."""
+        if result.get('valid') is not None:
+            self._save_validation(bool(result['valid']))
+            return result.get('valid', False)
+        
+        # Token rejeitado (401) durante a validação
+        if self._token_rejected:
+            return False
+        
+        # Se função de validação não disponível, assumir que token existe = autenticado
+        if "não encontrado" in result.get('error', '').lower():
+            self._save_validation(True)
+        return True
+    
+    def test_connection(self) -> Dict[str, Any]:
+        """Testa a conexão com as Azure Functions (com vários URLs base, sonda-os todos primeiro)."""
+        try:
+            router = self.router
+            if router is not None:
+                router.probe_now(self._probe_endpoints)
+            
+            # Testar função original primeiro
+            result = self._make_request("ManaiAgentHttpTrigger", "GET", include_auth=False)
+            
+            if result.get('success') or "método não permitido" in result.get('error', '').lower():
+                result = {
+                    "success": True, 
+                    "message": "Conexão com Azure Functions estabelecida",
+                    "functions_available": ["ManaiAgentHttpTrigger"]
+                }
+                if router is not None:
+                    result["endpoints"] = router.status()
+                return result
+            else:
+                return {
+                    "success": False,
+                    "error": f"Falha na conexão: {result.get('error')}"
+                }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Erro ao testar conexão: {str(e)}"
+            }
+
+class AsyncManaiClient:
+    """
+    Cliente assíncrono (asyncio + aiohttp) com a mesma interface do ManaiFreemiumAzureClient.
+    
+    Todos os pedidos partilham um único pool de ligações não bloqueante, pelo que centenas de
+    perguntas podem correr em simultâneo no mesmo event loop. O estado local (token, validação,
+    quota, cache de respostas e sessão) é o mesmo do cliente síncrono; como é lido e escrito em
+    ficheiros (flock, SQLite), esse trabalho corre no executor do loop e nunca no próprio loop.
+    
+    Requer o pacote opcional aiohttp (pip install aiohttp).
+    
+    Exemplo:
+        async with AsyncManaiClient() as client:
+            results = await asyncio.gather(*(client.ask_question(q, use_session=False) for q in questions))
+    """
+    
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, function_key: str = DEFAULT_FUNCTION_KEY,
+                 http_config: Optional[Dict[str, Any]] = None, max_connections: int = 100,
+                 retry_config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            base_url: URL base das Azure Functions em produção
+            function_key: Chave de acesso às Azure Functions
+            http_config: Opções do pool de ligações (ver DEFAULT_HTTP_CONFIG)
+            max_connections: Máximo de ligações em simultâneo no pool assíncrono
+            retry_config: Opções das novas tentativas (ver DEFAULT_RETRY_CONFIG)
+        """
+        self.local = ManaiFreemiumAzureClient(base_url, function_key, http_config, retry_config)
+        self.base_url = self.local.base_url
+        self.max_connections = max_connections
+        self._http_session = None
+    
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self.local.config
+    
+    def _get_http_session(self):
+        """Retorna a sessão aiohttp partilhada, criando o pool de ligações se necessário."""
+        if self._http_session is None or self._http_session.closed:
+            try:
+                import aiohttp
+            except ImportError:
+                raise RuntimeError("AsyncManaiClient requer o pacote aiohttp: pip install aiohttp")
+            
+            http_config = self.local.http_config
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections,
+                force_close=not http_config["keep_alive"]
+            )
+            # Os timeouts de ligação e leitura são definidos por pedido (ver get_timeouts)
+            self._http_session = aiohttp.ClientSession(connector=connector)
+        return self._http_session
+    
+    async def _blocking(self, func: Callable[..., Any], *args) -> Any:
+        """Executa trabalho bloqueante do estado local (ficheiros, flock, SQLite) fora do event loop."""
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+    
+    async def close(self):
+        """Fecha as ligações abertas no pool HTTP e guarda o histórico de latência."""
+        await self._blocking(self.local.close)
+        if self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    async def run_concurrently(self, calls: Dict[str, Callable[[], Awaitable[Any]]]) -> Dict[str, Any]:
+        """
+        Executa chamadas independentes aos endpoints em paralelo.
+        
+        Args:
+            calls: Mapa nome -> função sem argumentos que devolve uma coroutine
+            
+        Returns:
+            Mapa nome -> resultado; excepções são convertidas num dicionário de erro
+        """
+        import asyncio
+        
+        names = list(calls)
+        outcomes = await asyncio.gather(*(calls[name]() for name in names), return_exceptions=True)
+        results = {}
+        for name, outcome in zip(names, outcomes):
+            if isinstance(outcome, Exception):
+                outcome = {"success": False, "error": f"Erro inesperado: {str(outcome)}"}
+            results[name] = outcome
+        return results
+    
+    def _prepare(self, endpoint: str, method: str, data: Optional[Dict], include_auth: bool,
+                 include_function_key: bool) -> Tuple[Dict[str, str], Optional[bytes], Dict[str, Any],
+                                                      Tuple[float, float]]:
+        """Cabeçalhos, corpo, política de novas tentativas e timeouts de um pedido (lê config e estado)."""
+        headers = self.local._get_headers(include_auth, include_function_key)
+        body = self.local._encode_body(data, headers) if data is not None and method != "GET" else None
+        return headers, body, self.local._retry_policy(endpoint, method), self.local.get_timeouts(endpoint)
+    
+    def _on_response(self, endpoint: str, base_url: str, status: Optional[int], seconds: Optional[float] = None,
+                     include_auth: bool = True) -> Optional[Dict[str, Any]]:
+        """Regista o resultado no circuit breaker e na latência; devolve o erro do status, se houver."""
+        self.local._record_outcome(status, base_url)
+        if status is None:
+            return None
+        self.local.latency_history.record(endpoint, seconds)
+        return self.local._check_status(status, endpoint, include_auth)
+    
+    async def _make_request(self, endpoint: str, method: str = "GET", data: Optional[Dict] = None,
+                            include_auth: bool = True, include_function_key: bool = True) -> Dict[str, Any]:
+        """
+        Faz uma requisição HTTP não bloqueante para a API Azure, com a política de novas tentativas e
+        a passagem entre URLs base do cliente síncrono (ver ManaiFreemiumAzureClient._send_request).
+        """
+        import asyncio
+        import aiohttp
+        
+        method = method.upper()
+        if method not in ("GET", "POST", "PUT"):
+            return {"success": False, "error": f"Método HTTP não suportado: {method}"}
+        
+        headers, body, policy, (connect_timeout, read_timeout) = await self._blocking(
+            self._prepare, endpoint, method, data, include_auth, include_function_key)
+        timeout = aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+        attempt = 0
+        urls = await self._blocking(self.local._route)
+        index = 0
+        while True:
+            base_url = urls[index]
+            url = f"{base_url}/{endpoint}"
+            error = await self._blocking(self.local._circuit_open_error, base_url)
+            if error:
+                if index + 1 < len(urls):
+                    index += 1
+                    continue
+                return error
+            
+            retry_after = None
+            retryable = failover = False
+            start = time.perf_counter()
+            try:
+                async with self._get_http_session().request(
+                    method, url, headers=headers, data=body, timeout=timeout
+                ) as response:
+                    # Verificar status codes específicos
+                    error = await self._blocking(self._on_response, endpoint, base_url, response.status,
+                                                 time.perf_counter() - start, include_auth)
+                    if response.status in policy["retry_statuses"]:
+                        retry_after = self.local._retry_after(response.headers.get("Retry-After"))
+                    if not error and response.status >= 400:
+                        error = {"success": False, "error": f"Erro de comunicação: {response.status} {response.reason}"}
+                    if not error:
+                        # Tentar fazer parse do JSON (o aiohttp descomprime gzip/deflate/br)
+                        content = await response.read()
+                        self.local._record_transfer(endpoint, len(body or b""),
+                                                    response.content_length or len(content), len(content),
+                                                    response.headers.get("Content-Encoding"))
+                        try:
+                            return json.loads(content)
+                        except ValueError:
+                            # Se não for JSON válido, retornar texto como resposta
+                            return {"success": True, "message": content.decode('utf-8', errors='replace')}
+                    error["status"] = response.status
+                    retryable = response.status in policy["retry_statuses"]
+                    failover = self.local._can_fail_over(policy, response.status)
+            
+            except aiohttp.ServerTimeoutError as e:
+                await self._blocking(self._on_response, endpoint, base_url, None)
+                if isinstance(e, getattr(aiohttp, "ConnectionTimeoutError", ())):
+                    error = self.local._connect_timeout_error(connect_timeout)
+                    retryable = failover = True
+                else:
+                    error = await self._blocking(self.local._read_timeout_error, endpoint, read_timeout)
+                    retryable, failover = True, policy["idempotent"]
+            except asyncio.TimeoutError:
+                await self._blocking(self._on_response, endpoint, base_url, None)
+                error = {"success": False, "error": "Timeout na comunicação com Azure. Tente novamente"}
+                retryable, failover = True, policy["idempotent"]
+            except aiohttp.ClientConnectionError as e:
+                await self._blocking(self._on_response, endpoint, base_url, None)
+                error = {"success": False, "error": "Erro de conexão com Azure. Verifique sua internet"}
+                # Sem ligação estabelecida o pedido não chegou ao servidor: é seguro mudar de URL
+                retryable = True
+                failover = policy["idempotent"] or isinstance(e, aiohttp.ClientConnectorError)
+            except aiohttp.ClientError as e:
+                return {"success": False, "error": f"Erro de comunicação: {str(e)}"}
+            
+            if failover and index + 1 < len(urls):
+                index += 1
+                continue
+            if not retryable:
+                return error
+            
+            delay = self.local._retry_delay(policy, attempt, retry_after)
+            attempt += 1
+            if delay is None:
+                if attempt > 1:
+                    error["attempts"] = attempt
+                return error
+            await asyncio.sleep(delay)
+            urls, index = await self._blocking(self.local._route), 0
+    
+    async def register(self, email: str, password: str, first_name: str, last_name: str,
+                       language: str = "pt") -> Dict[str, Any]:
+        """Regista um novo utilizador."""
+        data = {
+            "Email": email,
+            "Password": password,
+            "FirstName": first_name,
+            "FastName": last_name,
+            "PreferredLanguage": language
+        }
+        result = await self._make_request("RegisterUser", "POST", data, include_auth=False)
+        await self._blocking(self.local._store_credentials, result)
+        return result
+    
+    async def login(self, email: str, password: str) -> Dict[str, Any]:
+        """Faz login do utilizador."""
+        data = {
+            "Email": email,
+            "Password": password
+        }
+        result = await self._make_request("LoginUser", "POST", data, include_auth=False)
+        await self._blocking(self.local._store_credentials, result)
+        return result
+    
+    async def logout(self):
+        """Faz logout do utilizador."""
+        await self._blocking(self.local.logout)
+    
+    async def get_profile(self) -> Dict[str, Any]:
+        """Obtém o perfil do utilizador."""
+        return await self._make_request("GetUserProfile", "GET")
+    
+    async def get_tier_config(self, refresh: bool = False) -> Dict[str, Any]:
+        """Obtém a configuração do tier actual, pela cache local com ETag (ver ManaiFreemiumAzureClient.get_tier_config)."""
+        return await self._blocking(self.local.get_tier_config, refresh)
+    
+    async def check_usage_limits(self, language: str = "pt") -> Dict[str, Any]:
+        """Verifica os limites de utilização."""
+        result = await self._make_request("CheckUsageLimit", "POST", {"Language": language})
+        await self._blocking(self.local._handle_usage_limits, result)
+        return result
+    
+    async def get_usage_stats(self) -> Dict[str, Any]:
+        """Obtém estatísticas de utilização."""
+        return await self._make_request("GetUsageStatistics", "GET")
+    
+    async def check_feature_access(self, feature_name: str) -> Dict[str, Any]:
+        """Verifica acesso a uma funcionalidade específica, pela configuração do tier em cache quando possível."""
+        return await self._blocking(self.local.check_feature_access, feature_name)
+    
+    async def check_features(self, feature_names: List[str], refresh: bool = False) -> Dict[str, Any]:
+        """Verifica várias funcionalidades de uma vez (ver ManaiFreemiumAzureClient.check_features)."""
+        return await self._blocking(self.local.check_features, feature_names, refresh)
+    
+    async def ask_question(self, question: str, language: str = "pt", use_session: bool = True,
+                           use_cache: bool = True, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Envia uma pergunta para o agente ManAI.
+        
+        Args:
+            question: A pergunta a fazer ao agente
+            language: Idioma da resposta
+            use_session: Se deve usar a sessão anterior para contexto
+            use_cache: Se deve usar a cache local de respostas
+            refresh: Ignorar a entrada em cache e actualizá-la com uma resposta nova
+            
+        Returns:
+            Dicionário com a resposta do agente
+        """
+        if use_cache and not refresh:
+            cached = await self._blocking(self.local.lookup_cached_answer, question, language, use_session)
+            if cached:
+                return cached
+        
+        # Verificar se está autenticado
+        if not await self._blocking(self._token):
+            return {"success": False, "error": "É necessário fazer login primeiro. Execute 'manai login'"}
         
+        payload = await self._blocking(self.local._question_payload, question, language, use_session)
+        result = await self._make_request("ManaiAgentFreemiumHttpTrigger", "POST", payload)
+        
+        # Actualização das caches (inclui escrita do índice de semelhança) fora do event loop
+        await self._blocking(self.local._handle_answer, question, language, use_session, use_cache, result,
+                             payload.get("ThreadId"))
         return result
     
-    def is_authenticated(self) -> bool:
-        """Verifica se o utilizador está autenticado."""
-        if not self.config.get('token'):
+    def _token(self) -> Optional[str]:
+        """Token guardado (a primeira leitura carrega config.json e o estado)."""
+        return self.local.config.get('token')
+    
+    async def is_authenticated(self) -> bool:
+        """Verifica se o utilizador está autenticado (ver ManaiFreemiumAzureClient.is_authenticated)."""
+        if not await self._blocking(self._token):
             return False
-        
-        # Tentar validar token (se função disponível)
-        result = self._make_request("ValidateToken", "POST")
-        if result.get('valid') is not None:
-            return result.get('valid', False)
-        
-        # Se função de validação não disponível, assumir que token existe = autenticado
-        return True
+        if await self._blocking(self.local._token_locally_valid):
+            return True
+        result = await self._make_request("ValidateToken", "POST")
+        return await self._blocking(self.local._handle_validation, result)
     
-    def test_connection(self) -> Dict[str, Any]:
+    async def test_connection(self) -> Dict[str, Any]:
         """Testa a conexão com as Azure Functions."""
         try:
-            # Testar função original primeiro
-            result = self._make_request("ManaiAgentHttpTrigger", "GET", include_auth=False)
-            
+            result = await self._make_request("ManaiAgentHttpTrigger", "GET", include_auth=False)
             if result.get('success') or "método não permitido" in result.get('error', '').lower():
                 return {
-                    "success": True, 
+                    "success": True,
                     "message": "Conexão com Azure Functions estabelecida",
                     "functions_available": ["ManaiAgentHttpTrigger"]
                 }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Falha na conexão: {result.get('error')}"
-                }
+            return {
+                "success": False,
+                "error": f"Falha na conexão: {result.get('error')}"
+            }
         except Exception as e:
             return {
                 "success": False,
                 "error": f"Erro ao testar conexão: {str(e)}"
             }
 
+# Métodos do cliente que o daemon aceita executar em nome do CLI
+DAEMON_METHODS = frozenset([
+    "is_authenticated", "needs_usage_check", "quota_remaining", "check_usage_limits",
+    "lookup_cached_answer", "find_similar_answer", "search_man_pages", "ask_question", "get_profile",
+    "get_tier_config", "get_usage_stats", "usage_statistics", "check_feature_access",
+    "check_features", "test_connection",
+])
+
+def daemon_socket_path() -> str:
+    """Caminho do socket Unix do daemon do utilizador actual."""
+    return os.path.join(os.path.expanduser("~/.config/manai"), "daemon.sock")
+
+class ManaiDaemonServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Daemon residente que mantém um ManaiFreemiumAzureClient quente (ligações abertas, token
+    validado, quota, caches e sessão) e executa pedidos do CLI recebidos num socket Unix.
+    
+    Protocolo: uma linha JSON por pedido ({"method", "args", "kwargs", "stream"}); a resposta
+    são linhas JSON {"delta": "..."} (apenas em streaming) seguidas de {"result": ...} ou {"error": ...}.
+    """
+    
+    daemon_threads = True
+    
+    def __init__(self, client: ManaiFreemiumAzureClient, socket_path: str):
+        self.client = client
+        self.socket_path = socket_path
+        old_umask = os.umask(0o177)  # Socket acessível apenas ao próprio utilizador
+        try:
+            super().__init__(socket_path, ManaiDaemonHandler)
+        finally:
+            os.umask(old_umask)
+    
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+
+class ManaiDaemonHandler(socketserver.StreamRequestHandler):
+    """Executa um pedido do CLI no cliente residente do daemon."""
+    
+    def _send(self, message: Dict[str, Any]):
+        self.wfile.write(json.dumps(message, separators=(',', ':')).encode('utf-8') + b"\n")
+        self.wfile.flush()
+    
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return self._send({"error": "Pedido inválido"})
+        
+        client = self.server.client
+        method = request.get("method")
+        if method == "hello":
+            return self._send({"result": {"base_url": client.url_spec, "function_key": client.function_key}})
+        if method == "shutdown":
+            self._send({"result": True})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        if method not in DAEMON_METHODS:
+            return self._send({"error": f"Método não suportado pelo daemon: {method}"})
+        
+        kwargs = request.get("kwargs") or {}
+        if request.get("stream"):
+            kwargs["on_token"] = lambda text: self._send({"delta": text})
+        try:
+            client.reload_config()
+            result = getattr(client, method)(*(request.get("args") or []), **kwargs)
+        except Exception as e:
+            return self._send({"error": f"Erro inesperado no daemon: {str(e)}"})
+        self._send({"result": result})
+
+class DaemonProxy:
+    """
+    Cliente leve que envia os pedidos ao daemon (manai --daemon) através do socket Unix.
+    
+    Expõe os mesmos métodos que o ManaiFreemiumAzureClient usados no caminho de uma pergunta;
+    cada chamada usa uma ligação própria ao socket, pelo que pode ser usada em várias threads.
+    """
+    
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+    
+    @classmethod
+    def connect(cls, base_url: str, function_key: str,
+                socket_path: Optional[str] = None) -> Optional["DaemonProxy"]:
+        """Liga ao daemon se estiver a correr com o mesmo URL e chave; caso contrário devolve None."""
+        proxy = cls(socket_path or daemon_socket_path())
+        try:
+            info = proxy._call("hello")
+        except (OSError, ValueError, RuntimeError):
+            return None
+        if info.get("base_url") != ",".join(split_base_urls(base_url)) or info.get("function_key") != function_key:
+            return None
+        return proxy
+    
+    def _call(self, method: str, *args, on_token: Optional[Callable[[str], None]] = None, **kwargs):
+        request = {"method": method, "args": list(args), "kwargs": kwargs, "stream": on_token is not None}
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(600)
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps(request, separators=(',', ':')).encode('utf-8') + b"\n")
+            with sock.makefile('rb') as stream:
+                for line in stream:
+                    message = json.loads(line)
+                    if "delta" in message:
+                        on_token(message["delta"])
+                    elif "error" in message:
+                        raise RuntimeError(message["error"])
+                    else:
+                        return message.get("result")
+        raise RuntimeError("Ligação ao daemon terminada sem resposta")
+    
+    def __getattr__(self, name: str):
+        if name not in DAEMON_METHODS:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._call(name, *args, **kwargs)
+    
+    def run_concurrently(self, calls: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """Executa chamadas independentes em paralelo (ver ManaiFreemiumAzureClient.run_concurrently)."""
+        with ThreadPoolExecutor(max_workers=max(1, len(calls))) as executor:
+            futures = {name: executor.submit(call) for name, call in calls.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = {"success": False, "error": f"Erro inesperado: {str(e)}"}
+        return results
+    
+    def close(self):
+        pass
+    
+    def shutdown(self):
+        """Pede ao daemon para terminar."""
+        return self._call("shutdown")
+
+def run_daemon(base_url: str, function_key: str, trace_file: Optional[str] = None):
+    """Corre o daemon em primeiro plano até receber SIGINT ou --daemon-stop."""
+    socket_path = daemon_socket_path()
+    if os.path.exists(socket_path):
+        try:
+            DaemonProxy(socket_path)._call("hello")
+            print(f"ℹ️  O daemon já está a correr em {socket_path}")
+            return
+        except (OSError, ValueError, RuntimeError):
+            os.remove(socket_path)  # Socket de um daemon que terminou sem limpar
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    
+    client = ManaiFreemiumAzureClient(base_url, function_key)
+    if trace_file:
+        client.tracer = RequestTracer(trace_file)
+    server = ManaiDaemonServer(client, socket_path)
+    
+    # Aquecer o pool de ligações e a validação do token antes do primeiro pedido
+    client.run_concurrently({"authenticated": client.is_authenticated, "connection": client.test_connection})
+    print(f"🚀 Daemon ManAI a escutar em {socket_path} (Ctrl+C para terminar)")
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        client.close()
+        print("👋 Daemon terminado")
+
 def print_welcome():
     """Imprime mensagem de boas-vindas."""
     print("🤖 ManAI Freemium Azure - O seu assistente de comandos Linux com IA")
     print("🌐 Conectado às Azure Functions em produção")
     print("=" * 65)
 
-def print_tier_info(client: ManaiFreemiumAzureClient):
+def print_tier_info(client: ManaiFreemiumAzureClient, refresh: bool = False):
     """Mostra informações sobre o tier actual."""
-    if not client.is_authenticated():
+    if not client.config.get('token'):
+        print("❌ Não autenticado. Execute 'manai login' primeiro.")
+        return
+    
+    # Tentar obter informações do perfil freemium (pedidos em paralelo)
+    results = client.run_concurrently({
+        "authenticated": client.is_authenticated,
+        "profile": client.get_profile,
+        "tier_config": lambda: client.get_tier_config(refresh),
+        "usage_stats": lambda: client.usage_statistics(refresh),
+    })
+    if not results["authenticated"]:
         print("❌ Não autenticado. Execute 'manai login' primeiro.")
         return
     
-    # Tentar obter informações do perfil freemium
-    profile = client.get_profile()
-    tier_config = client.get_tier_config()
-    usage_stats = client.get_usage_stats()
+    profile = results["profile"]
+    tier_config = results["tier_config"]
+    usage_stats = results["usage_stats"]
     
     # Se funções freemium não disponíveis, mostrar informação básica
     if not profile.get('success', True) and "não encontrado" in profile.get('error', '').lower():
@@ -323,17 +4167,8 @@ def print_tier_info(client: ManaiFreemiumAzureClient):
     if tier_config.get('dailyQueryLimit', 0) > 0:
         today_usage = 0
         if usage_stats.get('success', True) and usage_stats.get('dailyStatistics'):
-            # Data de hoje
-            today_str = datetime.now().date()
-
-            # Buscar estatísticas de hoje
-            today_stats = next(
-                (s for s in usage_stats['dailyStatistics']
-                if datetime.fromisoformat(s['date']).date() == today_str),
-                None
-            )
-            if today_stats:
-                today_usage = today_stats['queriesCount']
+            # O rollup local começa sempre no dia de hoje
+            today_usage = usage_stats['dailyStatistics'][0]['queriesCount']
         
         print(f"📊 Utilização hoje: {today_usage}/{tier_config['dailyQueryLimit']}")
     else:
@@ -348,6 +4183,279 @@ def print_tier_info(client: ManaiFreemiumAzureClient):
     print(f"   • Integração IDEs: {'✅' if features.get('ideIntegration') else '❌'}")
     print(f"   • Analytics: {'✅' if features.get('analytics') else '❌'}")
 
+class StreamPrinter:
+    """Mostra no terminal as partes de uma resposta em streaming à medida que chegam."""
+    
+    def __init__(self):
+        self.started = False
+    
+    def __call__(self, text: str):
+        if not self.started:
+            print("\n✅ Resposta do ManAI:")
+            print("-" * 50)
+            self.started = True
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+def run_batch(client: ManaiFreemiumAzureClient, questions, language: str = "pt", workers: int = 4,
+              ordered: bool = True, use_cache: bool = True, out=None) -> Dict[str, int]:
+    """
+    Responde a várias perguntas (uma por linha) com concorrência limitada, escrevendo JSONL.
+    
+    As linhas são lidas à medida que há capacidade, pelo que a memória usada não depende do
+    tamanho da entrada. Deixa de enviar perguntas quando a quota diária se esgota (ledger local
+    ou resposta 429); as restantes são marcadas como "skipped", mas as que estão em cache
+    continuam a ser respondidas.
+    
+    Args:
+        client: Cliente partilhado por todas as perguntas (pool de ligações comum)
+        questions: Iterável de linhas com perguntas (linhas vazias são ignoradas)
+        language: Idioma das respostas
+        workers: Número máximo de pedidos em simultâneo
+        ordered: Escrever pela ordem de entrada (True) ou de conclusão (False)
+        use_cache: Se deve usar a cache local de respostas
+        out: Destino do JSONL (por omissão sys.stdout)
+        
+    Returns:
+        Contagem de perguntas respondidas, com erro e não enviadas
+    """
+    out = out or sys.stdout
+    summary = {"answered": 0, "failed": 0, "skipped": 0}
+    window = max(1, workers) * 2      # Perguntas em curso ou à espera de ser escritas
+    pending = {}
+    finished: Dict[int, Dict[str, Any]] = {}
+    next_to_write = 0
+    quota_exhausted = False
+    
+    def emit(record: Dict[str, Any]):
+        if record.get("skipped"):
+            summary["skipped"] += 1
+        elif record.get("success"):
+            summary["answered"] += 1
+        else:
+            summary["failed"] += 1
+        out.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+        out.flush()
+    
+    def finish(index: int, record: Dict[str, Any]):
+        nonlocal next_to_write
+        if not ordered:
+            emit(record)
+            return
+        finished[index] = record
+        while next_to_write in finished:
+            emit(finished.pop(next_to_write))
+            next_to_write += 1
+    
+    def to_record(index: int, line_no: int, question: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        record = {"index": index, "line": line_no, "question": question, "success": bool(result.get('success'))}
+        if result.get('success'):
+            record["answer"] = result.get('answer') or result.get('Answer', '')
+            for key in ("cached", "shared", "usageInfo"):
+                if result.get(key):
+                    record[key] = result[key]
+        else:
+            record["error"] = result.get('error', 'Erro desconhecido')
+        if result.get('skipped'):
+            record["skipped"] = True
+        return record
+    
+    lines = ((line_no, line.strip()) for line_no, line in enumerate(questions, 1) if line.strip())
+    index = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) + len(finished) < window:
+                item = next(lines, None)
+                if item is None:
+                    exhausted = True
+                    break
+                line_no, question = item
+                
+                remaining = client.quota_remaining()
+                if remaining is not None and remaining - len(pending) <= 0:
+                    quota_exhausted = True
+                if quota_exhausted:
+                    result = (use_cache and client.lookup_cached_answer(question, language, False)) or {
+                        "success": False, "skipped": True, "error": "Limite de consultas diárias atingido"}
+                    finish(index, to_record(index, line_no, question, result))
+                else:
+                    future = executor.submit(client.ask_question, question, language,
+                                             use_session=False, use_cache=use_cache)
+                    pending[future] = (index, line_no, question)
+                index += 1
+            
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item_index, line_no, question = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"success": False, "error": f"Erro inesperado: {str(e)}"}
+                if "limite de consultas" in result.get('error', '').lower():
+                    quota_exhausted = True
+                finish(item_index, to_record(item_index, line_no, question, result))
+    
+    return summary
+
+# Mistura de perguntas por omissão do teste de carga: (pergunta, peso)
+LOADTEST_QUESTIONS = [
+    ("como listar ficheiros ocultos?", 8),
+    ("como procurar texto em todos os ficheiros de um directório?", 6),
+    ("como ver o espaço livre em disco?", 6),
+    ("como encontrar ficheiros modificados nas últimas 24 horas?", 5),
+    ("como ver que processo está a usar a porta 8080?", 5),
+    ("como copiar uma pasta para outro servidor com rsync mantendo as permissões?", 4),
+    ("como comprimir um directório em tar.gz?", 4),
+    ("como mudar o dono de todos os ficheiros de uma pasta recursivamente?", 3),
+    ("como ver os logs de um serviço systemd desde ontem?", 3),
+    ("how do I kill all processes matching a name?", 3),
+    ("how to show the 10 largest files under /var?", 2),
+    ("how do I create an ssh key and copy it to a server?", 2),
+    ("como agendar um script para correr todos os dias às 3h com cron?", 2),
+    ("explica a diferença entre hard links e symbolic links e quando usar cada um", 1),
+    ("como configurar uma regra de firewall com iptables para permitir só SSH a partir de uma rede?", 1),
+]
+
+def run_loadtest(client: ManaiFreemiumAzureClient, users: int = 10, duration: float = 30.0,
+                 ramp_up: float = 0.0, rate: Optional[float] = None, think: float = 0.0,
+                 questions: Optional[List[Tuple[str, float]]] = None, language: str = "pt",
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Teste de carga ao agente com a lógica de pedidos do cliente (pool, timeouts, compressão,
+    autenticação), mas sem efeitos locais: não usa caches, sessão, ledger de quota nem histórico.
+    
+    Closed loop (rate None): `users` utilizadores virtuais, cada um faz uma pergunta, espera a
+    resposta e pensa `think` segundos (em média, distribuição exponencial) antes da seguinte; os
+    utilizadores arrancam espaçados ao longo de ramp_up.
+    
+    Open loop (rate em pedidos/s): chegadas de Poisson, com a taxa a subir linearmente durante
+    ramp_up, servidas por até `users` threads. A latência conta desde a chegada prevista, para que
+    a fila no cliente não esconda a lentidão do servidor (coordinated omission).
+    
+    Args:
+        progress: Chamado a cada segundo com o resumo parcial
+        
+    Returns:
+        Resumo com pedidos, respostas, débito, percentis de latência e erros por tipo
+        (status HTTP, "timeout", "conexão", "circuit breaker")
+    """
+    mix = questions or LOADTEST_QUESTIONS
+    texts = [question for question, _ in mix]
+    weights = [weight for _, weight in mix]
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+    
+    def classify(result: Dict[str, Any]) -> Optional[str]:
+        if result.get('success'):
+            return None
+        if result.get('status'):
+            return str(result['status'])
+        if result.get('timeout'):
+            return "timeout"
+        if result.get('circuitOpen'):
+            return "circuit breaker"
+        return "conexão" if "conexão" in result.get('error', '').lower() else "outro"
+    
+    def ask(rng: random.Random, started: float):
+        question = rng.choices(texts, weights)[0]
+        try:
+            result = client._make_request("ManaiAgentFreemiumHttpTrigger", "POST",
+                                          client._question_payload(question, language, False))
+        except Exception as e:
+            result = {"success": False, "error": f"Erro inesperado: {str(e)}"}
+        latency = time.perf_counter() - started
+        kind = classify(result)
+        with lock:
+            if kind is None:
+                latencies.append(latency)
+            else:
+                errors[kind] = errors.get(kind, 0) + 1
+    
+    start = time.perf_counter()
+    deadline = start + duration
+    
+    def closed_user(index: int):
+        rng = random.Random(index)
+        time.sleep(max(0.0, start + ramp_up * index / max(1, users) - time.perf_counter()))
+        while time.perf_counter() < deadline:
+            ask(rng, time.perf_counter())
+            if think:
+                time.sleep(max(0.0, min(rng.expovariate(1 / think), deadline - time.perf_counter())))
+    
+    def open_arrivals(executor: ThreadPoolExecutor):
+        # Chegadas à taxa máxima, aceites com probabilidade taxa(t)/rate durante o ramp-up
+        rng = random.Random(0)
+        offset = 0.0
+        while True:
+            offset += rng.expovariate(rate)
+            if offset >= duration:
+                return
+            if ramp_up and offset < ramp_up and rng.random() > offset / ramp_up:
+                continue
+            time.sleep(max(0.0, start + offset - time.perf_counter()))
+            executor.submit(ask, random.Random(rng.random()), start + offset)
+    
+    def summary() -> Dict[str, Any]:
+        with lock:
+            ok = sorted(latencies)
+            failed = dict(errors)
+        elapsed = time.perf_counter() - start
+        def pct(q: float) -> Optional[float]:
+            return ok[min(len(ok) - 1, int(len(ok) * q))] if ok else None
+        return {
+            "elapsed": elapsed,
+            "requests": len(ok) + sum(failed.values()),
+            "ok": len(ok),
+            "throughput": len(ok) / elapsed if elapsed else 0.0,
+            "p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99), "max": ok[-1] if ok else None,
+            "errors": failed,
+        }
+    
+    with ThreadPoolExecutor(max_workers=max(1, users)) as executor:
+        if rate:
+            feeder = threading.Thread(target=open_arrivals, args=(executor,), daemon=True)
+        else:
+            feeder = threading.Thread(target=lambda: list(executor.map(closed_user, range(users))), daemon=True)
+        feeder.start()
+        while feeder.is_alive():
+            feeder.join(1.0)
+            if progress and feeder.is_alive():
+                progress(summary())
+    return summary()
+
+def print_man_answer(result: Dict[str, Any]):
+    """Mostra os excertos das páginas man encontrados no índice local."""
+    print(f"\n📖 Resposta das páginas man locais (confiança {result['confidence']:.0%}):")
+    print("-" * 50)
+    for item in result["results"]:
+        print(f"{item['page']}({item['section']})")
+        if item["option"]:
+            print(f"    {item['option']}")
+        print(f"        {item['text']}")
+
+def offer_similar_answer(client: ManaiFreemiumAzureClient, question: str, language: str,
+                         use_session: bool) -> Optional[Dict[str, Any]]:
+    """Propõe (ou usa directamente, no modo "auto") a resposta de uma pergunta semelhante."""
+    similar = client.find_similar_answer(question, language, use_session)
+    if not similar:
+        return None
+    if similar.get("mode") == "auto":
+        return similar
+    if not sys.stdin.isatty():
+        return None
+    
+    print(f"💡 Pergunta semelhante já respondida: \"{similar['similarTo']}\" "
+          f"(semelhança {similar['similarity']:.0%})")
+    try:
+        choice = input("Usar essa resposta? [S/n]: ").strip().lower()
+    except EOFError:
+        return None
+    return similar if choice in ("", "s", "sim", "y", "yes") else None
+
 def interactive_register(client: ManaiFreemiumAzureClient):
     """Processo interactivo de registo."""
     print("\n📝 Registo de novo utilizador")
@@ -411,12 +4519,21 @@ def interactive_login(client: ManaiFreemiumAzureClient):
         return False
 
 def main():
+    # Caminho rápido sem construir o parser
+    if sys.argv[1:] == ["--version"]:
+        print(VERSION)
+        return
+    
     parser = argparse.ArgumentParser(
         description="ManAI Freemium Azure - O seu assistente de comandos Linux com IA",
         epilog="Exemplos:\n"
                "  manai 'como listar ficheiros ocultos?'\n"
                "  manai 'criar um directório com permissões específicas'\n"
                "  manai --new-session 'como usar o comando find?'\n"
+               "  manai --batch perguntas.txt --workers 8 > respostas.jsonl\n"
+               "  manai --index && manai --offline 'find files modified in the last day'\n"
+               "  manai --history rsync\n"
+               "  manai --loadtest --url http://127.0.0.1:8765/api --users 50 --ramp-up 10\n"
                "  manai --register\n"
                "  manai --login\n"
                "  manai --status\n"
@@ -437,6 +4554,120 @@ def main():
         help="Iniciar uma nova sessão (ignorar contexto anterior)"
     )
     
+    parser.add_argument(
+        "--batch",
+        type=str,
+        metavar="FICHEIRO",
+        help="Responder às perguntas de um ficheiro (uma por linha, '-' para stdin) em JSONL"
+    )
+    
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Pedidos em simultâneo no modo --batch (padrão: 4)"
+    )
+    
+    parser.add_argument(
+        "--batch-order",
+        type=str,
+        default="input",
+        choices=["input", "completion"],
+        help="Ordem dos resultados no modo --batch (padrão: input)"
+    )
+    
+    parser.add_argument(
+        "--loadtest",
+        action="store_true",
+        help="Teste de carga ao agente em --url (ver --users, --duration, --ramp-up, --rate, --think)"
+    )
+    
+    parser.add_argument(
+        "--users",
+        type=int,
+        default=10,
+        help="Teste de carga: utilizadores virtuais (closed loop) ou máximo de pedidos em curso (padrão: 10)"
+    )
+    
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=30.0,
+        help="Teste de carga: duração em segundos (padrão: 30)"
+    )
+    
+    parser.add_argument(
+        "--ramp-up",
+        type=float,
+        default=0.0,
+        help="Teste de carga: segundos até atingir a carga total (padrão: 0)"
+    )
+    
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="Teste de carga em open loop: chegadas por segundo (sem --rate: closed loop)"
+    )
+    
+    parser.add_argument(
+        "--think",
+        type=float,
+        default=0.0,
+        help="Teste de carga em closed loop: pausa média entre perguntas de cada utilizador (s)"
+    )
+    
+    parser.add_argument(
+        "--questions",
+        type=str,
+        metavar="FICHEIRO",
+        help="Teste de carga: perguntas a usar, uma por linha, opcionalmente 'peso<TAB>pergunta'"
+    )
+    
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Mostrar a resposta à medida que é gerada (streaming)"
+    )
+    
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Não usar a cache local de respostas"
+    )
+    
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignorar a resposta em cache e pedir uma nova ao agente (com --stats/--status: sincronizar já)"
+    )
+    
+    parser.add_argument(
+        "--history",
+        type=str,
+        nargs="?",
+        const="",
+        metavar="TERMOS",
+        help="Pesquisar o histórico local de perguntas e respostas (sem termos: as mais recentes)"
+    )
+    
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Construir ou actualizar o índice local das páginas man (respostas offline)"
+    )
+    
+    parser.add_argument(
+        "--agent",
+        action="store_true",
+        help="Não consultar as páginas man locais (nem como reserva sem ligação ao Azure)"
+    )
+    
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Responder só com a cache e as páginas man locais, sem contactar o Azure"
+    )
+    
     parser.add_argument(
         "--language", "-l",
         type=str,
@@ -478,7 +4709,8 @@ def main():
     parser.add_argument(
         "--check-feature",
         type=str,
-        help="Verificar acesso a uma funcionalidade específica"
+        metavar="NOMES",
+        help="Verificar acesso a funcionalidades (separadas por vírgulas, ex.: analytics,ideIntegration)"
     )
     
     parser.add_argument(
@@ -487,30 +4719,195 @@ def main():
         help="Testar conexão com Azure Functions"
     )
     
+    parser.add_argument(
+        "--retries",
+        type=int,
+        metavar="N",
+        help="Novas tentativas em pedidos idempotentes após erros temporários (padrão: 2, 0 para desactivar)"
+    )
+    
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        metavar="SEGUNDOS",
+        help="Timeout de leitura fixo para todos os pedidos (padrão: adaptativo, pela latência observada)"
+    )
+    
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        metavar="SEGUNDOS",
+        help=f"Timeout de ligação ao servidor (padrão: {DEFAULT_TIMEOUT_CONFIG['connect']:g}s)"
+    )
+    
+    parser.add_argument(
+        "--verbose", "-v",
+        action="store_true",
+        help="Mostrar em stderr os bytes enviados e recebidos em cada pedido"
+    )
+    
+    parser.add_argument(
+        "--trace",
+        type=str,
+        nargs="?",
+        const=os.path.expanduser("~/.config/manai/trace.jsonl"),
+        metavar="FICHEIRO",
+        help="Registar um span JSON por pedido (fases DNS, TCP, TLS, TTFB, corpo, parse) "
+             "em FICHEIRO (padrão: ~/.config/manai/trace.jsonl; também MANAI_TRACE)"
+    )
+    
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="Usar HTTP/2 multiplexado (uma ligação para os pedidos em paralelo; requer httpx[http2])"
+    )
+    
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Correr como daemon residente (ligações e estado em memória) para acelerar as perguntas"
+    )
+    
+    parser.add_argument(
+        "--daemon-stop",
+        action="store_true",
+        help="Terminar o daemon residente"
+    )
+    
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Não usar o daemon, mesmo que esteja a correr"
+    )
+    
     parser.add_argument(
         "--url",
         type=str,
-        default="https://manai-agent-function-app.azurewebsites.net/api",
-        help="URL base da API Azure (padrão: https://manai-agent-function-app.azurewebsites.net/api)"
+        default=DEFAULT_BASE_URL,
+        help=f"URL base da API Azure (padrão: {DEFAULT_BASE_URL}); vários separados por vírgulas "
+             "usam o mais rápido dos que estão a responder"
     )
     
     parser.add_argument(
         "--function-key",
         type=str,
-        default="58H0KD8feP9x2e6uqY1wkwW-6MqwrNkWI6U4-jdsSa5EAzFuACdqNA==",
+        default=DEFAULT_FUNCTION_KEY,
         help="Chave de acesso às Azure Functions"
     )
     
     parser.add_argument(
         "--version",
         action="version",
-        version="manai-freemium-azure 2.0.0 - Modelo Freemium com Azure Functions"
+        version=VERSION
     )
 
     args = parser.parse_args()
     
+    trace_file = args.trace or trace_file_from_env()
+    if args.daemon:
+        run_daemon(args.url, args.function_key, trace_file)
+        return
+    
+    if args.daemon_stop:
+        proxy = DaemonProxy.connect(args.url, args.function_key)
+        if proxy:
+            proxy.shutdown()
+            print("✅ Daemon terminado")
+        else:
+            print("ℹ️  O daemon não está a correr")
+        return
+    
+    # Perguntas simples vão para o daemon, se estiver a correr; caso contrário, cliente local
+    client = None
+    only_query = args.query and not any([args.test_connection, args.register, args.login, args.logout,
+                                         args.status, args.stats, args.check_feature, args.batch,
+                                         args.index, args.history is not None, args.loadtest])
+    timeout_config = {}
+    if args.timeout is not None:
+        timeout_config["read"] = args.timeout
+    if args.connect_timeout is not None:
+        timeout_config["connect"] = args.connect_timeout
+    if (only_query and not args.no_daemon and args.retries is None and not timeout_config
+            and not args.verbose and not args.trace and not args.http2):
+        client = DaemonProxy.connect(args.url, args.function_key)
+    
     # Criar cliente Azure
-    client = ManaiFreemiumAzureClient(args.url, args.function_key)
+    if client is None:
+        retry_config = {"max_attempts": max(0, args.retries) + 1} if args.retries is not None else None
+        circuit_breaker_config = None
+        if args.loadtest:
+            # Medir o servidor tal como responde: sem novas tentativas (salvo --retries) nem circuit breaker
+            retry_config = retry_config or {"enabled": False}
+            circuit_breaker_config = {"enabled": False}
+        client = ManaiFreemiumAzureClient(args.url, args.function_key, retry_config=retry_config,
+                                          http_config={"http2": True} if args.http2 else None,
+                                          timeout_config=timeout_config,
+                                          circuit_breaker_config=circuit_breaker_config)
+        client.verbose = args.verbose
+        if trace_file:
+            client.tracer = RequestTracer(trace_file)
+    try:
+        _run_command(parser, args, client)
+    finally:
+        client.close()
+        stats = getattr(client, "transfer_stats", None)
+        if args.verbose and stats and stats["requests"]:
+            print(f"📦 Total: {stats['requests']} pedidos, ↑ {format_bytes(stats['sent'])} · "
+                  f"↓ {format_bytes(stats['received'])} ({format_bytes(stats['decoded'])} descomprimidos)",
+                  file=sys.stderr)
+
+def run_loadtest_command(client: ManaiFreemiumAzureClient, args: argparse.Namespace):
+    """Corre --loadtest e mostra o relatório."""
+    questions = None
+    if args.questions:
+        try:
+            with open(args.questions, 'r', encoding='utf-8') as f:
+                questions = []
+                for line in f:
+                    weight, _, text = line.strip().rpartition("\t")
+                    if text:
+                        questions.append((text, float(weight) if weight else 1.0))
+        except (IOError, ValueError) as e:
+            print(f"❌ Não foi possível ler {args.questions}: {e}", file=sys.stderr)
+            sys.exit(1)
+    
+    # Uma ligação por utilizador virtual; a latência do teste não altera os timeouts do uso normal
+    client.http_config["pool_maxsize"] = max(int(client.http_config["pool_maxsize"]), args.users)
+    client.latency_key = "latency_loadtest"
+    
+    mode = f"open loop, {args.rate:g} pedidos/s, até {args.users} em curso" if args.rate \
+        else f"closed loop, {args.users} utilizadores" + (f", pausa {args.think:g} s" if args.think else "")
+    ramp = f", ramp-up {args.ramp_up:g} s" if args.ramp_up else ""
+    print(f"🔥 Teste de carga a {', '.join(client.base_urls)}: {mode}, {args.duration:g} s{ramp}")
+    
+    def progress(partial: Dict[str, Any]):
+        if sys.stderr.isatty():
+            print(f"\r   {partial['elapsed']:5.0f} s · {partial['requests']} pedidos · "
+                  f"{partial['throughput']:.1f}/s · {sum(partial['errors'].values())} erros",
+                  end="", file=sys.stderr, flush=True)
+    
+    result = run_loadtest(client, users=args.users, duration=args.duration, ramp_up=args.ramp_up,
+                          rate=args.rate, think=args.think, questions=questions,
+                          language=args.language, progress=progress)
+    if sys.stderr.isatty():
+        print(file=sys.stderr)
+    
+    def ms(value: Optional[float]) -> str:
+        return f"{value * 1000:.0f} ms" if value is not None else "-"
+    
+    failed = sum(result['errors'].values())
+    print(f"\n📊 Pedidos: {result['requests']} ({result['ok']} respondidos, {failed} com erro) "
+          f"em {result['elapsed']:.1f} s")
+    print(f"⚡ Débito: {result['throughput']:.1f} respostas/s")
+    print(f"⏱️  Latência das respostas: p50 {ms(result['p50'])} · p95 {ms(result['p95'])} · "
+          f"p99 {ms(result['p99'])} · máx {ms(result['max'])}")
+    if failed:
+        print("❌ Erros:")
+        for kind, count in sorted(result['errors'].items(), key=lambda item: -item[1]):
+            print(f"   {kind}: {count} ({count / result['requests'] * 100:.1f}%)")
+
+def _run_command(parser: argparse.ArgumentParser, args: argparse.Namespace, client: ManaiFreemiumAzureClient):
+    """Executa o comando pedido na linha de comandos."""
     
     # Testar conexão se solicitado
     if args.test_connection:
@@ -520,12 +4917,18 @@ def main():
             print(f"✅ {result.get('message')}")
             if result.get('functions_available'):
                 print(f"📋 Funções disponíveis: {', '.join(result['functions_available'])}")
+            if result.get('endpoints'):
+                print("🌍 URLs base (pela ordem de preferência):")
+                for endpoint in result['endpoints']:
+                    latency = f"{endpoint['ewma'] * 1000:.0f} ms" if endpoint['ewma'] is not None else "sem medições"
+                    print(f"   {'✅' if endpoint['healthy'] else '❌'} {endpoint['url']} ({latency})")
         else:
             print(f"❌ {result.get('error')}")
         return
     
     # Mostrar boas-vindas se nenhum comando específico
-    if not any([args.register, args.login, args.logout, args.status, args.stats, args.check_feature, args.query]):
+    if not any([args.register, args.login, args.logout, args.status, args.stats, args.check_feature,
+                args.batch, args.index, args.history is not None, args.loadtest, args.query]):
         print_welcome()
         parser.print_help()
         return
@@ -545,21 +4948,28 @@ def main():
         return
     
     if args.status:
-        print_tier_info(client)
+        print_tier_info(client, args.refresh)
         return
     
     if args.stats:
-        if not client.is_authenticated():
+        results = client.run_concurrently({
+            "authenticated": client.is_authenticated,
+            "stats": lambda: client.usage_statistics(args.refresh),
+        })
+        if not results["authenticated"]:
             print("❌ É necessário fazer login primeiro")
             return
         
-        stats = client.get_usage_stats()
+        stats = results["stats"]
         if stats.get('success', True):
             print(f"\n📊 Estatísticas de Utilização")
             print("-" * 30)
             print(f"Total de consultas: {stats.get('totalQueries', 0)}")
             print(f"Média por dia: {stats.get('averageQueriesPerDay', 0):.1f}")
-            print(f"Tier actual: {stats.get('currentTier', 'N/A').upper()}")
+            print(f"Tier actual: {(stats.get('currentTier') or 'N/A').upper()}")
+            if stats.get('stale'):
+                synced = datetime.fromtimestamp(stats['syncedAt']).strftime('%d/%m %H:%M')
+                print(f"⚠️  Sem ligação ao servidor: dados sincronizados em {synced}")
             
             if stats.get('dailyStatistics'):
                 print("\nÚltimos 7 dias:")
@@ -574,18 +4984,31 @@ def main():
         return
     
     if args.check_feature:
-        if not client.is_authenticated():
+        names = [name.strip() for name in args.check_feature.split(",") if name.strip()]
+        results = client.run_concurrently({
+            "authenticated": client.is_authenticated,
+            "features": lambda: client.check_features(names, args.refresh),
+        })
+        if not results["authenticated"]:
             print("❌ É necessário fazer login primeiro")
             return
         
-        result = client.check_feature_access(args.check_feature)
+        result = results["features"]
         if result.get('success', True):
-            feature = result.get('featureName', args.check_feature)
-            has_access = result.get('hasAccess', False)
-            required_tier = result.get('requiredTier', 'unknown')
-            
-            status = "✅ Disponível" if has_access else f"❌ Requer tier {required_tier.upper()}"
-            print(f"Funcionalidade '{feature}': {status}")
+            tier = (result.get('tierType') or 'N/A').upper()
+            for feature, has_access in result['features'].items():
+                required_tier = result.get('requiredTier', {}).get(feature)
+                if has_access:
+                    status = "✅ Disponível"
+                elif required_tier:
+                    status = f"❌ Requer tier {required_tier.upper()}"
+                elif has_access is None:
+                    status = f"❓ Não consta da configuração do tier {tier}"
+                else:
+                    status = f"❌ Não incluída no tier {tier}"
+                print(f"Funcionalidade '{feature}': {status}")
+            if result.get('stale'):
+                print("⚠️  Sem ligação ao servidor: configuração do tier em cache")
         else:
             if "não encontrado" in result.get('error', '').lower():
                 print("ℹ️  Verificação de funcionalidades não disponível na versão actual")
@@ -593,35 +5016,149 @@ def main():
                 print(f"❌ Erro: {result.get('error')}")
         return
     
+    if args.history is not None:
+        start = time.perf_counter()
+        highlight = ("\033[1m", "\033[0m") if sys.stdout.isatty() else ("[", "]")
+        entries = client.search_history(args.history, highlight=highlight)
+        elapsed = time.perf_counter() - start
+        if not entries:
+            print("ℹ️  Nenhuma pergunta encontrada no histórico")
+            return
+        for entry in entries:
+            date = datetime.fromtimestamp(entry['askedAt']).strftime('%d/%m/%Y %H:%M')
+            print(f"\n🕘 {date} [{entry['language']}] {entry['question']}")
+            print("   " + " ".join(entry['snippet'].split()))
+        print(f"\n{len(entries)} resultado(s) em {elapsed * 1000:.1f} ms")
+        return
+    
+    if args.index:
+        print("📚 A indexar as páginas man...")
+        start = time.perf_counter()
+        def progress(done: int, total: int):
+            if sys.stdout.isatty() and (done % 50 == 0 or done == total):
+                print(f"\r   {done}/{total} páginas", end="", flush=True)
+        stats = client.build_man_index(progress)
+        if sys.stdout.isatty() and stats["parsed"]:
+            print()
+        print(f"✅ Índice actualizado em {time.perf_counter() - start:.1f} s: {stats['pages']} páginas "
+              f"({stats['parsed']} novas ou alteradas, {stats['removed']} removidas), "
+              f"{stats['docs']} excertos, {stats['terms']} termos")
+        if not args.query:
+            return
+    
+    # Processar ficheiro de perguntas (uma por linha) em modo batch
+    if args.loadtest:
+        run_loadtest_command(client, args)
+        return
+    
+    if args.batch:
+        # Uma ligação por worker no pool partilhado
+        client.http_config["pool_maxsize"] = max(int(client.http_config["pool_maxsize"]), args.workers)
+        if not client.is_authenticated():
+            print("❌ Não autenticado. Execute 'manai login' primeiro.", file=sys.stderr)
+            sys.exit(1)
+        if client.needs_usage_check():
+            client.check_usage_limits(args.language)
+        
+        start = time.perf_counter()
+        try:
+            source = sys.stdin if args.batch == "-" else open(args.batch, 'r', encoding='utf-8')
+        except IOError as e:
+            print(f"❌ Não foi possível abrir {args.batch}: {e}", file=sys.stderr)
+            sys.exit(1)
+        with source:
+            summary = run_batch(client, source, args.language, workers=args.workers,
+                                ordered=args.batch_order == "input", use_cache=not args.no_cache)
+        print(f"📦 Batch concluído em {time.perf_counter() - start:.1f} s: "
+              f"{summary['answered']} respondidas, {summary['failed']} com erro, "
+              f"{summary['skipped']} não enviadas", file=sys.stderr)
+        if summary['failed'] or summary['skipped']:
+            sys.exit(1)
+        return
+    
     # Processar pergunta
     if args.query:
+        use_session = not args.new_session
+        use_cache = not args.no_cache
         
-        if not client.is_authenticated():
-            print("❌ Não autenticado. Execute 'manai login' primeiro.")
-            return
+        # Resposta em cache: sem autenticação, rede nem consumo de quota
+        result = None
+        if use_cache and not args.refresh:
+            result = client.lookup_cached_answer(args.query, args.language, use_session)
+            if not result:
+                result = offer_similar_answer(client, args.query, args.language, use_session)
         
-        # Verificar limites se sistema freemium disponível
-        limits = client.check_usage_limits(args.language)
-        if limits.get('success') and not limits.get('canMakeQuery', True):
-            print("❌ Limite de consultas diárias atingido!")
-            print(f"📊 Utilização: {limits.get('currentUsage', 0)}/{limits.get('dailyLimit', 0)}")
-            print("💡 Considere fazer upgrade para ManAI Pro para consultas ilimitadas")
-            return
+        # Páginas man locais: respondem com --offline (ou, com "answer_locally", se o resultado for
+        # claro); caso contrário ficam de reserva para o caso de não haver ligação ao Azure
+        man_result = None
+        if not result and not args.agent:
+            man_result = client.search_man_pages(args.query, args.language)
+            if man_result and (man_result["confident"] or args.offline):
+                print(f"🤖 Pergunta: {args.query}")
+                print_man_answer(man_result)
+                print("\n💡 Use --agent para perguntar ao agente ManAI")
+                return
         
-        print(f"🤖 Pergunta: {args.query}")
-        print("⏳ A processar com IA no Azure...")
+        if not result and args.offline:
+            print(f"🤖 Pergunta: {args.query}")
+            print("❌ Sem resposta local (cache ou páginas man). Execute 'manai --index' ou remova --offline")
+            sys.exit(1)
         
-        # Fazer a pergunta
-        result = client.ask_question(args.query, args.language, use_session=not args.new_session)
+        if result:
+            print(f"🤖 Pergunta: {args.query}")
+        else:
+            # Validar autenticação e, se o ledger local estiver perto do limite ou for um novo dia,
+            # verificar limites no servidor (se sistema freemium disponível) em paralelo
+            calls = {"authenticated": client.is_authenticated}
+            if client.needs_usage_check():
+                calls["limits"] = lambda: client.check_usage_limits(args.language)
+            results = client.run_concurrently(calls)
+            if not results["authenticated"]:
+                print("❌ Não autenticado. Execute 'manai login' primeiro.")
+                return
+            
+            limits = results.get("limits", {})
+            if limits.get('success') and not limits.get('canMakeQuery', True):
+                print("❌ Limite de consultas diárias atingido!")
+                print(f"📊 Utilização: {limits.get('currentUsage', 0)}/{limits.get('dailyLimit', 0)}")
+                print("💡 Considere fazer upgrade para ManAI Pro para consultas ilimitadas")
+                return
+            
+            print(f"🤖 Pergunta: {args.query}")
+            print("⏳ A processar com IA no Azure...")
+            
+            # Fazer a pergunta (em streaming, o texto é mostrado à medida que chega)
+            on_token = None
+            if args.stream:
+                on_token = StreamPrinter()
+            result = client.ask_question(args.query, args.language, use_session=use_session,
+                                         use_cache=use_cache, refresh=args.refresh, on_token=on_token)
+            if on_token and on_token.started:
+                print()
         
         # Mostrar resultado
         if result.get('success'):
             # Obter resposta (compatível com ambos os formatos)
             answer = result.get('answer') or result.get('Answer', 'Sem resposta')
             
-            print("\n✅ Resposta do ManAI:")
-            print("-" * 50)
-            print(answer)
+            if not result.get('streamed'):
+                print("\n✅ Resposta do ManAI:")
+                print("-" * 50)
+                print(answer)
+            
+            timing = result.get('timing')
+            if timing:
+                ttfb = f"{timing['ttfb']:.2f} s" if timing.get('ttfb') is not None else "N/A"
+                print(f"\n⏱️  Primeiro byte: {ttfb} · Total: {timing['total']:.2f} s")
+            
+            if result.get('cached'):
+                print("\n⚡ Resposta da cache local (use --refresh para pedir uma nova)")
+            elif result.get('similar'):
+                print(f"\n♻️  Resposta reutilizada de: \"{result['similarTo']}\" (use --refresh para pedir uma nova)")
+            elif result.get('shared') == "recent":
+                print("\n🔁 Resposta de uma pergunta igual respondida há instantes (use --refresh para pedir uma nova)")
+            elif result.get('shared'):
+                print("\n🤝 Resposta partilhada de uma pergunta igual feita ao mesmo tempo noutro terminal")
             
             # Mostrar informação da utilização se disponível
             usage_info = result.get('usageInfo', {})
@@ -649,6 +5186,9 @@ def main():
                 print("\n🔧 Solução: Execute 'manai --login' para autenticar")
             elif "limite" in error_msg:
                 print("\n🔧 Solução: Aguarde até amanhã ou faça upgrade para ManAI Pro")
+            elif man_result and ("conexão" in error_msg or "timeout" in error_msg):
+                # Sem ligação ao Azure: mostrar o que as páginas man locais têm
+                print_man_answer(man_result)
             elif "conexão" in error_msg or "timeout" in error_msg:
                 print("\n🔧 Sugestões:")
                 print("- Verifique a sua ligação à internet")
@@ -2,6 +2,7 @@
 
 SCRIPT_NAME="manai"
 INSTALL_DIR="$HOME/.local/bin"
+LIB_DIR="$HOME/.local/lib/manai"
 EXPORT_LINE="export PATH=\"$INSTALL_DIR:\$PATH\""
 
 echo "A desinstalar o comando $SCRIPT_NAME..."
@@ -14,6 +15,12 @@ else
     echo "Arquivo $INSTALL_DIR/$SCRIPT_NAME não encontrado."
 fi
 
+# Remover o módulo instalado
+if [ -d "$LIB_DIR" ]; then
+    rm -rf "$LIB_DIR"
+    echo "Removido $LIB_DIR"
+fi
+
 # Função para remover a linha do PATH do arquivo shellrc
 remove_path_from_shellrc() {
     local shell_rc="$1"
@@ -14,6 +14,12 @@ setup(
     install_requires=[
         "requests>=2.25.0",
     ],
+    extras_require={
+        # Transporte HTTP/2 multiplexado (manai --http2)
+        "http2": ["httpx[http2]>=0.23"],
+        # Cliente assíncrono (AsyncManaiClient)
+        "async": ["aiohttp>=3.8"],
+    },
     author="Rosco Edutec",
     author_email="rusacorreia@hotmail.com",
     description="Assistente de Terminal Linux com IA",
@@ -0,0 +1,61 @@
+"""
+Fixtures comuns: um HOME temporário por teste e o servidor local de bench/mock_azure.py.
+
+Os testes importam install/manai.py e bench/mock_azure.py directamente, tal como os scripts
+de bench/.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "install"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+import manai  # noqa: E402
+from mock_azure import MockAzureServer, TEST_USER, make_token  # noqa: E402
+
+
+@pytest.fixture
+def config_dir(tmp_path, monkeypatch):
+    """~/.config/manai de um HOME temporário (o cliente resolve o directório no construtor)."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.delenv("MANAI_TRACE", raising=False)
+    path = tmp_path / ".config" / "manai"
+    path.mkdir(parents=True)
+    return path
+
+
+@pytest.fixture
+def server():
+    with MockAzureServer(daily_limit=0) as srv:
+        yield srv
+
+
+@pytest.fixture
+def make_client(config_dir):
+    """
+    Cria clientes autenticados contra os URLs indicados; as secções passadas como argumentos
+    (ex.: retry={"max_attempts": 1}) são gravadas em config.json.
+    """
+    clients = []
+
+    def make(base_url, **sections):
+        config = {"token": make_token(), "user": TEST_USER}
+        config.update(sections)
+        (config_dir / "config.json").write_text(json.dumps(config))
+        client = manai.ManaiFreemiumAzureClient(base_url)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def dead_url() -> str:
+    """URL de uma porta local sem servidor (ligação recusada)."""
+    return "http://127.0.0.1:9/api"
@@ -0,0 +1,43 @@
+"""Cache de respostas em disco: normalização da chave e expulsão LRU/TTL."""
+
+import os
+import time
+
+import manai
+
+
+def test_normalized_questions_share_an_entry(tmp_path):
+    cache = manai.AnswerCache(str(tmp_path))
+    cache.put("Como listar ficheiros?", "pt", "ls")
+    assert cache.get("  como   listar ficheiros ", "pt")["answer"] == "ls"
+    assert cache.get("Como listar ficheiros?", "en") is None
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    cache = manai.AnswerCache(str(tmp_path), ttl=60)
+    cache.put("pergunta", "pt", "resposta")
+    path = cache._path("pergunta", "pt")
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    # Uma escrita nova expulsa as entradas expiradas pelo mtime...
+    cache.put("outra", "pt", "resposta")
+    assert not os.path.exists(path)
+    # ...e uma leitura recusa as que foram criadas há mais de ttl segundos
+    cache = manai.AnswerCache(str(tmp_path), ttl=0.05)
+    time.sleep(0.1)
+    assert cache.get("outra", "pt") is None
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    cache = manai.AnswerCache(str(tmp_path))
+    for i, question in enumerate(["a", "b", "c"]):
+        cache.put(question, "pt", os.urandom(2000).hex())
+        stamp = time.time() - 100 + i
+        os.utime(cache._path(question, "pt"), (stamp, stamp))
+    # Ler "a" torna-a a mais recente; a menos usada passa a ser "b"
+    assert cache.get("a", "pt")
+    size = sum(size for _, _, size in cache._entries())
+    cache.max_bytes = size - 1
+    cache._evict()
+    assert cache.get("b", "pt") is None
+    assert cache.get("a", "pt") and cache.get("c", "pt")
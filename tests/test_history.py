@@ -0,0 +1,42 @@
+"""Histórico local com pesquisa de texto integral (FTS5, ou LIKE sem FTS5)."""
+
+import manai
+
+
+def make_history(tmp_path):
+    history = manai.HistoryStore(str(tmp_path / "history.db"))
+    history.add("como listar ficheiros ocultos", "pt", "Use ls -a para ver os ficheiros ocultos", asked_at=1)
+    history.add("how to compress a directory", "en", "tar -czf dir.tar.gz dir", asked_at=2)
+    history.add("como ver processos", "pt", "ps aux mostra todos os processos e ficheiros abertos com lsof",
+                asked_at=3)
+    return history
+
+
+def test_question_matches_rank_above_answer_matches(tmp_path):
+    results = make_history(tmp_path).search("ficheiros")
+    assert [r["question"] for r in results] == ["como listar ficheiros ocultos", "como ver processos"]
+
+
+def test_prefix_and_accent_insensitive_search(tmp_path):
+    history = make_history(tmp_path)
+    assert [r["question"] for r in history.search("compress")] == ["how to compress a directory"]
+    assert [r["question"] for r in history.search("processo")] == ["como ver processos"]
+    assert history.search("ficheiros ocultos", highlight=("<", ">"))[0]["snippet"].count("<") >= 1
+
+
+def test_all_words_must_match(tmp_path):
+    history = make_history(tmp_path)
+    assert [r["question"] for r in history.search("ficheiros lsof")] == ["como ver processos"]
+    assert history.search("ficheiros kubernetes") == []
+
+
+def test_empty_query_lists_the_most_recent(tmp_path):
+    results = make_history(tmp_path).search("", limit=2)
+    assert [r["question"] for r in results] == ["como ver processos", "how to compress a directory"]
+
+
+def test_like_fallback_without_fts(tmp_path):
+    history = make_history(tmp_path)
+    history._connection()
+    history.fts = False
+    assert [r["question"] for r in history.search("ocultos")] == ["como listar ficheiros ocultos"]
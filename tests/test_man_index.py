@@ -0,0 +1,109 @@
+"""Interpretação do roff das páginas man e pesquisa BM25 no índice local."""
+
+import gzip
+
+import manai
+
+FROB = r""".\" Página de teste
+.TH FROB 1 "2024" "frob 1.0"
+.SH NAME
+frob \- frobnicate widgets in a directory
+.SH SYNOPSIS
+.B frob
+[\fIOPTION\fR]... \fIDIR\fR
+.SH OPTIONS
+.TP
+\fB\-r\fR, \fB\-\-recursive\fR
+frobnicate widgets in subdirectories\(em recursively
+.TP
+.B \-q
+.TQ
+.B \-\-quiet
+do not print the names of frobnicated widgets
+.IP "\-n COUNT" 4
+stop after COUNT widgets
+"""
+
+GADGET = r""".Dd January 1, 2024
+.Dt GADGET 1
+.Sh NAME
+.Nm gadget
+.Nd compress gadget archives
+.Sh DESCRIPTION
+.Bl -tag -width Ds
+.It Fl z Ar level
+compression level for the gadget archive
+.El
+"""
+
+
+def test_roff_escapes_and_fonts_are_removed():
+    assert manai.roff_to_text(r"\fB\-r\fR, \fB\-\-recursive\fR") == "-r, --recursive"
+    assert manai.roff_to_text(r"a\(emb \*(lqquoted\*(rq") == 'a—b "quoted"'
+
+
+def test_man_items_and_summary():
+    summary, items = manai.parse_man_page(FROB)
+    assert summary == "frob - frobnicate widgets in a directory"
+    terms = dict(items)
+    assert terms["-r, --recursive"] == "frobnicate widgets in subdirectories— recursively"
+    assert "-q, --quiet" in terms
+    assert terms["-n COUNT"] == "stop after COUNT widgets"
+
+
+def test_mdoc_items():
+    summary, items = manai.parse_man_page(GADGET)
+    assert summary == "gadget - compress gadget archives"
+    assert items == [("-z level", "compression level for the gadget archive")]
+
+
+def build_index(tmp_path):
+    man1 = tmp_path / "man" / "man1"
+    man1.mkdir(parents=True)
+    (man1 / "frob.1").write_text(FROB)
+    with gzip.open(man1 / "gadget.1.gz", "wt") as f:
+        f.write(GADGET)
+    index = manai.ManPageIndex(str(tmp_path / "man.idx"), paths=[str(tmp_path / "man")], sections=["1"])
+    return index, index.build()
+
+
+def test_build_is_incremental(tmp_path):
+    index, stats = build_index(tmp_path)
+    assert (stats["pages"], stats["parsed"], stats["reused"]) == (2, 2, 0)
+    assert stats["docs"] == 6
+    again = manai.ManPageIndex(index.index_file, paths=index.paths, sections=["1"]).build()
+    assert (again["parsed"], again["reused"]) == (0, 2)
+
+
+def test_bm25_ranks_the_matching_option_first(tmp_path):
+    index, _ = build_index(tmp_path)
+    results = index.search("frob widgets recursively", limit=3)
+    score, confidence, doc = results[0]
+    assert (doc["p"], doc["o"]) == ("frob", "-r, --recursive")
+    assert confidence == 1.0
+    assert score > results[1][0]
+
+    score, confidence, doc = index.search("gadget compression level")[0]
+    assert (doc["p"], doc["o"]) == ("gadget", "-z level")
+
+
+def test_unknown_terms_lower_the_confidence(tmp_path):
+    index, _ = build_index(tmp_path)
+    _, confidence, _ = index.search("frob widgets kubernetes")[0]
+    assert confidence < 1.0
+    assert index.search("kubernetes") == []
+
+
+def test_client_only_answers_locally_when_asked_and_the_command_is_named(tmp_path, make_client, server):
+    man = {"paths": [str(tmp_path / "man")], "sections": ["1"]}
+    build_index(tmp_path)
+    client = make_client(server.base_url, man_index=man)
+    client.man_index.build()
+    # Por omissão os excertos nunca dispensam o agente
+    assert not client.search_man_pages("frob widgets recursively")["confident"]
+
+    client = make_client(server.base_url, man_index=dict(man, answer_locally=True))
+    client.man_index.build()
+    assert client.search_man_pages("frob widgets recursively")["confident"]
+    # Sem o nome do comando na pergunta, a cobertura dos termos não chega
+    assert not client.search_man_pages("widgets recursively")["confident"]
@@ -0,0 +1,87 @@
+"""Novas tentativas com backoff e Retry-After, e circuit breaker partilhado."""
+
+import time
+
+import manai
+from mock_azure import MockAzureServer
+
+AGENT = "ManaiAgentFreemiumHttpTrigger"
+
+
+def test_retry_delay_uses_full_jitter_within_the_cap():
+    policy = {"max_attempts": 5, "base_delay": 0.5, "max_delay": 2.0, "max_retry_after": 30.0}
+    for attempt in range(4):
+        for _ in range(50):
+            delay = manai.ManaiFreemiumAzureClient._retry_delay(policy, attempt, None)
+            assert 0 <= delay <= min(2.0, 0.5 * 2 ** attempt)
+    assert manai.ManaiFreemiumAzureClient._retry_delay(policy, 4, None) is None
+
+
+def test_retry_after_takes_priority_up_to_the_limit():
+    policy = {"max_attempts": 3, "base_delay": 0.1, "max_delay": 0.5, "max_retry_after": 5.0}
+    # O Retry-After (mais um pouco de jitter) substitui o backoff, mesmo acima de max_delay
+    assert 2.0 <= manai.ManaiFreemiumAzureClient._retry_delay(policy, 0, 2.0) <= 2.1
+    assert manai.ManaiFreemiumAzureClient._retry_after("1.5") == 1.5
+    # Um Retry-After acima de max_retry_after não é esperado: desiste
+    assert manai.ManaiFreemiumAzureClient._retry_delay(policy, 0, 60.0) is None
+
+
+def test_idempotent_call_is_retried_honouring_retry_after(make_client):
+    with MockAzureServer(error_rate=1.0, error_status=503, retry_after="0.2") as server:
+        client = make_client(server.base_url, retry={"max_attempts": 3, "base_delay": 0.05},
+                             circuit_breaker={"enabled": False})
+        start = time.perf_counter()
+        result = client.get_profile()
+        elapsed = time.perf_counter() - start
+
+    assert not result["success"]
+    assert result["attempts"] == 3
+    assert server.state.snapshot()["byEndpoint"]["GetUserProfile"] == 3
+    # Duas esperas de 0,2 s pelo Retry-After; o backoff sozinho não passaria de 0,15 s
+    assert 0.4 <= elapsed < 2
+
+
+def test_agent_question_is_not_retried(make_client):
+    with MockAzureServer(error_rate=1.0, error_status=500, retry_after="0") as server:
+        client = make_client(server.base_url, retry={"max_attempts": 3},
+                             circuit_breaker={"enabled": False})
+        result = client._make_request(AGENT, "POST", {"Question": "ls?"})
+
+    assert result["status"] == 500
+    assert server.state.snapshot()["byEndpoint"][AGENT] == 1
+
+
+def test_circuit_opens_after_repeated_failures_and_fails_fast(make_client):
+    with MockAzureServer(error_rate=1.0, error_status=503) as server:
+        client = make_client(server.base_url, retry={"max_attempts": 1},
+                             circuit_breaker={"failure_threshold": 2, "cooldown": 30})
+        client.get_profile()
+        client.get_profile()
+        result = client.get_profile()
+        requests = server.state.snapshot()["byEndpoint"]["GetUserProfile"]
+
+    assert result.get("circuitOpen")
+    assert requests == 2
+
+
+def test_circuit_state_is_shared_between_clients(make_client):
+    with MockAzureServer(error_rate=1.0, error_status=503) as server:
+        sections = {"retry": {"max_attempts": 1}, "circuit_breaker": {"failure_threshold": 2, "cooldown": 30}}
+        first = make_client(server.base_url, **sections)
+        first.get_profile()
+        first.get_profile()
+        second = make_client(server.base_url, **sections)
+        assert second.get_profile().get("circuitOpen")
+
+
+def test_half_open_lets_a_single_probe_through(config_dir):
+    store = manai.StateStore(str(config_dir / "state.db"))
+    breaker = manai.CircuitBreaker(store, failure_threshold=1, cooldown=0.1)
+    breaker.record_failure("url")
+    assert breaker.retry_in("url") > 0
+    time.sleep(0.15)
+    assert breaker.retry_in("url") == 0
+    # O período de experiência foi reservado: os restantes continuam a esperar
+    assert breaker.retry_in("url") > 0
+    breaker.record_success("url")
+    assert breaker.retry_in("url") == 0
@@ -0,0 +1,77 @@
+"""Escolha do URL base pela latência (EWMA) e passagem ao URL seguinte em caso de falha."""
+
+import asyncio
+
+import pytest
+
+import manai
+from conftest import dead_url
+from mock_azure import MockAzureServer
+
+AGENT = "ManaiAgentFreemiumHttpTrigger"
+
+
+@pytest.fixture
+def store(config_dir):
+    return manai.StateStore(str(config_dir / "state.db"))
+
+
+def test_ewma_and_ranking(store):
+    router = manai.EndpointRouter(["a", "b", "c"], store, ewma_alpha=0.5)
+    router.record_success("a", 0.4)
+    router.record_success("a", 0.2)
+    router.record_success("b", 0.1)
+    assert router._read()["a"]["ewma"] == 0.3
+    # Os mais rápidos primeiro; os URLs ainda sem medições ficam depois, pela ordem configurada
+    assert router.ranked() == ["b", "a", "c"]
+
+    router.record_failure("b")
+    assert router.ranked() == ["a", "c", "b"]
+    router.record_success("b")
+    assert router.ranked() == ["b", "a", "c"]
+
+
+def test_router_state_is_shared_through_the_state_store(store, config_dir):
+    manai.EndpointRouter(["a", "b"], store).record_success("b", 0.1)
+    other = manai.EndpointRouter(["a", "b"], manai.StateStore(str(config_dir / "state.db")))
+    assert other.ranked() == ["b", "a"]
+
+
+def test_connection_error_fails_over_to_the_next_url(make_client, server):
+    client = make_client(f"{dead_url()},{server.base_url}", retry={"max_attempts": 1},
+                         endpoints={"probe_interval": 3600})
+    assert client.get_profile()["success"]
+    # Um pedido não idempotente também muda de URL: a ligação nem chegou a abrir
+    assert client._make_request(AGENT, "POST", {"Question": "ls?"})["success"]
+    assert client.router.ranked()[0] == server.base_url
+
+
+def test_server_error_fails_over_only_when_safe(make_client, server):
+    with MockAzureServer(error_rate=1.0, error_status=500) as failing:
+        client = make_client(f"{failing.base_url},{server.base_url}", retry={"max_attempts": 1},
+                             circuit_breaker={"enabled": False}, endpoints={"probe_interval": 3600})
+        # 500 num pedido não idempotente pode já ter sido processado: não se repete noutro URL
+        assert client._make_request(AGENT, "POST", {"Question": "ls?"})["status"] == 500
+        assert AGENT not in server.state.snapshot()["byEndpoint"]
+
+        # 503 garante que o pedido não foi processado
+        failing.state.error_status = 503
+        assert client._make_request(AGENT, "POST", {"Question": "ls?"})["success"]
+        assert server.state.snapshot()["byEndpoint"][AGENT] == 1
+
+        assert client.get_profile()["success"]
+        assert client.router.ranked() == [server.base_url, failing.base_url]
+
+
+def test_async_client_fails_over(make_client, server):
+    pytest.importorskip("aiohttp")
+    make_client(server.base_url)
+
+    async def ask():
+        async with manai.AsyncManaiClient(f"{dead_url()},{server.base_url}",
+                                          retry_config={"max_attempts": 1}) as client:
+            return await client.get_profile(), await client.ask_question("ls?", use_session=False)
+
+    profile, answer = asyncio.run(ask())
+    assert profile["success"] and answer["success"]
+    assert server.state.snapshot()["byEndpoint"]["GetUserProfile"] == 1
@@ -0,0 +1,34 @@
+"""Partilha de perguntas iguais entre processos: pedido em curso vs. resposta recente."""
+
+import threading
+import time
+
+import manai
+
+
+def answer(text, delay=0.0):
+    def call():
+        time.sleep(delay)
+        return {"success": True, "answer": text}
+    return call
+
+
+def test_waiting_for_a_request_in_flight_is_shared(tmp_path):
+    flight = manai.SingleFlight(str(tmp_path), wait=5, reuse=10)
+    key = flight.key("pt", "pergunta")
+    first = threading.Thread(target=flight.run, args=(key, answer("resposta", delay=0.3)))
+    first.start()
+    time.sleep(0.1)
+    result = flight.run(key, answer("outra"))
+    first.join()
+    assert result == {"success": True, "answer": "resposta", "shared": "inflight"}
+
+
+def test_repeating_a_finished_question_is_a_recent_reuse(tmp_path):
+    flight = manai.SingleFlight(str(tmp_path), wait=5, reuse=10)
+    key = flight.key("pt", "pergunta")
+    assert "shared" not in flight.run(key, answer("resposta"))
+    assert flight.run(key, answer("outra"))["shared"] == "recent"
+    # --refresh: só aceita respostas de pedidos em curso
+    assert flight.run(key, answer("nova"), reuse=False) == {"success": True, "answer": "nova"}
+
@@ -0,0 +1,52 @@
+"""Configuração do tier em cache, revalidada com ETag/If-None-Match (304)."""
+
+TIER = "GetTierConfiguration"
+
+
+def test_fresh_cache_makes_no_request(make_client, server):
+    client = make_client(server.base_url)
+    assert client.get_tier_config()["tierType"] == "free"
+    assert client.get_tier_config()["tierType"] == "free"
+    assert server.state.snapshot()["byEndpoint"][TIER] == 1
+
+
+def test_expired_cache_is_revalidated_with_a_304(make_client, server):
+    client = make_client(server.base_url, tier_cache={"ttl": 0})
+    first = client.get_tier_config()
+    received = server.state.snapshot()["bytesOut"]
+
+    second = client.get_tier_config()
+    snapshot = server.state.snapshot()
+    assert snapshot["byEndpoint"][TIER] == 2
+    # 304 sem corpo: a configuração vem da cópia local
+    assert snapshot["bytesOut"] == received
+    assert second == first
+
+
+def test_changed_configuration_replaces_the_cache(make_client, server):
+    client = make_client(server.base_url, tier_cache={"ttl": 0})
+    client.get_tier_config()
+    server.state.daily_limit = 25
+    assert client.get_tier_config()["dailyQueryLimit"] == 25
+    assert client.get_tier_config(refresh=True)["dailyQueryLimit"] == 25
+
+
+def test_cached_copy_is_served_stale_when_the_server_is_down(make_client, server):
+    client = make_client(server.base_url, tier_cache={"ttl": 0}, retry={"max_attempts": 1})
+    client.get_tier_config()
+    server.state.error_rate = 1.0
+    result = client.get_tier_config()
+    assert result["stale"]
+    assert result["tierType"] == "free"
+
+
+def test_feature_checks_keep_the_required_tier(make_client, server):
+    client = make_client(server.base_url)
+    result = client.check_features(["analytics", "customCommands"])
+    assert result["features"] == {"analytics": True, "customCommands": False}
+    assert result["requiredTier"] == {"customCommands": "pro"}
+    assert server.state.snapshot()["byEndpoint"]["CheckFeatureAccess"] == 1
+
+    # O tier necessário fica em cache com a configuração do tier
+    assert client.check_features(["customCommands"])["requiredTier"] == {"customCommands": "pro"}
+    assert server.state.snapshot()["byEndpoint"]["CheckFeatureAccess"] == 1
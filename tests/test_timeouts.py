@@ -0,0 +1,43 @@
+"""Timeouts de ligação e leitura, adaptados à latência observada."""
+
+from mock_azure import MockAzureServer
+
+
+def test_initial_timeouts_without_history(make_client, server):
+    client = make_client(server.base_url)
+    connect, read = client.get_timeouts("GetUserProfile")
+    assert connect == 4.0
+    assert read >= client.timeout_config["floor"]
+
+
+def test_read_timeout_follows_the_observed_p99(make_client, server):
+    client = make_client(server.base_url, timeouts={"min_samples": 10, "multiplier": 3.0, "floor": 1.0})
+    for _ in range(20):
+        client.latency_history.record("GetUserProfile", 2.0)
+    assert client.get_timeouts("GetUserProfile")[1] == 6.0
+    # Limitado ao tecto configurado
+    for _ in range(20):
+        client.latency_history.record("GetUserProfile", 100.0)
+    assert client.get_timeouts("GetUserProfile")[1] == client.timeout_config["ceiling"]
+
+
+def test_latency_history_is_shared_through_the_state_store(make_client, server):
+    first = make_client(server.base_url, timeouts={"min_samples": 5, "floor": 1.0})
+    for _ in range(5):
+        first.latency_history.record("GetUserProfile", 1.0)
+    first.latency_history.flush()
+    second = make_client(server.base_url, timeouts={"min_samples": 5, "floor": 1.0})
+    assert second.get_timeouts("GetUserProfile")[1] == 3.0
+
+
+def test_slow_response_fails_with_a_read_timeout(make_client):
+    with MockAzureServer(latency=1.0) as server:
+        client = make_client(server.base_url, timeouts={"read": 0.2}, retry={"max_attempts": 1})
+        result = client.get_profile()
+    assert not result["success"]
+    assert result["timeout"] == "read"
+
+
+def test_per_endpoint_override(make_client, server):
+    client = make_client(server.base_url, timeouts={"endpoints": {"GetUsageStatistics": {"read": 12}}})
+    assert client.get_timeouts("GetUsageStatistics")[1] == 12
@@ -0,0 +1,56 @@
+"""Rollup local das estatísticas de utilização, reconciliado com GetUsageStatistics."""
+
+import manai
+
+STATS = "GetUsageStatistics"
+
+# Estatísticas do servidor de teste: 6+5+4+3+2+1 consultas nos dias anteriores, mais as de hoje
+PREVIOUS_DAYS = 21
+
+
+def test_first_call_syncs_and_later_calls_are_local(make_client, server):
+    client = make_client(server.base_url)
+    stats = client.usage_statistics()
+    assert stats["totalQueries"] == PREVIOUS_DAYS
+    assert stats["dailyStatistics"][1]["queriesCount"] == 6
+    assert not stats["stale"]
+
+    client.usage_statistics()
+    assert server.state.snapshot()["byEndpoint"][STATS] == 1
+
+
+def test_answers_update_today_without_a_request(make_client, server):
+    client = make_client(server.base_url)
+    client.usage_statistics()
+    result = client.ask_question("como listar ficheiros?", use_session=False, use_cache=False)
+    assert result["success"]
+
+    stats = client.usage_statistics()
+    assert stats["dailyStatistics"][0]["queriesCount"] == 1
+    assert stats["totalQueries"] == PREVIOUS_DAYS + 1
+    assert server.state.snapshot()["byEndpoint"][STATS] == 1
+
+
+def test_refresh_only_asks_for_the_days_since_the_last_sync(make_client, server, monkeypatch):
+    client = make_client(server.base_url)
+    client.usage_statistics()
+    requests = []
+    send = manai.ManaiFreemiumAzureClient._send_request
+
+    def spy(self, endpoint, method, data, *args):
+        requests.append(args[2])  # params
+        return send(self, endpoint, method, data, *args)
+    monkeypatch.setattr(manai.ManaiFreemiumAzureClient, "_send_request", spy)
+
+    stats = client.usage_statistics(refresh=True)
+    assert requests == [{"since": stats["dailyStatistics"][0]["date"]}]
+    assert stats["totalQueries"] == PREVIOUS_DAYS
+
+
+def test_stale_rollup_is_served_when_the_server_is_down(make_client, server):
+    client = make_client(server.base_url, retry={"max_attempts": 1})
+    client.usage_statistics()
+    server.state.error_rate = 1.0
+    stats = client.usage_statistics(refresh=True)
+    assert stats["stale"]
+    assert stats["totalQueries"] == PREVIOUS_DAYS